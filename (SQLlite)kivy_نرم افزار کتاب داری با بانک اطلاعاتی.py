@@ -1,115 +1,51 @@
-import sqlite3
 import kivy
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.popup import Popup
 from kivy.uix.spinner import Spinner
 from kivy.uix.numberinput import Spinner
 from kivy.uix.floatlayout import FloatLayout
+import isbn
+from bookstore_db import PROMOTION_CHECK_SECONDS
+from db_worker import DatabaseWorker
+from kivy_views import BookRecycleView, DatabaseBookSource, ResultBookSource, post_to_ui
+from live_search import LiveSearch
 
 kivy.require('2.1.0')  # make sure the kivy version is 2.1.0 or newer
 
-# Database Helper Class
-class Database:
-    def __init__(self):
-        self.connection = sqlite3.connect("bookstore.db")
-        self.cursor = self.connection.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        # Create table for books and sales if they do not exist
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                price REAL NOT NULL,
-                stock INTEGER NOT NULL,
-                sold INTEGER DEFAULT 0,
-                discount REAL DEFAULT 0
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER,
-                quantity INTEGER,
-                total_price REAL,
-                FOREIGN KEY(book_id) REFERENCES books(id)
-            )
-        ''')
-        self.connection.commit()
-
-    def insert_book(self, title, author, price, stock):
-        self.cursor.execute('''
-            INSERT INTO books (title, author, price, stock)
-            VALUES (?, ?, ?, ?)
-        ''', (title, author, price, stock))
-        self.connection.commit()
-
-    def get_books(self, start, limit):
-        self.cursor.execute('''
-            SELECT * FROM books LIMIT ? OFFSET ?
-        ''', (limit, start))
-        return self.cursor.fetchall()
-
-    def update_book(self, book_id, title, author, price, stock, discount):
-        self.cursor.execute('''
-            UPDATE books SET title=?, author=?, price=?, stock=?, discount=? WHERE id=?
-        ''', (title, author, price, stock, discount, book_id))
-        self.connection.commit()
-
-    def delete_book(self, book_id):
-        self.cursor.execute('''
-            DELETE FROM books WHERE id=?
-        ''', (book_id,))
-        self.connection.commit()
-
-    def get_book_by_title(self, title):
-        self.cursor.execute('''
-            SELECT * FROM books WHERE title LIKE ?
-        ''', ('%' + title + '%',))
-        return self.cursor.fetchall()
-
-    def record_sale(self, book_id, quantity, total_price):
-        self.cursor.execute('''
-            INSERT INTO sales (book_id, quantity, total_price)
-            VALUES (?, ?, ?)
-        ''', (book_id, quantity, total_price))
-        self.connection.commit()
-
-    def get_sales_report(self):
-        self.cursor.execute('''
-            SELECT SUM(quantity), SUM(total_price) FROM sales
-        ''')
-        return self.cursor.fetchone()
-
-    def close(self):
-        self.connection.close()
+
+def sell_by_title(db, title, quantity):
+    """Find a book by title or scanned ISBN and sell it in one worker call; returns None if no book matched."""
+    books = db.get_book_by_isbn(title) if isbn.looks_like(title) else db.get_book_by_title(title)
+    if not books:
+        return None
+    db.checkout([(books[0][0], quantity)])
+    return books[0]
 
 
 # Main Kivy Application Class
 class BookstoreApp(App):
     def build(self):
-        self.db = Database()
-        self.items_per_page = 5
-        self.current_page = 0
+        # Every database call runs on the worker thread; results come back through the Kivy clock
+        self.worker = DatabaseWorker(post_to_ui)
 
         # Layout for the UI
         self.layout = BoxLayout(orientation="vertical")
-        self.scroll_view = ScrollView()
-        self.grid_layout = GridLayout(cols=1, size_hint_y=None)
-        self.grid_layout.bind(minimum_height=self.grid_layout.setter('height'))
 
-        self.load_books()
+        # Live search: the list follows the text as it is typed
+        self.live_search = LiveSearch(self.worker, lambda delay_ms, callback: Clock.schedule_once(
+            lambda dt: callback(), delay_ms / 1000), lambda event: event.cancel(), self.show_search_results,
+            self.show_error)
+        self.search_input = TextInput(hint_text="جستجوی عنوان یا نویسنده", multiline=False, size_hint_y=None, height=40)
+        self.search_input.bind(text=lambda instance, text: self.live_search.text_changed(text))
+        self.layout.add_widget(self.search_input)
 
-        self.scroll_view.add_widget(self.grid_layout)
-        self.layout.add_widget(self.scroll_view)
+        self.book_view = BookRecycleView(DatabaseBookSource(self.worker))
+        self.layout.add_widget(self.book_view)
 
         # Adding buttons
         self.add_book_button = Button(text="اضافه کردن کتاب", on_press=self.add_book)
@@ -118,20 +54,31 @@ class BookstoreApp(App):
         self.sell_button = Button(text="فروش کتاب", on_press=self.sell_book)
         self.layout.add_widget(self.sell_button)
 
-        self.search_button = Button(text="جستجوی کتاب", on_press=self.search_books)
-        self.layout.add_widget(self.search_button)
+        self.report_button = Button(text="گزارش فروش", on_press=self.show_sales_report)
+        self.layout.add_widget(self.report_button)
+
+        # Start and end scheduled discount campaigns while the app is open
+        self.refresh_promotions()
+        Clock.schedule_interval(lambda dt: self.refresh_promotions(), PROMOTION_CHECK_SECONDS)
 
         return self.layout
 
+    def refresh_promotions(self):
+        self.worker.submit("refresh_promotions", on_done=self.promotions_refreshed, on_error=self.show_error)
+
+    def promotions_refreshed(self, changed):
+        started, ended = changed
+        if started or ended:
+            # The discounted prices on screen changed
+            self.load_books()
+
     def load_books(self):
-        """Load books from the database and display them"""
-        self.grid_layout.clear_widgets()
-        start = self.current_page * self.items_per_page
-        books_data = self.db.get_books(start, self.items_per_page)
-        for book_data in books_data:
-            book_info = f"عنوان: {book_data[1]}, نویسنده: {book_data[2]}, قیمت: {book_data[3]}, موجودی: {book_data[4]}"
-            book_label = Label(text=book_info)
-            self.grid_layout.add_widget(book_label)
+        """Re-read the books currently shown, e.g. after a sale or a new book"""
+        if self.search_input.text.strip():
+            # Search results are a fixed list; search again for fresh ones
+            self.live_search.run(self.search_input.text)
+        else:
+            self.book_view.refresh()
 
     def add_book(self, instance):
         # Open a popup to add a book
@@ -160,7 +107,8 @@ class BookstoreApp(App):
             price = float(self.price_input.text)
             stock = int(self.stock_input.text)
             if title and author:
-                self.db.insert_book(title, author, price, stock)
+                # Calls run in order, so load_books sees the new book
+                self.worker.submit("add_book", title, author, price, stock, on_error=self.show_error)
                 self.popup.dismiss()
                 self.load_books()
             else:
@@ -169,33 +117,68 @@ class BookstoreApp(App):
             self.show_popup_message("ورودی نامعتبر", "لطفا قیمت و موجودی را به درستی وارد کنید.")
 
     def sell_book(self, instance):
-        # Simulate selling a book (we can improve it with specific UI)
+        # Popup for selling a book
+        self.sell_popup_layout = FloatLayout()
+        self.sell_title_input = TextInput(hint_text="عنوان یا شابک کتاب برای فروش", size_hint=(0.8, None), height=30, pos_hint={'x': 0.1, 'top': 0.9})
+        self.sell_quantity_input = TextInput(hint_text="تعداد", input_filter='int', size_hint=(0.8, None), height=30, pos_hint={'x': 0.1, 'top': 0.75})
+
+        self.confirm_sell_button = Button(text="فروش", size_hint=(0.8, None), height=40, pos_hint={'x': 0.1, 'top': 0.5})
+        self.confirm_sell_button.bind(on_press=self.confirm_sale)
+
+        self.sell_popup_layout.add_widget(self.sell_title_input)
+        self.sell_popup_layout.add_widget(self.sell_quantity_input)
+        self.sell_popup_layout.add_widget(self.confirm_sell_button)
+
+        self.sell_popup = Popup(title="فروش کتاب", content=self.sell_popup_layout, size_hint=(0.6, 0.6))
+        self.sell_popup.open()
+
+    def confirm_sale(self, instance):
+        title = self.sell_title_input.text
+        if not title:
+            self.show_popup_message("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            return
+        try:
+            quantity = int(self.sell_quantity_input.text)
+        except ValueError:
+            self.show_popup_message("ورودی نامعتبر", "لطفا تعداد را به درستی وارد کنید.")
+            return
+        self.worker.submit(sell_by_title, title, quantity,
+                           on_done=lambda book: self.sale_done(title, book), on_error=self.show_error)
+
+    def sale_done(self, title, book):
+        if book is None:
+            self.show_popup_message("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            return
+        self.sell_popup.dismiss()
+        self.load_books()
         self.show_popup_message("فروش کتاب", "کتاب با موفقیت فروخته شد.")
 
-    def search_books(self, instance):
-        # Popup for searching books
-        self.search_popup_layout = FloatLayout()
-        self.search_input = TextInput(hint_text="عنوان کتاب برای جستجو", size_hint=(0.8, None), height=30, pos_hint={'x': 0.1, 'top': 0.9})
-
-        self.search_button = Button(text="جستجو", size_hint=(0.8, None), height=40, pos_hint={'x': 0.1, 'top': 0.7})
-        self.search_button.bind(on_press=self.search_books_in_db)
-
-        self.search_popup_layout.add_widget(self.search_input)
-        self.search_popup_layout.add_widget(self.search_button)
-
-        self.search_popup = Popup(title="جستجوی کتاب", content=self.search_popup_layout, size_hint=(0.6, 0.6))
-        self.search_popup.open()
-
-    def search_books_in_db(self, instance):
-        title = self.search_input.text
-        if title:
-            books = self.db.get_book_by_title(title)
-            self.grid_layout.clear_widgets()
-            for book_data in books:
-                book_info = f"عنوان: {book_data[1]}, نویسنده: {book_data[2]}, قیمت: {book_data[3]}, موجودی: {book_data[4]}"
-                book_label = Label(text=book_info)
-                self.grid_layout.add_widget(book_label)
-            self.search_popup.dismiss()
+    def show_sales_report(self, instance):
+        self.worker.submit("get_sales_report", on_done=self.show_sales_report_result, on_error=self.show_error)
+
+    def show_sales_report_result(self, result):
+        total_sales, today, top_books, top_authors, last_30_days = result
+        total_quantity, total_price = total_sales or (0, 0)
+        if not total_quantity:
+            self.show_popup_message("گزارش فروش", "هیچ فروشی ثبت نشده است.")
+            return
+        report = f"مجموع فروش: {total_quantity} کتاب\nمجموع درآمد: {total_price} تومان"
+        if today:
+            report += f"\nفروش امروز: {today[0][1]} کتاب، {today[0][2]} تومان"
+        report += f"\nفروش ۳۰ روز گذشته: {last_30_days[0]} کتاب، {last_30_days[1]} تومان"
+        for book_id, title, quantity, revenue in top_books:
+            report += f"\n{title or book_id}: {quantity} کتاب"
+        self.show_popup_message("گزارش فروش", report)
+
+    def show_search_results(self, books):
+        if books is None:
+            # The search box was cleared
+            self.book_view.set_source(DatabaseBookSource(self.worker))
+        else:
+            self.book_view.set_source(ResultBookSource(books))
+
+    def show_error(self, error):
+        self.show_popup_message("خطا", str(error))
 
     def show_popup_message(self, title, message):
         popup_layout = BoxLayout(orientation='vertical', padding=10)
@@ -209,7 +192,7 @@ class BookstoreApp(App):
         popup.open()
 
     def on_stop(self):
-        self.db.close()
+        self.worker.close()
 
 # Run the application
 if __name__ == "__main__":
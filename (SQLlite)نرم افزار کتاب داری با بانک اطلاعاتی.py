@@ -1,66 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-import sqlite3
-
-class BookstoreDatabase:
-    def __init__(self):
-        self.connection = sqlite3.connect("bookstore.db")
-        self.cursor = self.connection.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        # Create books table if it doesn't exist
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS books (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                title TEXT,
-                                author TEXT,
-                                price REAL,
-                                stock INTEGER,
-                                sold INTEGER DEFAULT 0,
-                                discount REAL DEFAULT 0)''')
-        # Create sales table if it doesn't exist
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS sales (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                book_id INTEGER,
-                                quantity INTEGER,
-                                total_price REAL,
-                                FOREIGN KEY(book_id) REFERENCES books(id))''')
-        self.connection.commit()
-
-    def add_book(self, title, author, price, stock):
-        self.cursor.execute('''INSERT INTO books (title, author, price, stock) 
-                               VALUES (?, ?, ?, ?)''', (title, author, price, stock))
-        self.connection.commit()
-
-    def get_books(self, start, limit):
-        self.cursor.execute('''SELECT * FROM books LIMIT ? OFFSET ?''', (limit, start))
-        return self.cursor.fetchall()
-
-    def get_book_by_title(self, title):
-        self.cursor.execute('''SELECT * FROM books WHERE title LIKE ?''', ('%' + title + '%',))
-        return self.cursor.fetchall()
-
-    def update_book(self, book_id, title, author, price, stock):
-        self.cursor.execute('''UPDATE books SET title = ?, author = ?, price = ?, stock = ? WHERE id = ?''', 
-                            (title, author, price, stock, book_id))
-        self.connection.commit()
-
-    def delete_book(self, book_id):
-        self.cursor.execute('''DELETE FROM books WHERE id = ?''', (book_id,))
-        self.connection.commit()
-
-    def record_sale(self, book_id, quantity, total_price):
-        self.cursor.execute('''INSERT INTO sales (book_id, quantity, total_price) 
-                               VALUES (?, ?, ?)''', (book_id, quantity, total_price))
-        self.connection.commit()
-
-    def get_total_sales(self):
-        self.cursor.execute('''SELECT SUM(quantity), SUM(total_price) FROM sales''')
-        return self.cursor.fetchone()
-
-    def apply_discount(self, book_id, discount_percentage):
-        self.cursor.execute('''UPDATE books SET discount = ? WHERE id = ?''', (discount_percentage, book_id))
-        self.connection.commit()
+import isbn
+from bookstore_db import PROMOTION_CHECK_SECONDS
+from db_worker import DatabaseWorker, TkDispatcher
+from live_search import LiveSearch
+from tk_views import BookTable
+
+
+def fetch_page(db, cursor, limit, backward):
+    """Fetch a page on the worker; falls back to the first page if it ran off either end."""
+    books, first, last = db.get_books_page(cursor, limit, backward=backward)
+    if cursor is not None and (not books or (backward and len(books) < limit)):
+        books, first, last = db.get_books_page(None, limit)
+        return books, first, last, True
+    return books, first, last, False
+
 
 class BookstoreGUI:
     def __init__(self, root):
@@ -68,9 +22,14 @@ class BookstoreGUI:
         self.root.title("مدیریت کتاب‌فروشی")
         self.root.geometry("800x600")
 
-        self.db = BookstoreDatabase()
+        # Every database call runs on the worker thread; results come back through root.after
+        self.worker = DatabaseWorker(TkDispatcher(root).post)
         self.items_per_page = 5
-        self.current_page = 0
+        # Keyset paging state: the cursor the current page was fetched from
+        self.page_cursor = None
+        self.page_backward = False
+        self.first_cursor = None
+        self.last_cursor = None
 
         # Table (Treeview) setup for displaying books
         self.table = ttk.Treeview(root, columns=("Title", "Author", "Price", "Stock", "Discounted Price"), show="headings")
@@ -80,6 +39,7 @@ class BookstoreGUI:
         self.table.heading("Stock", text="تعداد موجود")
         self.table.heading("Discounted Price", text="قیمت با تخفیف")
         self.table.grid(row=0, column=0, columnspan=4, padx=10, pady=10, sticky="nsew")
+        self.book_table = BookTable(self.table)
 
         # Form for adding a new book
         self.title_entry = ttk.Entry(root)
@@ -104,29 +64,79 @@ class BookstoreGUI:
 
         # Additional buttons
         self.sell_button = ttk.Button(root, text="فروش کتاب", command=self.sell_book)
-        self.search_button = ttk.Button(root, text="جستجوی کتاب", command=self.search_books_button)
         self.report_button = ttk.Button(root, text="گزارش فروش", command=self.show_sales_report)
         self.discount_button = ttk.Button(root, text="اعمال تخفیف", command=self.apply_discount)
         self.edit_button = ttk.Button(root, text="ویرایش کتاب", command=self.edit_book)
         self.delete_button = ttk.Button(root, text="حذف کتاب", command=self.delete_book)
         self.sell_button.grid(row=5, column=0, pady=5)
-        self.search_button.grid(row=5, column=1, pady=5)
         self.report_button.grid(row=5, column=2, pady=5)
         self.discount_button.grid(row=5, column=3, pady=5)
         self.edit_button.grid(row=6, column=0, pady=5)
         self.delete_button.grid(row=6, column=1, pady=5)
 
+        # Live search: results follow the text as it is typed
+        # Searches and page loads fill the same table, so a newer one cancels the other
+        self.live_search = LiveSearch(self.worker, root.after, root.after_cancel, self.show_search_results,
+                                      self.show_error, key="page")
+        self.search_text = tk.StringVar()
+        self.search_text.trace_add("write", lambda *args: self.live_search.text_changed(self.search_text.get()))
+        ttk.Label(root, text="جستجو:").grid(row=7, column=0, padx=5, pady=5, sticky="e")
+        ttk.Entry(root, textvariable=self.search_text).grid(row=7, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
+
         self.load_books()
+        self.refresh_promotions()
+
+    def refresh_promotions(self):
+        """Start and end scheduled discount campaigns, then check again in PROMOTION_CHECK_SECONDS."""
+        self.worker.submit("refresh_promotions", on_done=self.promotions_refreshed, on_error=self.show_error)
+        self.root.after(PROMOTION_CHECK_SECONDS * 1000, self.refresh_promotions)
+
+    def promotions_refreshed(self, changed):
+        started, ended = changed
+        if started or ended:
+            # The discounted prices on screen changed
+            self.load_books()
 
     def load_books(self):
-        """Load books for the current page from the database."""
-        self.table.delete(*self.table.get_children())
-        start = self.current_page * self.items_per_page
-        books = self.db.get_books(start, self.items_per_page)
+        """Load books for the current page from the database, or the search results while searching."""
+        if self.search_text.get().strip():
+            self.live_search.run(self.search_text.get())
+            return
+        self.worker.submit(fetch_page, self.page_cursor, self.items_per_page, self.page_backward,
+                           on_done=self.show_loaded_page, on_error=self.show_error, key="page")
+
+    def show_loaded_page(self, result):
+        books, first, last, fell_back = result
+        if fell_back:
+            # The page ran off either end of the catalog
+            self.page_cursor, self.page_backward = None, False
+        self.show_page(books, first, last)
+
+    def show_page(self, books, first, last):
+        """Display a page of books and remember its boundary cursors."""
+        self.first_cursor, self.last_cursor = first, last
+        self.show_books(books)
+
+    def show_books(self, books):
+        rows = []
         for book in books:
             title, author, price, stock, sold, discount = book[1], book[2], book[3], book[4], book[5], book[6]
             discounted_price = price * (1 - discount / 100)
-            self.table.insert("", "end", values=(title, author, price, stock, discounted_price))
+            rows.append((book[0], (title, author, price, stock, discounted_price)))
+        self.book_table.show(rows)
+
+    def show_error(self, error):
+        messagebox.showerror("خطا", str(error))
+
+    def find_book(self, title, action):
+        """Look a title (or a scanned ISBN) up on the worker and call action with the first match."""
+        def found(books):
+            if books:
+                action(books[0])  # Assuming we only get one book with that title
+            else:
+                messagebox.showinfo("اطلاع", f"کتاب '{title}' پیدا نشد.")
+        lookup = "get_book_by_isbn" if isbn.looks_like(title) else "get_book_by_title"
+        self.worker.submit(lookup, title, on_done=found, on_error=self.show_error)
 
     def add_book(self):
         title = self.title_entry.get()
@@ -135,7 +145,8 @@ class BookstoreGUI:
             price = float(self.price_entry.get())
             stock = int(self.stock_entry.get())
             if title and author:
-                self.db.add_book(title, author, price, stock)
+                # Calls run in order, so load_books sees the new book
+                self.worker.submit("add_book", title, author, price, stock, on_error=self.show_error)
                 self.title_entry.delete(0, tk.END)
                 self.author_entry.delete(0, tk.END)
                 self.price_entry.delete(0, tk.END)
@@ -147,90 +158,101 @@ class BookstoreGUI:
             messagebox.showwarning("ورودی نامعتبر", "قیمت یا موجودی معتبر وارد کنید.")
 
     def sell_book(self):
-        title = simpledialog.askstring("فروش کتاب", "عنوان کتاب برای فروش را وارد کنید:")
+        title = simpledialog.askstring("فروش کتاب", "عنوان یا شابک کتاب برای فروش را وارد کنید:")
         if title:
-            books = self.db.get_book_by_title(title)
-            if books:
-                book = books[0]  # Assuming we only get one book with that title
-                quantity = simpledialog.askinteger("فروش کتاب", f"تعداد را برای فروش {book[1]} وارد کنید:")
-                if quantity:
-                    try:
-                        total_price = book[3] * quantity * (1 - book[6] / 100)  # Price with discount
-                        self.db.record_sale(book[0], quantity, total_price)
-                        self.load_books()
-                    except ValueError as e:
-                        messagebox.showerror("خطا", str(e))
-            else:
-                messagebox.showinfo("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            self.find_book(title, self.sell_found_book)
+
+    def sell_found_book(self, book):
+        quantity = simpledialog.askinteger("فروش کتاب", f"تعداد را برای فروش {book[1]} وارد کنید:")
+        if quantity:
+            self.worker.submit("checkout", [(book[0], quantity)],
+                               on_done=lambda sales: self.load_books(), on_error=self.show_error)
 
     def apply_discount(self):
         title = simpledialog.askstring("اعمال تخفیف", "عنوان کتاب را برای تخفیف وارد کنید:")
         if title:
-            books = self.db.get_book_by_title(title)
-            if books:
-                book = books[0]  # Assuming we only get one book with that title
-                discount_percentage = simpledialog.askfloat("اعمال تخفیف", f"درصد تخفیف برای {book[1]} وارد کنید:")
-                if discount_percentage is not None:
-                    self.db.apply_discount(book[0], discount_percentage)
-                    self.load_books()
-            else:
-                messagebox.showinfo("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            self.find_book(title, self.discount_found_book)
+
+    def discount_found_book(self, book):
+        discount_percentage = simpledialog.askfloat("اعمال تخفیف", f"درصد تخفیف برای {book[1]} وارد کنید:")
+        if discount_percentage is not None:
+            # book[7] is the version it was read with; a change made meanwhile at another register wins
+            self.worker.submit("apply_discount", book[0], discount_percentage, version=book[7], on_error=self.show_error)
+            self.load_books()
 
     def edit_book(self):
         title = simpledialog.askstring("ویرایش کتاب", "عنوان کتاب را برای ویرایش وارد کنید:")
         if title:
-            books = self.db.get_book_by_title(title)
-            if books:
-                book = books[0]  # Assuming we only get one book with that title
-                new_title = simpledialog.askstring("ویرایش کتاب", "عنوان جدید را وارد کنید:", initialvalue=book[1])
-                new_author = simpledialog.askstring("ویرایش کتاب", "نویسنده جدید را وارد کنید:", initialvalue=book[2])
-                new_price = simpledialog.askfloat("ویرایش کتاب", "قیمت جدید را وارد کنید:", initialvalue=book[3])
-                new_stock = simpledialog.askinteger("ویرایش کتاب", "موجودی جدید را وارد کنید:", initialvalue=book[4])
-                if new_title and new_author and new_price is not None and new_stock is not None:
-                    self.db.update_book(book[0], new_title, new_author, new_price, new_stock)
-                    self.load_books()
-            else:
-                messagebox.showinfo("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            self.find_book(title, self.edit_found_book)
+
+    def edit_found_book(self, book):
+        new_title = simpledialog.askstring("ویرایش کتاب", "عنوان جدید را وارد کنید:", initialvalue=book[1])
+        new_author = simpledialog.askstring("ویرایش کتاب", "نویسنده جدید را وارد کنید:", initialvalue=book[2])
+        new_price = simpledialog.askfloat("ویرایش کتاب", "قیمت جدید را وارد کنید:", initialvalue=book[3])
+        new_stock = simpledialog.askinteger("ویرایش کتاب", "موجودی جدید را وارد کنید:", initialvalue=book[4])
+        if new_title and new_author and new_price is not None and new_stock is not None:
+            self.worker.submit("update_book", book[0], new_title, new_author, new_price, new_stock, version=book[7],
+                               on_error=self.show_error)
+            self.load_books()
 
     def delete_book(self):
         title = simpledialog.askstring("حذف کتاب", "عنوان کتاب را برای حذف وارد کنید:")
         if title:
-            books = self.db.get_book_by_title(title)
-            if books:
-                book = books[0]
-                self.db.delete_book(book[0])
-                self.load_books()
-            else:
-                messagebox.showinfo("اطلاع", f"کتاب '{title}' پیدا نشد.")
+            self.find_book(title, self.delete_found_book)
+
+    def delete_found_book(self, book):
+        self.worker.submit("delete_book", book[0], on_error=self.show_error)
+        self.load_books()
 
     def show_sales_report(self):
-        total_sales = self.db.get_total_sales()
-        if total_sales:
+        self.worker.submit("get_sales_report", on_done=self.show_sales_report_result, on_error=self.show_error)
+
+    def show_sales_report_result(self, result):
+        total_sales, today, top_books, top_authors, last_30_days = result
+        if total_sales and total_sales[0]:
             total_quantity, total_price = total_sales
-            messagebox.showinfo("گزارش فروش", f"مجموع فروش: {total_quantity} کتاب\nمجموع درآمد: {total_price} تومان")
+            report = f"مجموع فروش: {total_quantity} کتاب\nمجموع درآمد: {total_price} تومان"
+            if today:
+                report += f"\nفروش امروز: {today[0][1]} کتاب، {today[0][2]} تومان"
+            report += f"\nفروش ۳۰ روز گذشته: {last_30_days[0]} کتاب، {last_30_days[1]} تومان"
+            report += "\n\nپرفروش‌ترین کتاب‌ها:"
+            for book_id, title, quantity, revenue in top_books:
+                report += f"\n{title or book_id}: {quantity} کتاب، {revenue} تومان"
+            report += "\n\nپرفروش‌ترین نویسندگان:"
+            for author, quantity, revenue in top_authors:
+                report += f"\n{author}: {quantity} کتاب، {revenue} تومان"
+            messagebox.showinfo("گزارش فروش", report)
         else:
             messagebox.showinfo("گزارش فروش", "هیچ فروشی ثبت نشده است.")
 
-    def search_books_button(self):
-        title = simpledialog.askstring("جستجوی کتاب", "عنوان کتاب را وارد کنید:")
-        if title:
-            books = self.db.get_book_by_title(title)
-            self.table.delete(*self.table.get_children())
-            for book in books:
-                title, author, price, stock, sold, discount = book[1], book[2], book[3], book[4], book[5], book[6]
-                discounted_price = price * (1 - discount / 100)
-                self.table.insert("", "end", values=(title, author, price, stock, discounted_price))
+    def show_search_results(self, books):
+        if books is None:
+            # The search box was cleared
+            self.load_books()
+            return
+        self.show_books(books)
 
     def prev_page(self):
-        if self.current_page > 0:
-            self.current_page -= 1
-            self.load_books()
+        if self.first_cursor is not None:
+            self.turn_page(self.first_cursor, True)
 
     def next_page(self):
-        self.current_page += 1
-        self.load_books()
+        if self.last_cursor is not None:
+            self.turn_page(self.last_cursor, False)
+
+    def turn_page(self, cursor, backward):
+        def show(result):
+            books, first, last = result
+            if books:
+                self.page_cursor, self.page_backward = cursor, backward
+                self.show_page(books, first, last)
+        self.worker.submit("get_books_page", cursor, self.items_per_page, backward=backward,
+                           on_done=show, on_error=self.show_error, key="page")
 
 # Create the Tkinter window
-root = tk.Tk()
-bookstore_gui = BookstoreGUI(root)
-root.mainloop()
+if __name__ == "__main__":
+    root = tk.Tk()
+    bookstore_gui = BookstoreGUI(root)
+    root.mainloop()
+    bookstore_gui.worker.close()
+
@@ -1,48 +1,9 @@
-import sqlite3
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, QTableWidget, QTableWidgetItem, QHBoxLayout, QDialog, QFormLayout
-
-# Database Helper Class
-class Database:
-    def __init__(self):
-        self.connection = sqlite3.connect("bookstore.db")
-        self.cursor = self.connection.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        # Create books table if not exists
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                price REAL NOT NULL,
-                stock INTEGER NOT NULL,
-                sold INTEGER DEFAULT 0,
-                discount REAL DEFAULT 0
-            )
-        ''')
-        self.connection.commit()
-
-    def insert_book(self, title, author, price, stock):
-        self.cursor.execute('''
-            INSERT INTO books (title, author, price, stock)
-            VALUES (?, ?, ?, ?)
-        ''', (title, author, price, stock))
-        self.connection.commit()
-
-    def get_books(self):
-        self.cursor.execute('SELECT * FROM books')
-        return self.cursor.fetchall()
-
-    def get_book_by_title(self, title):
-        self.cursor.execute('''
-            SELECT * FROM books WHERE title LIKE ?
-        ''', ('%' + title + '%',))
-        return self.cursor.fetchall()
-
-    def close(self):
-        self.connection.close()
-
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, QTableView, QHBoxLayout, QDialog, QFormLayout, QMessageBox
+from bookstore_db import PROMOTION_CHECK_SECONDS
+from db_worker import DatabaseWorker
+from live_search import LiveSearch
+from qt_models import BookTableModel, SearchResultModel, UiDispatcher
 
 class AddBookDialog(QDialog):
     def __init__(self, parent=None):
@@ -76,7 +37,9 @@ class AddBookDialog(QDialog):
             price = float(self.price_input.text())
             stock = int(self.stock_input.text())
             if title and author:
-                db.insert_book(title, author, price, stock)
+                # Calls run in order, so the refresh after accept() sees the new book
+                worker.submit("add_book", title, author, price, stock,
+                              on_error=lambda e: QMessageBox.warning(None, "خطا", str(e)))
                 self.accept()
             else:
                 self.show_message("لطفا تمامی فیلدها را پر کنید.")
@@ -101,47 +64,87 @@ class BookstoreApp(QWidget):
         self.search_button = QPushButton("جستجو کردن کتاب", self)
         self.show_books_button = QPushButton("نمایش کتاب‌ها", self)
 
+        self.search_input = QLineEdit(self)
+        self.search_input.setPlaceholderText("عنوان یا نویسنده")
+
         self.layout.addWidget(self.add_book_button)
+        self.layout.addWidget(self.search_input)
         self.layout.addWidget(self.search_button)
         self.layout.addWidget(self.show_books_button)
 
-        # Table for displaying books
-        self.books_table = QTableWidget(self)
-        self.books_table.setRowCount(0)
-        self.books_table.setColumnCount(5)
-        self.books_table.setHorizontalHeaderLabels(["ID", "عنوان", "نویسنده", "قیمت", "موجودی"])
+        # Table for displaying books; the model pages rows in from the database as the view scrolls
+        self.books_model = BookTableModel(worker, self)
+        self.books_table = QTableView(self)
+        self.books_table.setModel(self.books_model)
+        self.books_table.setSortingEnabled(True)
         self.layout.addWidget(self.books_table)
 
+        # Live search: ranked results follow the text as it is typed
+        self.results_model = SearchResultModel(self)
+        self.live_search = LiveSearch(worker, self.start_timer, self.stop_timer, self.show_search_results,
+                                      lambda e: QMessageBox.warning(self, "خطا", str(e)))
+        self.search_input.textChanged.connect(self.live_search.text_changed)
+
         # Connect buttons to actions
         self.add_book_button.clicked.connect(self.open_add_book_dialog)
         self.search_button.clicked.connect(self.search_books)
         self.show_books_button.clicked.connect(self.show_books)
 
+        # Start and end scheduled discount campaigns while the window is open (the table shows no discounts,
+        # so nothing needs redrawing when one does)
+        self.promotion_timer = QTimer(self)
+        self.promotion_timer.timeout.connect(self.refresh_promotions)
+        self.promotion_timer.start(PROMOTION_CHECK_SECONDS * 1000)
+        self.refresh_promotions()
+
+    def refresh_promotions(self):
+        worker.submit("refresh_promotions", on_error=lambda e: QMessageBox.warning(self, "خطا", str(e)))
+
     def open_add_book_dialog(self):
         dialog = AddBookDialog(self)
-        dialog.exec_()
+        if dialog.exec_():
+            self.books_model.refresh()
+            if self.books_table.model() is self.results_model:
+                self.live_search.run(self.search_input.text())
 
     def show_books(self):
-        books = db.get_books()
-        self.books_table.setRowCount(len(books))
-        for row, book in enumerate(books):
-            for col, value in enumerate(book):
-                self.books_table.setItem(row, col, QTableWidgetItem(str(value)))
+        self.search_input.clear()
+        self.books_table.setModel(self.books_model)
+        self.books_model.set_filter(None)
 
     def search_books(self):
-        title = self.search_input.text()
-        books = db.get_book_by_title(title)
-        self.books_table.setRowCount(len(books))
-        for row, book in enumerate(books):
-            for col, value in enumerate(book):
-                self.books_table.setItem(row, col, QTableWidgetItem(str(value)))
+        # Every match, paged like the full list, rather than the top results shown while typing
+        self.books_table.setModel(self.books_model)
+        self.books_model.set_filter(self.search_input.text())
+
+    def start_timer(self, delay_ms, callback):
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(callback)
+        timer.timeout.connect(timer.deleteLater)
+        timer.start(delay_ms)
+        return timer
+
+    def stop_timer(self, timer):
+        timer.stop()
+        timer.deleteLater()
+
+    def show_search_results(self, books):
+        if books is None:
+            # The search box was cleared
+            self.books_table.setModel(self.books_model)
+        else:
+            self.results_model.set_books(books)
+            self.books_table.setModel(self.results_model)
 
 
 if __name__ == "__main__":
     app = QApplication([])
-    db = Database()  # Create database connection
+    # Every database call runs on the worker thread; results come back through a queued signal
+    dispatcher = UiDispatcher()
+    worker = DatabaseWorker(dispatcher.post)
     window = BookstoreApp()
     window.show()
     app.exec_()
 
-    db.close()
+    worker.close()
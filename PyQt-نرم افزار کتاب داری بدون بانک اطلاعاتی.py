@@ -1,33 +1,7 @@
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, QTableWidget, QTableWidgetItem, QHBoxLayout, QDialog, QFormLayout, QMessageBox
-
-class Book:
-    def __init__(self, title, author, price, stock):
-        self.title = title
-        self.author = author
-        self.price = price
-        self.stock = stock
-        self.sold = 0
-        self.discount = 0
-
-    def add_stock(self, quantity):
-        self.stock += quantity
-
-    def sell_book(self, quantity):
-        if self.stock >= quantity:
-            self.stock -= quantity
-            self.sold += quantity
-        else:
-            raise ValueError("موجودی کافی نیست.")
-
-    def apply_discount(self, discount_percentage):
-        self.discount = discount_percentage
-
-    def get_discounted_price(self):
-        return self.price * (1 - self.discount / 100)
-
-    def __str__(self):
-        return f"عنوان: {self.title}, نویسنده: {self.author}, قیمت: {self.price}, تخفیف: {self.discount}%, قیمت نهایی: {self.get_discounted_price()}, موجودی: {self.stock}, فروخته شده: {self.sold}"
-
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QLabel, QTableView, QHBoxLayout, QDialog, QFormLayout, QMessageBox
+from memory_catalog import Book
+from memory_store import MemoryStore
+from qt_models import BookListModel
 
 class AddBookDialog(QDialog):
     def __init__(self, parent=None):
@@ -82,22 +56,27 @@ class BookstoreApp(QWidget):
 
         self.layout = QVBoxLayout(self)
 
-        self.books = []  # لیست کتاب‌ها
+        self.store = MemoryStore()
+        self.books = self.store.catalog  # لیست کتاب‌ها
 
         # Buttons
         self.add_book_button = QPushButton("اضافه کردن کتاب", self)
         self.search_button = QPushButton("جستجو کردن کتاب", self)
         self.show_books_button = QPushButton("نمایش کتاب‌ها", self)
 
+        self.search_input = QLineEdit(self)
+        self.search_input.setPlaceholderText("عنوان کتاب")
+
         self.layout.addWidget(self.add_book_button)
+        self.layout.addWidget(self.search_input)
         self.layout.addWidget(self.search_button)
         self.layout.addWidget(self.show_books_button)
 
-        # Table for displaying books
-        self.books_table = QTableWidget(self)
-        self.books_table.setRowCount(0)
-        self.books_table.setColumnCount(5)
-        self.books_table.setHorizontalHeaderLabels(["ID", "عنوان", "نویسنده", "قیمت", "موجودی"])
+        # Table for displaying books; the model reads rows straight from self.books as the view scrolls
+        self.books_model = BookListModel(self.books, self)
+        self.books_table = QTableView(self)
+        self.books_table.setModel(self.books_model)
+        self.books_table.setSortingEnabled(True)
         self.layout.addWidget(self.books_table)
 
         # Connect buttons to actions
@@ -107,7 +86,7 @@ class BookstoreApp(QWidget):
 
     def add_book_to_list(self, book):
         """کتاب جدید به لیست اضافه می‌شود"""
-        self.books.append(book)
+        self.store.add_book(book)
         self.show_books()
 
     def open_add_book_dialog(self):
@@ -115,24 +94,11 @@ class BookstoreApp(QWidget):
         dialog.exec_()
 
     def show_books(self):
-        self.books_table.setRowCount(len(self.books))
-        for row, book in enumerate(self.books):
-            self.books_table.setItem(row, 0, QTableWidgetItem(str(row + 1)))  # ID
-            self.books_table.setItem(row, 1, QTableWidgetItem(book.title))
-            self.books_table.setItem(row, 2, QTableWidgetItem(book.author))
-            self.books_table.setItem(row, 3, QTableWidgetItem(str(book.price)))
-            self.books_table.setItem(row, 4, QTableWidgetItem(str(book.stock)))
+        self.search_input.clear()
+        self.books_model.set_filter("")
 
     def search_books(self):
-        title = self.search_input.text()
-        results = [book for book in self.books if title.lower() in book.title.lower()]
-        self.books_table.setRowCount(len(results))
-        for row, book in enumerate(results):
-            self.books_table.setItem(row, 0, QTableWidgetItem(str(row + 1)))  # ID
-            self.books_table.setItem(row, 1, QTableWidgetItem(book.title))
-            self.books_table.setItem(row, 2, QTableWidgetItem(book.author))
-            self.books_table.setItem(row, 3, QTableWidgetItem(str(book.price)))
-            self.books_table.setItem(row, 4, QTableWidgetItem(str(book.stock)))
+        self.books_model.set_filter(self.search_input.text())
 
 
 if __name__ == "__main__":
@@ -140,3 +106,4 @@ if __name__ == "__main__":
     window = BookstoreApp()
     window.show()
     app.exec_()
+    window.store.close()
@@ -0,0 +1,382 @@
+"""HTTP/JSON API over bookstore.db, so the web shop and the tills share one catalog.
+
+Usage:
+    python api_server.py [--db bookstore.db] [--host 127.0.0.1] [--port 8080] [--readers 4]
+
+Endpoints (request and response bodies are JSON):
+    GET    /books?sort=title&descending=1&limit=50&cursor=...&search=...
+    GET    /books/<id>
+    POST   /books                  {"title", "author", "price", "stock", "isbn"?}
+    PUT    /books/<id>             {"title", "author", "price", "stock", "version"?}
+    DELETE /books/<id>
+    POST   /books/<id>/discount    {"discount", "version"?}
+    GET    /search?q=...&limit=50
+    POST   /sales                  {"items": [[book_id, quantity], ...]}
+    GET    /report?top=3&days=30
+    GET    /promotions
+    POST   /promotions             {"name", "discount", "starts_at"?, "ends_at"?, "author"?, "min_price"?,
+                                    "max_price"?, "min_stock"?, "max_stock"?, "book_ids"?}
+    DELETE /promotions/<id>
+
+Every request runs on its own thread. Reads borrow a connection from a small
+pool (WAL lets them run while a write is in progress); every write goes
+through one DatabaseWorker, so writers never wait on each other for the
+lock. Sales that arrive while the writer is busy are committed together in
+a single transaction. Scheduled discount campaigns are started and ended
+between requests, every PROMOTION_CHECK_SECONDS.
+"""
+import argparse
+import json
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bookstore_db import PROMOTION_CHECK_SECONDS, BookstoreDatabase, ConflictError, InsufficientStockError
+from db_worker import DatabaseWorker
+from live_search import CANDIDATES
+
+READERS = 4
+PAGE_LIMIT = 50
+MAX_LIMIT = 500
+# The longest period /report sums over
+MAX_DAYS = 3660
+# Names of the BOOK_COLUMNS values, as the keys of a book in a response
+BOOK_FIELDS = ("id", "title", "author", "price", "stock", "sold", "discount", "version")
+
+
+class RequestError(ValueError):
+    """A request the server refuses, with the HTTP status to answer it with."""
+
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(message)
+
+
+class ReadPool:
+    """A fixed set of read connections lent to the request threads one at a time."""
+
+    def __init__(self, path, size=READERS):
+        self.connections = queue.SimpleQueue()
+        for _ in range(size):
+            self.connections.put(BookstoreDatabase(path, check_same_thread=False))
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        db = self.connections.get()
+        try:
+            yield db
+        finally:
+            self.connections.put(db)
+
+    def close(self):
+        for _ in range(self.size):
+            self.connections.get().close()
+
+
+class SaleBatcher:
+    """Group commit for sales.
+
+    The first sale to arrive queues a commit on the writer; every sale that
+    arrives before the writer gets to it joins the same transaction, so under
+    load one commit (and one fsync at checkpoint) serves many requests.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.lock = threading.Lock()
+        self.pending = []
+        # Transactions committed so far, to see how many sales share one under load
+        self.commits = 0
+
+    def sell(self, basket):
+        """Sell a basket of (book_id, quantity) lines; blocks until it is committed or refused."""
+        future = Future()
+        with self.lock:
+            self.pending.append((basket, future))
+            first = len(self.pending) == 1
+        if first:
+            self.worker.submit(self.commit)
+        return future.result()
+
+    def commit(self, db):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        try:
+            results = db.checkout_many([basket for basket, future in batch])
+        except Exception as e:
+            for basket, future in batch:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        for (basket, future), error in zip(batch, results):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+class BookstoreServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, path="bookstore.db", readers=READERS, log_requests=False):
+        # The writer opens (and migrates) the database before any reader does
+        self.worker = DatabaseWorker(lambda callback: callback(), path)
+        self.readers = ReadPool(path, readers)
+        self.sales = SaleBatcher(self.worker)
+        self.log_requests = log_requests
+        self.next_promotion_check = 0
+        super().__init__(address, BookstoreHandler)
+
+    def service_actions(self):
+        # serve_forever calls this between requests (at least every poll interval)
+        if time.monotonic() >= self.next_promotion_check:
+            self.next_promotion_check = time.monotonic() + PROMOTION_CHECK_SECONDS
+            self.worker.submit("refresh_promotions")
+
+    def write(self, method, *args, **kwargs):
+        """Run a BookstoreDatabase write on the writer thread and wait for it."""
+        return self.worker.submit(method, *args, **kwargs).result()
+
+    def server_close(self):
+        super().server_close()
+        self.readers.close()
+        self.worker.close()
+
+
+def book_json(book):
+    return dict(zip(BOOK_FIELDS, book))
+
+
+def field(body, name, kind, required=True):
+    """Read a field of a request body as kind (int, float or str)."""
+    value = body.get(name)
+    if value is None:
+        if required:
+            raise RequestError(400, f"فیلد {name} لازم است.")
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise RequestError(400, f"مقدار {name} نامعتبر است.")
+
+
+def count_of(query, name, default, maximum):
+    """Read a positive count (a page limit, days, ...) from the query string, default if it is missing."""
+    value = field(query, name, int, required=False)
+    if value is None:
+        return default
+    # SQLite takes a negative LIMIT as no limit at all, so it is refused rather than passed on
+    if not 1 <= value <= maximum:
+        raise RequestError(400, f"مقدار {name} باید بین ۱ و {maximum} باشد.")
+    return value
+
+
+def limit_of(query):
+    return count_of(query, "limit", PAGE_LIMIT, MAX_LIMIT)
+
+
+class BookstoreHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a till or the web shop reuses one connection for many requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, the body waits ~40 ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    ROUTES = [
+        ("GET", r"/books", "list_books"),
+        ("POST", r"/books", "add_book"),
+        ("GET", r"/books/(\d+)", "get_book"),
+        ("PUT", r"/books/(\d+)", "update_book"),
+        ("DELETE", r"/books/(\d+)", "delete_book"),
+        ("POST", r"/books/(\d+)/discount", "apply_discount"),
+        ("GET", r"/search", "search"),
+        ("POST", r"/sales", "sell"),
+        ("GET", r"/report", "report"),
+        ("GET", r"/promotions", "list_promotions"),
+        ("POST", r"/promotions", "add_promotion"),
+        ("DELETE", r"/promotions/(\d+)", "end_promotion"),
+    ]
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body = self.read_body()
+            for route_method, pattern, name in self.ROUTES:
+                match = re.fullmatch(pattern, url.path.rstrip("/") or "/")
+                if match and route_method == method:
+                    status, payload = getattr(self, name)(query, body, *map(int, match.groups()))
+                    break
+            else:
+                raise RequestError(404, "آدرس پیدا نشد.")
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        except InsufficientStockError as e:
+            status, payload = 409, {"error": str(e), "lines": e.lines}
+        except ConflictError as e:
+            status, payload = 409, {"error": str(e)}
+        except ValueError as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            self.log_error("%s %s failed: %r", method, self.path, e)
+            status, payload = 500, {"error": "خطای داخلی سرور."}
+        self.send_json(status, payload)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise RequestError(400, "بدنه درخواست JSON معتبر نیست.")
+        if not isinstance(body, dict):
+            raise RequestError(400, "بدنه درخواست باید یک شیء JSON باشد.")
+        return body
+
+    def send_json(self, status, payload):
+        data = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.log_requests:
+            super().log_message(format, *args)
+
+    def log_error(self, format, *args):
+        # Errors are always logged, even when requests are not
+        super().log_message(format, *args)
+
+    def list_books(self, query, body):
+        with self.server.readers.connection() as db:
+            books, first, last = db.get_books_page(
+                query.get("cursor"), limit_of(query), sort=query.get("sort", "id"),
+                backward=query.get("backward") == "1", descending=query.get("descending") == "1",
+                search=query.get("search"))
+        return 200, {"books": [book_json(book) for book in books], "first": first, "last": last}
+
+    def get_book(self, query, body, book_id):
+        with self.server.readers.connection() as db:
+            book = db.get_book(book_id)
+        if book is None:
+            raise RequestError(404, "کتاب پیدا نشد.")
+        return 200, book_json(book)
+
+    def add_book(self, query, body):
+        book_id = self.server.write("add_book", field(body, "title", str), field(body, "author", str),
+                                    field(body, "price", float), field(body, "stock", int),
+                                    field(body, "isbn", str, required=False))
+        return 201, {"id": book_id}
+
+    def update_book(self, query, body, book_id):
+        self.server.write("update_book", book_id, field(body, "title", str), field(body, "author", str),
+                          field(body, "price", float), field(body, "stock", int),
+                          version=field(body, "version", int, required=False))
+        return 204, None
+
+    def delete_book(self, query, body, book_id):
+        self.server.write("delete_book", book_id)
+        return 204, None
+
+    def apply_discount(self, query, body, book_id):
+        self.server.write("apply_discount", book_id, field(body, "discount", float),
+                          version=field(body, "version", int, required=False))
+        return 204, None
+
+    def search(self, query, body):
+        with self.server.readers.connection() as db:
+            books = db.search_books(query.get("q", ""), limit_of(query), candidates=CANDIDATES)
+        return 200, {"books": [book_json(book) for book in books]}
+
+    def sell(self, query, body):
+        items = body.get("items")
+        try:
+            basket = [(int(book_id), int(quantity)) for book_id, quantity in items]
+        except (TypeError, ValueError):
+            raise RequestError(400, "اقلام فروش باید فهرستی از [شناسه کتاب، تعداد] باشد.")
+        if not basket:
+            raise RequestError(400, "سبد خرید خالی است.")
+        self.server.sales.sell(basket)
+        return 201, {"sold": len(basket)}
+
+    def report(self, query, body):
+        with self.server.readers.connection() as db:
+            totals, today, books, authors, period = db.get_sales_report(
+                count_of(query, "top", 3, MAX_LIMIT), count_of(query, "days", 30, MAX_DAYS))
+        return 200, {
+            "total": {"quantity": totals[0], "revenue": totals[1]},
+            "today": [{"day": day, "quantity": quantity, "revenue": revenue} for day, quantity, revenue in today],
+            "period": {"quantity": period[0], "revenue": period[1]},
+            "books": [{"id": book_id, "title": title, "quantity": quantity, "revenue": revenue}
+                      for book_id, title, quantity, revenue in books],
+            "authors": [{"author": author, "quantity": quantity, "revenue": revenue}
+                        for author, quantity, revenue in authors],
+        }
+
+    def list_promotions(self, query, body):
+        with self.server.readers.connection() as db:
+            promotions = db.get_promotions()
+        return 200, {"promotions": [
+            {"id": promotion_id, "name": name, "discount": discount, "starts_at": starts_at, "ends_at": ends_at,
+             "active": bool(active)} for promotion_id, name, discount, starts_at, ends_at, active in promotions]}
+
+    def add_promotion(self, query, body):
+        book_ids = body.get("book_ids")
+        if book_ids is not None and not isinstance(book_ids, list):
+            raise RequestError(400, "book_ids باید فهرستی از شناسه کتاب‌ها باشد.")
+        promotion_id = self.server.write(
+            "add_promotion", field(body, "name", str), field(body, "discount", float),
+            field(body, "starts_at", str, required=False), field(body, "ends_at", str, required=False),
+            field(body, "author", str, required=False), field(body, "min_price", float, required=False),
+            field(body, "max_price", float, required=False), field(body, "min_stock", int, required=False),
+            field(body, "max_stock", int, required=False), book_ids)
+        return 201, {"id": promotion_id}
+
+    def end_promotion(self, query, body, promotion_id):
+        self.server.write("end_promotion", promotion_id)
+        return 204, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the bookstore database as a JSON API")
+    parser.add_argument("--db", default="bookstore.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--readers", type=int, default=READERS, help="read connections in the pool")
+    parser.add_argument("--log", action="store_true", help="log every request to stderr")
+    args = parser.parse_args()
+
+    server = BookstoreServer((args.host, args.port), args.db, args.readers, log_requests=args.log)
+    print(f"http://{args.host}:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1027 @@
+"""Headless benchmarks for the bookstore storage code.
+
+Usage:
+    python bench.py search --rows 1000000
+    python bench.py catalog --books 200000
+    python bench.py memory --books 1000000 --sales 1000000
+    python bench.py restart --books 1000000
+    python bench.py typing --rows 1000000
+    python bench.py folds
+    python bench.py plans
+    python bench.py pos --rows 1000000 --scans 20000
+    python bench.py stress --writers 8
+    python bench.py api --rows 100000 --clients 16 --seconds 10
+    python bench.py pricing --rows 1000000
+    python bench.py promotions --rows 100000
+    python bench.py export --sizes 1000,1000000,10000000
+    python bench.py startup
+    python bench.py trace --output trace.prom
+    python bench.py suite --sizes 1000,100000,1000000 --output results.json
+"""
+import argparse
+import gc
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+import isbn
+from api_server import MAX_LIMIT, BookstoreServer
+from bookstore_db import (BOOK_COLUMNS, SORT_COLUMNS, BookstoreDatabase, ConflictError, InsufficientStockError,
+                          encode_cursor)
+from live_search import CANDIDATES, SearchCache
+from memory_catalog import Book, Catalog, SalesLedger
+from memory_store import MemoryStore
+from pos import Register
+
+PERSIAN_WORDS = ["کتاب", "تاریخ", "ایران", "شعر", "دیوان", "حافظ", "سعدی", "داستان", "کودک", "رمان",
+                 "فلسفه", "علم", "هنر", "می‌خواهم", "زندگی", "جنگ", "صلح", "سفر", "دریا", "شب"]
+ENGLISH_WORDS = ["python", "history", "garden", "river", "night", "science", "cookbook", "war", "peace",
+                 "journey", "learning", "design", "data", "poems", "stories", "music", "city", "ocean"]
+AUTHORS = ["حافظ", "سعدی", "مولوی", "فردوسی", "هدایت", "Tolkien", "Orwell", "Austen", "Beazley", "Lutz"]
+
+
+def synthetic_books(rows, seed=1):
+    """Yield (title, author, price, stock) rows with a mix of Persian and English titles."""
+    rng = random.Random(seed)
+    for _ in range(rows):
+        words = PERSIAN_WORDS if rng.random() < 0.5 else ENGLISH_WORDS
+        title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+        yield title, rng.choice(AUTHORS), float(rng.randint(10, 500) * 1000), rng.randint(0, 50)
+
+
+def synthetic_sales(rows, books, seed=2, years=1):
+    """Yield (book_id, quantity, sold_at) sales spread over the years from 2024 on, during opening hours."""
+    rng = random.Random(seed)
+    opening = datetime(2024, 1, 1, 9)
+    for _ in range(rows):
+        sold_at = opening + timedelta(days=rng.randrange(365 * years), seconds=rng.randrange(12 * 3600))
+        yield rng.randint(1, books), rng.randint(1, 3), sold_at.isoformat(" ")
+
+
+def fill_catalog(db, rows, seed=1):
+    db.cursor.executemany("INSERT INTO books (title, author, price, stock) VALUES (?, ?, ?, ?)",
+                          synthetic_books(rows, seed))
+    db.connection.commit()
+
+
+def timed(fn, repeat):
+    ms, result = timed_value(fn, repeat)
+    return ms, len(result)
+
+
+def timed_value(fn, repeat):
+    """Average milliseconds per call of fn, and its last result."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def bench_search(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        fill_catalog(db, args.rows)
+        print(f"loaded {args.rows} books in {time.perf_counter() - start:.1f}s")
+
+        def like(query):
+            db.cursor.execute("SELECT * FROM books WHERE title LIKE ?", ("%" + query + "%",))
+            return db.cursor.fetchall()
+
+        print(f"{'query':<20}{'LIKE ms':>10}{'rows':>10}{'FTS ms':>10}{'rows':>10}{'top50 ms':>10}")
+        for query in ["حافظ", "كتاب", "pyth", "river night", "می‌خو", "zzz"]:
+            like_ms, like_rows = timed(lambda: like(query), args.repeat)
+            fts_ms, fts_rows = timed(lambda: db.get_book_by_title(query), args.repeat)
+            top_ms, _ = timed(lambda: db.search_books(query), args.repeat)
+            print(f"{query:<20}{like_ms:>10.2f}{like_rows:>10}{fts_ms:>10.2f}{fts_rows:>10}{top_ms:>10.2f}")
+        db.connection.close()
+
+
+def bench_typing(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        fill_catalog(db, args.rows)
+        print(f"loaded {args.rows} books in {time.perf_counter() - start:.1f}s")
+
+        # Every prefix of each query, as if typed one key at a time
+        cache = SearchCache()
+        print(f"{'query':<20}{'full max':>12}{'live p50':>10}{'live max':>10}")
+        for query in ["حافظ", "کتاب داستان", "python data", "می‌خواهم", "zzz"]:
+            prefixes = [query[:i] for i in range(1, len(query) + 1)]
+            ranked, live = [], []
+            for prefix in prefixes:
+                ranked.append(timed(lambda: db.search_books(prefix), 1)[0])
+                live.append(timed(lambda: cache.search(db, prefix), 1)[0])
+            print(f"{query:<20}{max(ranked):>12.2f}{statistics.median(live):>10.2f}{max(live):>10.2f}")
+        db.connection.close()
+
+
+# (query, title) pairs that must find each other whichever way they are written:
+# Arabic letter forms, ZWNJ and harakat (U+064B-U+0652) are all folded away
+FOLD_CASES = [("کتاب", "کِتابِ تازه"), ("کِتاب", "کتاب کهنه"), ("مثنوی", "مَثْنَوی معنوی"), ("شعر", "شِعرِ نو"),
+              ("كتاب", "کتاب‌های درسی"), ("میخواهم", "می‌خواهم بدانم"), ("دُرّ", "در دریا")]
+
+
+def bench_folds(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "folds.db"))
+        store = MemoryStore(os.path.join(tmp, "folds"))
+        for _, title in FOLD_CASES:
+            db.add_book(title, "نویسنده", 1000.0, 1)
+            store.add_book(Book(title, "نویسنده", 1000.0, 1))
+        failures = 0
+        # The memory store is searched before and after its index is saved in a snapshot
+        for stage in ("journal", "snapshot"):
+            if stage == "snapshot":
+                store.compact()
+            for query, title in FOLD_CASES:
+                found = {"sqlite": [book[1] for book in db.search_books(query)],
+                         "memory": [book.title for book in store.catalog.find(title=query)]}
+                for backend, titles in found.items():
+                    if title not in titles:
+                        print(f"{backend} ({stage}): {query!r} did not find {title!r}")
+                        failures += 1
+        store.close()
+        db.close()
+    print(f"{len(FOLD_CASES)} folded searches, {failures} failures")
+    if failures:
+        sys.exit(1)
+
+
+# Statements allowed to read a whole table, with the reason
+ALLOWED_SCANS = {
+    "title LIKE": "get_book_by_title fallback for text without a single searchable word",
+    "FROM books WHERE 1": "a storewide campaign starting records every book, once",
+    "FROM promotions WHERE": "the campaigns table holds a row per campaign ever scheduled",
+    "FROM promotions ORDER BY": "get_promotions lists every campaign",
+}
+
+
+def issue_every_query(db):
+    """Call every BookstoreDatabase query the front ends use, the ways they use it."""
+    for sort in SORT_COLUMNS:
+        for descending in (False, True):
+            books, first, last = db.get_books_page(None, 5, sort=sort, descending=descending)
+            db.get_books_page(last, 5, sort=sort, descending=descending)
+            db.get_books_page(first, 5, sort=sort, backward=True, descending=descending)
+            books, first, last = db.get_books_page(None, 5, sort=sort, descending=descending, search="کتاب")
+            db.get_books_page(last, 5, sort=sort, descending=descending, search="کتاب")
+    db.get_book_by_title("حافظ")
+    db.get_book_by_title("!!")
+    db.search_books("کتاب")
+    db.search_books("ک", candidates=CANDIDATES)
+    db.add_book("کتاب تازه", "نویسنده", 1000.0, 5, "9780306406157")
+    book_id = db.get_book_by_isbn("9780306406157")[0][0]
+    db.set_isbn(book_id, "978-0-306-40615-7")
+    db.get_top_selling_isbns()
+    db.update_book(book_id, "کتاب تازه", "نویسنده", 1200.0, 5)
+    db.apply_discount(book_id, 10)
+    db.checkout([(book_id, 1)])
+    try:
+        db.checkout([(book_id, 1000)])
+    except InsufficientStockError:
+        pass
+    db.record_sale(book_id, 1, 1080.0)
+    db.import_books([("کتاب تازه", "نویسنده", 1100.0, 6), ("کتاب دیگر", "نویسنده", 900.0, 2)])
+    db.get_sales_report()
+    db.get_sales_by_day()
+    db.get_sales_by_hour("2024-01-01 00", "2024-01-01 23")
+    db.get_period_totals("2024-01-01", "2024-01-30")
+    db.get_sales_between("2024-01-01 09:00:00", "2024-01-01 17:00:00")
+    storewide = db.add_promotion("همه", 5, ends_at="2099-01-01")
+    db.add_promotion("نویسنده", 15, author="نویسنده", ends_at="2099-01-01")
+    db.add_promotion("ارزان", 10, min_price=500, max_price=1000, min_stock=1, max_stock=50,
+                     starts_at="2098-01-01", ends_at="2099-01-01")
+    db.add_promotion("چند کتاب", 20, book_ids=[1, 2, book_id], ends_at="2099-01-01")
+    db.checkout([(book_id, 1)])
+    db.end_promotion(storewide)
+    db.refresh_promotions("2098-06-01")
+    db.refresh_promotions("2099-06-01")
+    db.get_promotions()
+    db.delete_book(book_id)
+
+
+def query_plan(db, sql):
+    """Return (plan lines, lines that read a whole table) for one statement."""
+    plan = [row[3] for row in db.connection.execute("EXPLAIN QUERY PLAN " + sql)]
+    # Subqueries SQLite builds itself are scanned, but they are as small as their LIMIT
+    built = {line.split()[1] for line in plan if line.startswith(("MATERIALIZE", "CO-ROUTINE"))}
+    # Walking a table or index in the requested order is fine when it stops at a LIMIT
+    ordered = re.search(r"\bLIMIT\b", sql) and not any("TEMP B-TREE" in line and "ORDER BY" in line for line in plan)
+    scans = [line for line in plan if line.startswith("SCAN ") and "VIRTUAL TABLE" not in line
+             and line != "SCAN CONSTANT ROW" and line.split()[1] not in built and not ordered]
+    return plan, scans
+
+
+def bench_plans(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "bench.db"))
+        fill_catalog(db, args.rows)
+        db.checkout([(1, 1), (2, 2)])
+        statements = []
+        db.connection.set_trace_callback(statements.append)
+        issue_every_query(db)
+        db.connection.set_trace_callback(None)
+
+        seen, failures = set(), 0
+        for sql in statements:
+            sql = " ".join(sql.split())
+            if sql.split()[0].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+                continue
+            # One line per query shape, whatever values it was called with
+            shape = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", "?", sql).replace(BOOK_COLUMNS, "*")
+            if shape in seen:
+                continue
+            seen.add(shape)
+            plan, scans = query_plan(db, sql)
+            allowed = [reason for marker, reason in ALLOWED_SCANS.items() if marker in sql]
+            if scans and not allowed:
+                failures += 1
+            status = "SCAN" if scans and not allowed else "ok"
+            print(f"{status:<6}{shape[:110]}")
+            for line in plan if scans or args.verbose else ():
+                print(f"{'':<8}{line}")
+            for reason in allowed:
+                print(f"{'':<8}allowed: {reason}")
+        db.connection.close()
+    print(f"{len(seen)} statements, {failures} full table scans")
+    if failures:
+        sys.exit(1)
+
+
+def latency(call, inputs):
+    """Run call once per input and summarize the timings."""
+    timings = []
+    start = time.perf_counter()
+    for value in inputs:
+        began = time.perf_counter()
+        call(value)
+        timings.append(time.perf_counter() - began)
+    return summarize(timings, time.perf_counter() - start)
+
+
+def summarize(timings, total):
+    """Throughput and p50/p99 of timings (seconds) taken over total seconds."""
+    timings = sorted(timings)
+
+    def percentile(p):
+        return round(timings[min(len(timings) - 1, round(p / 100 * (len(timings) - 1)))] * 1000, 4)
+    return {"ops": len(timings), "ops_per_s": round(len(timings) / total, 1) if total else None,
+            "p50_ms": percentile(50), "p99_ms": percentile(99)}
+
+
+def ignore_out_of_stock(call):
+    """Wrap a sale so that a book that ran out of stock still counts as a timed call."""
+    def sell(value):
+        try:
+            call(value)
+        except ValueError:
+            pass
+    return sell
+
+
+def suite_inputs(rows, ops, seed):
+    """The book ids and search words every back end is given, in the same order."""
+    rng = random.Random(seed)
+    words = PERSIAN_WORDS + ENGLISH_WORDS
+    return ([rng.randint(1, rows) for _ in range(ops)],
+            [rng.choice(words)[:rng.randint(2, 5)] for _ in range(ops)])
+
+
+def suite_days(ops, seed, years):
+    """Random days of the synthetic sales history, for the period reports."""
+    rng = random.Random(seed)
+    return [date(2024, 1, 1) + timedelta(days=rng.randrange(365 * years)) for _ in range(ops)]
+
+
+def suite_sqlite(tmp, rows, sales, ops, seed, years):
+    db = BookstoreDatabase(os.path.join(tmp, f"suite-{rows}.db"))
+    start = time.perf_counter()
+    fill_catalog(db, rows, seed)
+    db.cursor.executemany('''
+        INSERT INTO sales (book_id, quantity, total_price, sold_at)
+        SELECT id, ?, price * ?, ? FROM books WHERE id = ?
+    ''', ((quantity, quantity, sold_at, book_id)
+          for book_id, quantity, sold_at in synthetic_sales(sales, rows, seed + 1, years)))
+    db.connection.commit()
+    load = time.perf_counter() - start
+    book_ids, words = suite_inputs(rows, ops, seed + 2)
+    days = suite_days(ops, seed + 3, years)
+    operations = {
+        "get_books_page": latency(lambda book_id: db.get_books_page(encode_cursor("id", (book_id,)), 50), book_ids),
+        "get_book_by_title": latency(db.get_book_by_title, words),
+        "search_books": latency(db.search_books, words),
+        "record_sale": latency(lambda book_id: db.record_sale(book_id, 1, 1000.0), book_ids),
+        "checkout": latency(ignore_out_of_stock(lambda book_id: db.checkout([(book_id, 1)])), book_ids),
+        "get_total_sales": latency(lambda _: db.get_total_sales(), book_ids),
+        "get_sales_report": latency(lambda _: db.get_sales_report(), book_ids),
+        "end_of_day": latency(lambda day: db.get_sales_by_hour(f"{day} 00", f"{day} 23"), days),
+        "last_30_days": latency(lambda day: db.get_period_totals((day - timedelta(days=29)).isoformat(),
+                                                                 day.isoformat()), days),
+        "get_sales_between": latency(lambda day: db.get_sales_between(f"{day} 12:00:00", f"{day} 15:00:00"), days),
+    }
+    db.close()
+    return load, operations
+
+
+def suite_memory(tmp, rows, sales, ops, seed, years):
+    store = MemoryStore(os.path.join(tmp, f"suite-{rows}"))
+    start = time.perf_counter()
+    store.catalog.extend(Book(*row) for row in synthetic_books(rows, seed))
+    for book_id, quantity, sold_at in synthetic_sales(sales, rows, seed + 1, years):
+        book = store.catalog[book_id - 1]
+        # The history is replayed as it happened, so every sale was in stock
+        book.add_stock(quantity)
+        store.tracker.record_sale(book, quantity, datetime.fromisoformat(sold_at))
+    load = time.perf_counter() - start
+    # Loaded around the journal, so snapshotted before the changes below are journaled on top
+    store.compact()
+    book_ids, words = suite_inputs(rows, ops, seed + 2)
+    days = suite_days(ops, seed + 3, years)
+    catalog, tracker = store.catalog, store.tracker
+    operations = {
+        "page": latency(lambda book_id: catalog[book_id - 1:book_id + 49], book_ids),
+        "search_books": latency(lambda word: catalog.find(title=word), words),
+        "record_sale": latency(ignore_out_of_stock(lambda book_id: store.record_sale(catalog.get(book_id), 1)),
+                               book_ids),
+        "total_sales": latency(lambda _: tracker.total_sales(), book_ids),
+        "sales_report": latency(lambda _: (tracker.top_titles(), tracker.top_authors()), book_ids),
+        "end_of_day": latency(tracker.hourly, days),
+        "last_30_days": latency(lambda day: tracker.period_totals(day - timedelta(days=29), day), days),
+    }
+    store.close()
+    return load, operations
+
+
+SUITE_BACKENDS = {"sqlite": suite_sqlite, "memory": suite_memory}
+
+
+def bench_suite(args):
+    report = {"seed": args.seed, "ops": args.ops, "years": args.years, "python": sys.version.split()[0],
+              "sqlite": sqlite3.sqlite_version, "results": []}
+    for rows in args.sizes:
+        sales = int(rows * args.sales_per_book)
+        for backend in args.backends:
+            print(f"{backend}: {rows} books, {sales} sales", file=sys.stderr)
+            with tempfile.TemporaryDirectory() as tmp:
+                load, operations = SUITE_BACKENDS[backend](tmp, rows, sales, args.ops, args.seed, args.years)
+            report["results"].append({"backend": backend, "books": rows, "sales": sales,
+                                      "load_s": round(load, 2), "operations": operations})
+            gc.collect()
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def synthetic_isbn(book_id):
+    """A valid 13-digit ISBN derived from a book id."""
+    digits = f"978{book_id:09d}"
+    return digits + isbn.ean13_check_digit(digits)
+
+
+def bench_pos(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "bench.db"))
+        fill_catalog(db, args.rows)
+        db.cursor.executemany("UPDATE books SET isbn = ?, stock = 1000000 WHERE id = ?",
+                              ((synthetic_isbn(book_id), book_id) for book_id in range(1, args.rows + 1)))
+        db.connection.commit()
+        # A till sees the same few titles over and over, and now and then anything else
+        rng = random.Random(4)
+        popular = [rng.randint(1, args.rows) for _ in range(200)]
+        codes = [synthetic_isbn(rng.choice(popular) if rng.random() < 0.8 else rng.randint(1, args.rows))
+                 for _ in range(args.scans)]
+        register = Register(db, batch_size=args.batch_size)
+        timings = []
+        start = time.perf_counter()
+        for code in codes:
+            began = time.perf_counter()
+            register.scan(code)
+            timings.append(time.perf_counter() - began)
+        register.flush()
+        total = time.perf_counter() - start
+        timings.sort()
+        print(f"{args.scans} scans in {total:.2f}s: {args.scans / total * 60:.0f} scans/minute, "
+              f"p50 {timings[len(timings) // 2] * 1000:.3f} ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+        db.close()
+
+
+def stress_writer(path, writer, operations, books, seed):
+    """One register: sells at random and now and then edits a price from a stale read."""
+    db = BookstoreDatabase(path)
+    rng = random.Random(seed * 1000 + writer)
+    counts = {"sold": 0, "refused": 0, "edits": 0, "conflicts": 0, "errors": 0}
+    for _ in range(operations):
+        book_id = rng.randint(1, books)
+        try:
+            if rng.random() < 0.1:
+                book = db.get_book(book_id)
+                # The clerk takes a moment to type the new price while other registers keep selling
+                time.sleep(0.002)
+                db.update_book(book_id, book[1], book[2], book[3] + 1000, book[4], version=book[7])
+                counts["edits"] += 1
+            else:
+                quantity = rng.randint(1, 3)
+                db.checkout([(book_id, quantity)])
+                counts["sold"] += quantity
+        except ConflictError:
+            counts["conflicts"] += 1
+        except InsufficientStockError:
+            counts["refused"] += 1
+        except sqlite3.OperationalError:
+            counts["errors"] += 1
+    db.close()
+    return counts
+
+
+def bench_stress(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        db = BookstoreDatabase(path)
+        db.cursor.executemany("INSERT INTO books (title, author, price, stock) VALUES (?, ?, ?, ?)",
+                              ((title, author, price, args.stock)
+                               for title, author, price, stock in synthetic_books(args.books, args.seed)))
+        db.connection.commit()
+        db.close()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.writers) as pool:
+            results = pool.starmap(stress_writer, [(path, writer, args.operations, args.books, args.seed)
+                                                   for writer in range(args.writers)])
+        elapsed = time.perf_counter() - start
+        totals = {name: sum(counts[name] for counts in results) for name in results[0]}
+        print(f"{args.writers} writers, {args.writers * args.operations} operations in {elapsed:.2f}s: "
+              + ", ".join(f"{name} {value}" for name, value in totals.items()))
+
+        db = BookstoreDatabase(path)
+        db.cursor.execute('''
+            SELECT books.id, books.stock, books.sold, COALESCE(SUM(sales.quantity), 0)
+            FROM books LEFT JOIN sales ON sales.book_id = books.id GROUP BY books.id
+        ''')
+        problems = []
+        for book_id, stock, sold, sales in db.cursor.fetchall():
+            if stock < 0 or stock + sold != args.stock:
+                problems.append(f"book {book_id}: stock {stock} + sold {sold} != {args.stock}")
+            if sales != sold:
+                problems.append(f"book {book_id}: sales rows add up to {sales}, sold is {sold}")
+        db.cursor.execute("SELECT SUM(sold) FROM books")
+        if db.cursor.fetchone()[0] != totals["sold"]:
+            problems.append("registers sold a different number of books than the database recorded")
+        db.close()
+    for problem in problems:
+        print(problem)
+    print("oversold or lost updates: " + (f"{len(problems)} problems" if problems else "none"))
+    if problems or totals["errors"]:
+        sys.exit(1)
+
+
+# Share of each request in the API load test
+API_MIX = {"book": 50, "search": 20, "page": 15, "sale": 15}
+
+
+def api_client(port, client, seconds, books, seed):
+    """One keep-alive HTTP client sending the API_MIX until its time is up."""
+    rng = random.Random(seed * 1000 + client)
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Content-Type": "application/json"}
+    timings = {kind: [] for kind in API_MIX}
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        kind = rng.choices(list(API_MIX), list(API_MIX.values()))[0]
+        body = None
+        if kind == "book":
+            method, path = "GET", f"/books/{rng.randint(1, books)}"
+        elif kind == "search":
+            word = rng.choice(PERSIAN_WORDS + ENGLISH_WORDS)
+            method, path = "GET", "/search?q=" + quote(word[:rng.randint(2, len(word))])
+        elif kind == "page":
+            method, path = "GET", f"/books?sort={rng.choice(list(SORT_COLUMNS))}&limit=50"
+        else:
+            method, path = "POST", "/sales"
+            body = json.dumps({"items": [[rng.randint(1, books), rng.randint(1, 2)]]})
+        began = time.perf_counter()
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        response.read()
+        timings[kind].append(time.perf_counter() - began)
+        # 409 is a sale refused for lack of stock, which the API is meant to answer
+        if response.status >= 500 or response.status in (400, 404):
+            errors += 1
+    connection.close()
+    return timings, errors
+
+
+def check_api_bounds(port):
+    """Limits outside 1..MAX_LIMIT are refused; SQLite would take a negative one as no limit."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    failures = 0
+    for path in ("/books?limit=-1", "/books?limit=0", f"/books?limit={MAX_LIMIT + 1}", "/search?q=a&limit=-1",
+                 "/report?top=-1", "/report?days=0"):
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 400:
+            print(f"  {path}: {response.status} instead of 400")
+            failures += 1
+    connection.request("GET", f"/books?limit={MAX_LIMIT}")
+    response = connection.getresponse()
+    if len(json.loads(response.read())["books"]) != MAX_LIMIT:
+        print(f"  /books?limit={MAX_LIMIT} did not return {MAX_LIMIT} books")
+        failures += 1
+    connection.close()
+    return failures
+
+
+def bench_api(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "api.db")
+        db = BookstoreDatabase(path)
+        fill_catalog(db, args.rows)
+        db.close()
+        # Client processes are forked before the server starts its threads
+        with multiprocessing.Pool(args.clients) as pool:
+            server = BookstoreServer(("127.0.0.1", 0), path, args.readers)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                bound_errors = check_api_bounds(server.server_address[1])
+                start = time.perf_counter()
+                results = pool.starmap(api_client, [(server.server_address[1], client, args.seconds, args.rows,
+                                                     args.seed) for client in range(args.clients)])
+                elapsed = time.perf_counter() - start
+            finally:
+                server.shutdown()
+                server.server_close()
+    requests = sum(len(timings) for result, errors in results for timings in result.values())
+    errors = sum(errors for result, errors in results) + bound_errors
+    print(f"{args.clients} clients, {args.readers} read connections, {args.rows} books: "
+          f"{requests / elapsed:.0f} requests/s, {errors} errors")
+    for kind in API_MIX:
+        timings = [timing for result, errors in results for timing in result[kind]]
+        if timings:
+            summary = summarize(timings, elapsed)
+            print(f"  {kind:<7} {summary['ops_per_s']:>8.0f}/s  p50 {summary['p50_ms']:.2f} ms  "
+                  f"p99 {summary['p99_ms']:.2f} ms")
+    sales = sum(len(result["sale"]) for result, errors in results)
+    if server.sales.commits:
+        print(f"  {sales} sales in {server.sales.commits} commits ({sales / server.sales.commits:.1f} per commit)")
+    if errors:
+        sys.exit(1)
+
+
+def bench_pricing(args):
+    # NumPy is only needed by this benchmark, so the others still run without it
+    from pricing import PriceColumns
+
+    books = [Book(*row) for row in synthetic_books(args.rows)]
+    rng = random.Random(3)
+    for i, book in enumerate(books, 1):
+        book.book_id = i
+        book.sold = rng.randint(0, 20)
+        if rng.random() < 0.2:
+            book.discount = rng.choice((5, 10, 20, 30))
+
+    def loop():
+        # What the front ends do per displayed row, extended to the whole catalog
+        prices = [book.get_discounted_price() for book in books]
+        return sum(price * book.stock for price, book in zip(prices, books))
+
+    def vectorized(columns):
+        columns.discounted_prices()
+        return columns.valuation()["retail_value"]
+
+    print(f"{args.rows} books{'':<20}{'ms':>10}")
+    ms, expected = timed_value(loop, args.repeat)
+    print(f"{'per-row loop (Book)':<34}{ms:>10.1f}")
+    ms, columns = timed_value(lambda: PriceColumns.from_books(books), 1)
+    print(f"{'  build columns from Book':<34}{ms:>10.1f}")
+    ms, value = timed_value(lambda: vectorized(columns), args.repeat)
+    print(f"{'vectorized pass':<34}{ms:>10.1f}")
+    if abs(value - expected) > 1e-6 * max(1.0, abs(expected)):
+        sys.exit(f"vectorized value {value} differs from the loop's {expected}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "pricing.db"))
+        db.cursor.executemany("INSERT INTO books (title, author, price, stock, sold, discount) VALUES (?, ?, ?, ?, ?, ?)",
+                              ((book.title, book.author, book.price, book.stock, book.sold, book.discount)
+                               for book in books))
+        # Some of the discounts come from a campaign, which the columns have to pick up as well
+        db.cursor.execute("UPDATE books SET promo_discount = discount, discount = 0 WHERE id % 3 = 0")
+        db.connection.commit()
+
+        def database_loop():
+            db.cursor.execute(f"SELECT {BOOK_COLUMNS} FROM books")
+            return sum(row[3] * (1 - row[6] / 100) * row[4] for row in db.cursor.fetchall())
+
+        ms, _ = timed_value(database_loop, 1)
+        print(f"{'per-row loop (database rows)':<34}{ms:>10.1f}")
+        ms, columns = timed_value(lambda: PriceColumns.from_database(db), 1)
+        print(f"{'  build columns from database':<34}{ms:>10.1f}")
+        ms, value = timed_value(lambda: vectorized(columns), args.repeat)
+        print(f"{'vectorized pass':<34}{ms:>10.1f}")
+        db.close()
+    if abs(value - expected) > 1e-6 * max(1.0, abs(expected)):
+        sys.exit(f"vectorized value {value} differs from the loop's {expected}")
+
+
+def bench_promotions(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = BookstoreDatabase(os.path.join(tmp, "promotions.db"))
+        fill_catalog(db, args.rows)
+        # Some books carry a discount of their own, which no campaign may lower
+        db.cursor.execute("UPDATE books SET discount = 25 WHERE id % 10 = 0")
+        db.connection.commit()
+        author = AUTHORS[0]
+
+        def per_title():
+            # The way a campaign was run before: apply_discount on every book of the author
+            db.cursor.execute("SELECT id FROM books WHERE author = ?", (author,))
+            for (book_id,) in db.cursor.fetchall():
+                db.apply_discount(book_id, 15)
+
+        def effective_discounts():
+            db.cursor.execute(f"SELECT {BOOK_COLUMNS} FROM books")
+            return {row[0]: (row[2], row[6]) for row in db.cursor.fetchall()}
+
+        def check(expected):
+            for book_id, (book_author, discount) in effective_discounts().items():
+                if discount != expected(book_id, book_author):
+                    sys.exit(f"book {book_id} has a discount of {discount}")
+
+        print(f"{args.rows} books{'':<20}{'ms':>10}")
+        ms, _ = timed_value(per_title, 1)
+        print(f"{'per-title apply_discount (author)':<34}{ms:>10.1f}")
+        db.cursor.execute("UPDATE books SET discount = CASE WHEN id % 10 = 0 THEN 25 ELSE 0 END")
+        db.connection.commit()
+
+        ms, _ = timed_value(lambda: db.add_promotion("همه", 10, "2030-01-01", "2030-01-08"), 1)
+        print(f"{'schedule storewide':<34}{ms:>10.1f}")
+        db.add_promotion("نویسنده", 15, "2030-01-01", "2030-01-15", author=author)
+        ms, _ = timed_value(lambda: db.refresh_promotions("2030-01-01"), 1)
+        print(f"{'start storewide + author':<34}{ms:>10.1f}")
+        check(lambda book_id, book_author: 25 if book_id % 10 == 0 else 15 if book_author == author else 10)
+        ms, _ = timed_value(lambda: db.refresh_promotions("2030-01-08"), 1)
+        print(f"{'end storewide (author still on)':<34}{ms:>10.1f}")
+        check(lambda book_id, book_author: 25 if book_id % 10 == 0 else 15 if book_author == author else 0)
+        # A book that leaves the campaign's filter while it runs must still lose the discount when it ends
+        db.cursor.execute("SELECT id, title, price, stock FROM books WHERE author = ? AND id % 10 != 0 LIMIT 1",
+                          (author,))
+        moved, title, price, stock = db.cursor.fetchone()
+        db.update_book(moved, title, AUTHORS[1], price, stock)
+        ms, _ = timed_value(lambda: db.refresh_promotions("2030-01-15"), 1)
+        print(f"{'end author':<34}{ms:>10.1f}")
+        check(lambda book_id, book_author: 25 if book_id % 10 == 0 else 0)
+        ms, _ = timed_value(lambda: db.refresh_promotions("2030-01-16"), args.repeat)
+        print(f"{'periodic check, nothing due':<34}{ms:>10.3f}")
+        db.close()
+
+
+def bench_export(args):
+    # Imported here like pricing, so the other benchmarks do not depend on the export module
+    from bookstore_export import export_table, read_columnar
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt_after(rows):
+        def progress(written):
+            if written >= rows:
+                raise Interrupted
+        return progress
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'sales':>10}  {'file':<14}{'rows/s':>12}{'peak KB':>10}{'MB':>8}")
+        for sales in map(int, args.sizes.split(",")):
+            db = BookstoreDatabase(os.path.join(tmp, f"export-{sales}.db"))
+            books = min(sales, args.books)
+            fill_catalog(db, books)
+            db.cursor.executemany('''
+                INSERT INTO sales (book_id, quantity, total_price, sold_at)
+                SELECT id, ?, price * ?, ? FROM books WHERE id = ?
+            ''', ((quantity, quantity, sold_at, book_id)
+                  for book_id, quantity, sold_at in synthetic_sales(sales, books)))
+            db.connection.commit()
+            for name in ("sales.csv", "sales.jsonl", "sales.cols", "sales.csv.gz", "sales.cols.gz"):
+                path = os.path.join(tmp, name)
+                report = export_table(db, "sales", path, chunk_size=args.chunk_size)
+                tracemalloc.start()
+                export_table(db, "sales", path, chunk_size=args.chunk_size)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{sales:>10}  {name:<14}{report['rows'] / report['seconds']:>12.0f}{peak / 1024:>10.0f}"
+                      f"{os.path.getsize(path) / 2**20:>8.1f}")
+
+                # Stop halfway, resume, and the file must be the same as the one written in one go
+                with open(path, "rb") as f:
+                    expected = f.read()
+                try:
+                    export_table(db, "sales", path, chunk_size=args.chunk_size, progress=interrupt_after(sales // 2))
+                except Interrupted:
+                    with open(path, "ab") as f:
+                        # What a kill in the middle of a write leaves behind
+                        f.write(b"half a chunk")
+                    export_table(db, "sales", path, chunk_size=args.chunk_size, resume=True)
+                with open(path, "rb") as f:
+                    if f.read() != expected:
+                        sys.exit(f"resumed export of {name} differs from the uninterrupted one")
+            if sum(1 for _ in read_columnar(os.path.join(tmp, "sales.cols.gz"))) != sales:
+                sys.exit("the columnar export does not read back every sale")
+            db.close()
+
+
+def bench_trace(args):
+    from db_tracing import QueryTracer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.db")
+        db = BookstoreDatabase(path)
+        fill_catalog(db, args.rows)
+        db.close()
+        book_ids, words = suite_inputs(args.rows, args.ops, 1)
+
+        def operations(db):
+            return {
+                "get_books_page": latency(lambda book_id: db.get_books_page(encode_cursor("id", (book_id,)), 50),
+                                          book_ids),
+                "search_books": latency(lambda word: db.search_books(word, candidates=CANDIDATES), words),
+                "checkout": latency(ignore_out_of_stock(lambda book_id: db.checkout([(book_id, 1)])), book_ids),
+                "get_sales_report": latency(lambda _: db.get_sales_report(), book_ids),
+            }
+
+        plain = BookstoreDatabase(path)
+        untraced = operations(plain)
+        plain.close()
+        tracer = QueryTracer(args.slow_ms)
+        db = tracer.attach(BookstoreDatabase(path))
+        traced = operations(db)
+        # A LIKE scan over the whole catalog, which the tracer must flag with its plan
+        db.get_book_by_title("!!")
+        db.close()
+
+    print(f"{'operation':<20}{'plain p50 ms':>14}{'traced p50 ms':>15}{'overhead':>10}")
+    for name, summary in untraced.items():
+        overhead = traced[name]["p50_ms"] - summary["p50_ms"]
+        print(f"{name:<20}{summary['p50_ms']:>14.4f}{traced[name]['p50_ms']:>15.4f}{overhead * 1000:>8.1f}us")
+    stats = tracer.as_dict()
+    print("\nstatements by total time:")
+    for shape, histogram in sorted(stats["statements"].items(), key=lambda item: -item[1]["total_ms"])[:5]:
+        print(f"{histogram['total_ms']:>10.1f} ms {histogram['count']:>7}x  {shape[:90]}")
+    print(f"\ncommits: {stats['commits']['count']}, p50 {stats['commits']['p50_ms']} ms, "
+          f"max {stats['commits']['max_ms']} ms")
+    scans = [slow for slow in stats["slowest_recent"] if slow["method"] == "get_book_by_title"]
+    if not scans or not any(line.startswith("SCAN books") for line in scans[-1]["plan"]):
+        sys.exit(f"the title scan was not flagged as slower than {args.slow_ms:g} ms with its plan")
+    print(f"slow: {scans[-1]['method']} {scans[-1]['ms']} ms, plan: {'; '.join(scans[-1]['plan'])}")
+    if args.output:
+        tracer.write(args.output)
+
+
+# Modules a headless command must not import: the window toolkits and NumPy
+GUI_MODULES = ("tkinter", "kivy", "PyQt5", "numpy")
+
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "startup.db")
+        db = BookstoreDatabase(path)
+        fill_catalog(db, 1000)
+        db.close()
+
+        def run(command):
+            # A fresh interpreter per run, as from a shell or a cron job
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *command], cwd=here, check=True, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            return (time.perf_counter() - start) * 1000
+
+        commands = {
+            "python -c pass": ["-c", "pass"],
+            "list": ["bookstore_cli.py", "--db", path, "list", "--limit", "20"],
+            "search": ["bookstore_cli.py", "--db", path, "search", "کتاب"],
+            "report": ["bookstore_cli.py", "--db", path, "report"],
+        }
+        print(f"{'command':<20}{'p50 ms':>10}{'max ms':>10}")
+        slow = []
+        for name, command in commands.items():
+            run(command)
+            timings = sorted(run(command) for _ in range(args.repeat))
+            print(f"{name:<20}{statistics.median(timings):>10.1f}{timings[-1]:>10.1f}")
+            if name != "python -c pass" and statistics.median(timings) > args.budget:
+                slow.append(name)
+
+    # What importing the command line pulls in, slowest first
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bookstore_cli"], cwd=here,
+                            check=True, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        imports.append((int(cumulative), module.strip()))
+    loaded = {module for _, module in imports}
+    print(f"\nimport bookstore_cli: {len(imports)} modules, slowest:")
+    for cumulative, module in sorted(imports, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>8.1f} ms  {module}")
+    toolkits = sorted(module for module in loaded if module.split(".")[0] in GUI_MODULES)
+    if toolkits:
+        sys.exit(f"bookstore_cli imports {', '.join(toolkits)}")
+    if slow:
+        sys.exit(f"over the {args.budget:g} ms budget: {', '.join(slow)}")
+
+
+def bench_catalog(args):
+    books = [Book(*row) for row in synthetic_books(args.books)]
+    start = time.perf_counter()
+    catalog = Catalog(books)
+    print(f"indexed {args.books} books in {time.perf_counter() - start:.1f}s")
+
+    def scan(title):
+        # The list scan the no-database apps used before Catalog
+        return [book for book in books if title.lower() in book.title.lower()]
+
+    print(f"{'query':<20}{'scan ms':>10}{'rows':>10}{'index ms':>10}{'rows':>10}")
+    for query in [books[0].title, books[len(books) // 2].title, "حافظ", "pyth", "river night", "zzz"]:
+        scan_ms, scan_rows = timed(lambda: scan(query), args.repeat)
+        index_ms, index_rows = timed(lambda: catalog.find(title=query), args.repeat)
+        print(f"{query[:19]:<20}{scan_ms:>10.2f}{scan_rows:>10}{index_ms:>10.2f}{index_rows:>10}")
+
+
+class DictBook:
+    """Book as the no-database apps defined it before it got __slots__."""
+
+    def __init__(self, title, author, price, stock):
+        self.title = title
+        self.author = author
+        self.price = price
+        self.stock = stock
+        self.sold = 0
+        self.discount = 0
+
+
+def allocated(build):
+    """Return (object, bytes allocated while building it)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_memory(args):
+    # Titles and authors are built up front so both layouts share the same strings
+    rows = list(synthetic_books(args.books))
+    print(f"{'':<24}{'before':>12}{'after':>12}")
+    dict_books, dict_size = allocated(lambda: [DictBook(*row) for row in rows])
+    slot_books, slot_size = allocated(lambda: [Book(*row) for row in rows])
+    print(f"{'bytes per book':<24}{dict_size / args.books:>12.1f}{slot_size / args.books:>12.1f}")
+
+    rng = random.Random(2)
+    sales = [(rng.randrange(args.books), rng.randint(1, 5)) for _ in range(args.sales)]
+
+    def tuple_sales():
+        # The old SalesTracker.sales: (title, quantity, total) per sale
+        return [(rows[i][0], quantity, rows[i][2] * quantity) for i, quantity in sales]
+
+    now = time.time()
+
+    def ledger_sales():
+        ledger = SalesLedger()
+        for i, quantity in sales:
+            ledger.append(i + 1, quantity, rows[i][2], now)
+        return ledger
+
+    _, tuple_size = allocated(tuple_sales)
+    _, ledger_size = allocated(ledger_sales)
+    print(f"{'bytes per sale':<24}{tuple_size / args.sales:>12.1f}{ledger_size / args.sales:>12.1f}")
+
+
+def bench_restart(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench")
+        store = MemoryStore(path, compact_every=args.journal + 1)
+        store.catalog.extend(Book(*row) for row in synthetic_books(args.books))
+        start = time.perf_counter()
+        store.compact()
+        print(f"snapshot of {args.books} books written in {time.perf_counter() - start:.2f}s")
+        rng = random.Random(3)
+        for _ in range(args.journal):
+            store.apply_discount(store.catalog.get(rng.randint(1, args.books)), float(rng.randint(0, 30)))
+        store.close()
+        del store
+        gc.collect()
+
+        start = time.perf_counter()
+        store = MemoryStore(path)
+        print(f"restart with {args.journal} journaled changes: {(time.perf_counter() - start) * 1000:.1f} ms")
+        start = time.perf_counter()
+        store.catalog.find(title="حافظ")
+        print(f"first search (in the saved indexes): {(time.perf_counter() - start) * 1000:.1f} ms")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bookstore storage benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", help="LIKE scan vs FTS5 index for get_book_by_title")
+    search.add_argument("--rows", type=int, default=1_000_000)
+    search.add_argument("--repeat", type=int, default=5)
+    search.set_defaults(func=bench_search)
+    typing = commands.add_parser("typing", help="per-keystroke latency of the live search")
+    typing.add_argument("--rows", type=int, default=1_000_000)
+    typing.set_defaults(func=bench_typing)
+    folds = commands.add_parser("folds", help="fail if a search misses a title written with harakat, ZWNJ or "
+                                              "Arabic letter forms")
+    folds.set_defaults(func=bench_folds)
+    plans = commands.add_parser("plans", help="fail if any query the apps issue reads a whole table")
+    plans.add_argument("--rows", type=int, default=20_000)
+    plans.add_argument("--verbose", action="store_true", help="print every plan, not only the failing ones")
+    plans.set_defaults(func=bench_plans)
+    suite = commands.add_parser("suite", help="p50/p99 latency of every storage operation, as JSON")
+    suite.add_argument("--sizes", type=lambda text: [int(size) for size in text.split(",")],
+                       default=[1000, 100_000], help="comma-separated catalog sizes, e.g. 1000,1000000,10000000")
+    suite.add_argument("--sales-per-book", type=float, default=1.0)
+    suite.add_argument("--backends", type=lambda text: text.split(","), default=list(SUITE_BACKENDS))
+    suite.add_argument("--ops", type=int, default=200, help="timed calls per operation")
+    suite.add_argument("--years", type=int, default=1, help="years of history the sales are spread over")
+    suite.add_argument("--seed", type=int, default=1)
+    suite.add_argument("--output", help="write the JSON report here instead of to stdout")
+    suite.set_defaults(func=bench_suite)
+    pos = commands.add_parser("pos", help="scans per minute through the point-of-sale register")
+    pos.add_argument("--rows", type=int, default=1_000_000)
+    pos.add_argument("--scans", type=int, default=20_000)
+    pos.add_argument("--batch-size", type=int, default=20)
+    pos.set_defaults(func=bench_pos)
+    stress = commands.add_parser("stress", help="concurrent writer processes must never oversell or lose a sale")
+    stress.add_argument("--writers", type=int, default=8)
+    stress.add_argument("--operations", type=int, default=500, help="sales and edits per writer")
+    stress.add_argument("--books", type=int, default=20)
+    stress.add_argument("--stock", type=int, default=200)
+    stress.add_argument("--seed", type=int, default=1)
+    stress.set_defaults(func=bench_stress)
+    api = commands.add_parser("api", help="requests per second through the HTTP/JSON API on localhost")
+    api.add_argument("--rows", type=int, default=100_000)
+    api.add_argument("--clients", type=int, default=16)
+    api.add_argument("--readers", type=int, default=4)
+    api.add_argument("--seconds", type=float, default=10)
+    api.add_argument("--seed", type=int, default=1)
+    api.set_defaults(func=bench_api)
+    pricing = commands.add_parser("pricing", help="per-row discount loop vs the NumPy pricing engine (needs NumPy)")
+    pricing.add_argument("--rows", type=int, default=1_000_000)
+    pricing.add_argument("--repeat", type=int, default=3)
+    pricing.set_defaults(func=bench_pricing)
+    promotions = commands.add_parser("promotions", help="starting and ending discount campaigns over the catalog")
+    promotions.add_argument("--rows", type=int, default=100_000)
+    promotions.add_argument("--repeat", type=int, default=100)
+    promotions.set_defaults(func=bench_promotions)
+    export = commands.add_parser("export", help="streaming export of the sales: rows/s and peak memory per format")
+    export.add_argument("--sizes", default="10000,1000000", help="comma-separated sale counts")
+    export.add_argument("--books", type=int, default=100_000)
+    export.add_argument("--chunk-size", type=int, default=10000)
+    export.set_defaults(func=bench_export)
+    startup = commands.add_parser("startup", help="cold start of bookstore_cli commands; fails over the budget")
+    startup.add_argument("--repeat", type=int, default=20)
+    startup.add_argument("--budget", type=float, default=100, help="milliseconds")
+    startup.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    startup.set_defaults(func=bench_startup)
+    trace = commands.add_parser("trace", help="cost of the db_tracing instrumentation per operation")
+    trace.add_argument("--rows", type=int, default=100_000)
+    trace.add_argument("--ops", type=int, default=2000)
+    trace.add_argument("--slow-ms", type=float, default=5, help="flag statements slower than this")
+    trace.add_argument("--output", help="also write the stats (.json, or Prometheus text otherwise)")
+    trace.set_defaults(func=bench_trace)
+    catalog = commands.add_parser("catalog", help="list scan vs Catalog indexes for the no-database apps")
+    catalog.add_argument("--books", type=int, default=200_000)
+    catalog.add_argument("--repeat", type=int, default=5)
+    catalog.set_defaults(func=bench_catalog)
+    memory = commands.add_parser("memory", help="bytes per book and per sale in the no-database apps")
+    memory.add_argument("--books", type=int, default=1_000_000)
+    memory.add_argument("--sales", type=int, default=1_000_000)
+    memory.set_defaults(func=bench_memory)
+    restart = commands.add_parser("restart", help="reopen time of the snapshot + journal store")
+    restart.add_argument("--books", type=int, default=1_000_000)
+    restart.add_argument("--journal", type=int, default=1000)
+    restart.set_defaults(func=bench_restart)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
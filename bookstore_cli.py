@@ -0,0 +1,187 @@
+"""One command line for bookstore.db, without starting a window toolkit.
+
+Usage:
+    python bookstore_cli.py list [--sort title] [--desc] [--limit 20] [--after CURSOR]
+    python bookstore_cli.py search "حافظ"
+    python bookstore_cli.py sell 12 15:2
+    python bookstore_cli.py sell --isbn 9780306406157
+    python bookstore_cli.py report [--top 5] [--days 7]
+    python bookstore_cli.py import feed.csv
+    python bookstore_cli.py export sales sales.csv.gz [--resume]
+    python bookstore_cli.py ui {tk,kivy,qt} [--memory]
+
+Every command takes --db (bookstore.db by default). Only the storage layer
+is imported up front; import and export load their modules when they run,
+and ui loads the chosen app and its toolkit only then. python bench.py
+startup keeps the cold start of a command under its budget.
+"""
+import argparse
+import os
+import sys
+
+from bookstore_db import SORT_COLUMNS, BookstoreDatabase, InsufficientStockError
+
+# The apps that ui starts, by toolkit and whether they run on the database or in memory
+UI_SCRIPTS = {
+    ("tk", False): "(SQLlite)نرم افزار کتاب داری با بانک اطلاعاتی.py",
+    ("tk", True): "نرم افزار کتاب داری بدون بانک اطلاعاتی.py",
+    ("kivy", False): "(SQLlite)kivy_نرم افزار کتاب داری با بانک اطلاعاتی.py",
+    ("kivy", True): "kivy-نرم افزار کتاب داری بدون بانک اطلاعاتی.py",
+    ("qt", False): "PyQt-نرم افزار کتاب داری با بانک اطلاعاتی(SQLlite).py",
+    ("qt", True): "PyQt-نرم افزار کتاب داری بدون بانک اطلاعاتی.py",
+}
+
+
+def print_books(books):
+    for book_id, title, author, price, stock, sold, discount, _ in books:
+        discount_text = f" (-{discount:g}٪)" if discount else ""
+        print(f"{book_id}\t{title}\t{author}\t{price:g} تومان{discount_text}\tموجودی {stock}\tفروش {sold}")
+
+
+def basket_line(text):
+    """Parse a "book[:quantity]" argument of sell."""
+    book, _, quantity = text.partition(":")
+    try:
+        quantity = int(quantity or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"تعداد نامعتبر: {text}")
+    return book, quantity
+
+
+def list_books(db, args):
+    books, _, last = db.get_books_page(args.after, args.limit, sort=args.sort, descending=args.desc)
+    print_books(books)
+    if len(books) == args.limit:
+        print(f"صفحه بعد: --after {last}", file=sys.stderr)
+
+
+def search(db, args):
+    books = db.search_books(args.text, args.limit)
+    if not books:
+        print("کتابی پیدا نشد.", file=sys.stderr)
+    print_books(books)
+
+
+def sell(db, args):
+    basket = []
+    for book, quantity in args.lines:
+        if args.isbn:
+            found = db.get_book_by_isbn(book)
+            if not found:
+                raise ValueError(f"کتابی با شابک {book} پیدا نشد.")
+            basket.append((found[0][0], quantity))
+        elif book.isdigit():
+            basket.append((int(book), quantity))
+        else:
+            raise ValueError(f"شناسه کتاب نامعتبر: {book}")
+    try:
+        db.checkout(basket)
+    except InsufficientStockError as e:
+        for book_id, requested, available in e.lines:
+            print(f"فروخته نشد: کتاب {book_id}، درخواست {requested}، "
+                  f"موجودی {'ناموجود' if available is None else available}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{sum(quantity for _, quantity in basket)} کتاب فروخته شد.")
+
+
+def report(db, args):
+    total_sales, today, top_books, top_authors, last_days = db.get_sales_report(args.top, args.days)
+    if not (total_sales and total_sales[0]):
+        print("هیچ فروشی ثبت نشده است.")
+        return
+    print(f"مجموع فروش: {total_sales[0]} کتاب، {total_sales[1]} تومان")
+    if today:
+        print(f"فروش امروز: {today[0][1]} کتاب، {today[0][2]} تومان")
+    print(f"فروش {args.days} روز گذشته: {last_days[0]} کتاب، {last_days[1]} تومان")
+    print("پرفروش‌ترین کتاب‌ها:")
+    for book_id, title, quantity, revenue in top_books:
+        print(f"  {title or book_id}: {quantity} کتاب، {revenue} تومان")
+    print("پرفروش‌ترین نویسندگان:")
+    for author, quantity, revenue in top_authors:
+        print(f"  {author}: {quantity} کتاب، {revenue} تومان")
+
+
+def import_catalog(db, args):
+    from catalog_import import import_file, show_report
+
+    show_report(import_file(db, args.path, args.chunk_size, args.format))
+
+
+def export(db, args):
+    from bookstore_export import export_table, progress_printer, show_report
+
+    show_report(export_table(db, args.table, args.path, args.format, args.gzip or None, args.chunk_size,
+                             args.resume, progress_printer()))
+
+
+def run_ui(args):
+    """Start one of the apps as if it had been run directly; its toolkit is imported only now."""
+    import runpy
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), UI_SCRIPTS[args.toolkit, args.memory])
+    sys.argv = [path]
+    runpy.run_path(path, run_name="__main__")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work with bookstore.db from the command line")
+    parser.add_argument("--db", default="bookstore.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    books = commands.add_parser("list", help="list the books a page at a time")
+    books.add_argument("--sort", choices=list(SORT_COLUMNS), default="id")
+    books.add_argument("--desc", action="store_true")
+    books.add_argument("--limit", type=int, default=20)
+    books.add_argument("--after", help="the cursor printed under the previous page")
+    books.set_defaults(func=list_books)
+
+    find = commands.add_parser("search", help="search titles and authors")
+    find.add_argument("text")
+    find.add_argument("--limit", type=int, default=20)
+    find.set_defaults(func=search)
+
+    sale = commands.add_parser("sell", help="sell book[:quantity] ... in one transaction")
+    sale.add_argument("lines", nargs="+", type=basket_line, metavar="book[:quantity]")
+    sale.add_argument("--isbn", action="store_true", help="the books are ISBN/EAN codes instead of ids")
+    sale.set_defaults(func=sell)
+
+    sales = commands.add_parser("report", help="sales totals and best sellers")
+    sales.add_argument("--top", type=int, default=3)
+    sales.add_argument("--days", type=int, default=30)
+    sales.set_defaults(func=report)
+
+    feed = commands.add_parser("import", help="import a catalog from CSV or JSONL (see catalog_import.py)")
+    feed.add_argument("path")
+    feed.add_argument("--format", choices=["csv", "jsonl"])
+    feed.add_argument("--chunk-size", type=int, default=5000)
+    feed.set_defaults(func=import_catalog)
+
+    dump = commands.add_parser("export", help="export books or sales (see bookstore_export.py)")
+    dump.add_argument("table", choices=["books", "sales"])
+    dump.add_argument("path")
+    dump.add_argument("--format", choices=["csv", "jsonl", "columnar"])
+    dump.add_argument("--gzip", action="store_true")
+    dump.add_argument("--chunk-size", type=int, default=10000)
+    dump.add_argument("--resume", action="store_true")
+    dump.set_defaults(func=export)
+
+    window = commands.add_parser("ui", help="start one of the apps")
+    window.add_argument("toolkit", choices=["tk", "kivy", "qt"])
+    window.add_argument("--memory", action="store_true", help="the app that keeps the books in memory")
+    args = parser.parse_args(argv)
+
+    if args.command == "ui":
+        # The apps open bookstore.db (or their snapshot files) themselves
+        run_ui(args)
+        return
+    db = BookstoreDatabase(args.db)
+    try:
+        args.func(db, args)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,996 @@
+"""Shared SQLite storage used by the tkinter, Kivy and PyQt front ends.
+
+Every front end opens bookstore.db through BookstoreDatabase, so they all get
+the same schema, the same migrations and the same connection tuning.
+
+Several registers (processes) may write to one bookstore.db at once: WAL lets
+them read while another writes, a connection waits BUSY_TIMEOUT seconds for
+the write lock, and a write that still finds the database locked is retried
+with backoff. Edits carry the version of the book they were based on, so an
+edit made from a stale read is refused instead of overwriting a sale.
+"""
+import base64
+import functools
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import isbn
+import persian_text
+
+# Columns returned for a book, in the order the front ends index them
+# discount is the larger of the book's own discount and the campaign running on it
+BOOK_COLUMNS = ("books.id, books.title, books.author, books.price, books.stock, books.sold, "
+                "MAX(books.discount, books.promo_discount) AS discount, books.version")
+
+# Columns that books can be paged by, mapped to their position in a books row
+SORT_COLUMNS = {"id": 0, "title": 1, "author": 2, "price": 3, "stock": 4}
+
+# Connection settings applied once when a database is opened
+PRAGMAS = {
+    "journal_mode": "WAL",        # readers no longer block the writer
+    "synchronous": "NORMAL",      # fsync at checkpoints instead of on every commit (safe with WAL)
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,     # negative means KiB, i.e. a 64 MB page cache
+    "temp_store": "MEMORY",
+}
+
+# sqlite3 keeps this many prepared statements per connection, keyed by SQL text,
+# so every query below is parsed once and then reused.
+STATEMENT_CACHE_SIZE = 256
+
+# Seconds a connection waits for another register's write lock before giving up
+BUSY_TIMEOUT = 5.0
+# Tries of a write that still found the database locked, backing off between them
+WRITE_ATTEMPTS = 5
+RETRY_BACKOFF = 0.05
+
+# How often the front ends start and end scheduled discount campaigns
+PROMOTION_CHECK_SECONDS = 60
+
+# Campaign columns that choose its books, in the order promotion_filter reads them
+PROMOTION_FIELDS = "author, min_price, max_price, min_stock, max_stock, book_ids"
+
+# The two statements import_books runs for each row, matching it on title + author
+UPDATE_IMPORTED = '''
+    UPDATE books SET price = ?, stock = ?, isbn = COALESCE(?, isbn), version = version + 1
+    WHERE title = ? AND author = ?
+'''
+INSERT_IMPORTED = '''
+    INSERT INTO books (title, author, price, stock, isbn) SELECT ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM books WHERE title = ? AND author = ?)
+'''
+
+
+def encode_cursor(sort, book):
+    """Build an opaque page cursor pointing at the given book row."""
+    raw = json.dumps([sort, book[SORT_COLUMNS[sort]], book[0]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return (sort, value, book_id) stored in a page cursor."""
+    try:
+        sort, value, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("نشانگر صفحه نامعتبر است.")
+    if sort not in SORT_COLUMNS:
+        raise ValueError("نشانگر صفحه نامعتبر است.")
+    return sort, value, book_id
+
+
+class InsufficientStockError(ValueError):
+    """Raised by checkout when one or more basket lines cannot be filled."""
+
+    def __init__(self, lines):
+        # (book_id, requested, available) per failing line; available is None for unknown books
+        self.lines = lines
+        details = "، ".join(
+            f"کتاب {book_id}: درخواست {requested}، موجودی {'نامشخص' if available is None else available}"
+            for book_id, requested, available in lines)
+        super().__init__(f"موجودی کافی نیست. {details}")
+
+
+class ConflictError(ValueError):
+    """Raised when a book was changed by someone else since it was read."""
+
+    def __init__(self):
+        super().__init__("این کتاب در این فاصله در صندوق دیگری تغییر کرده است؛ دوباره آن را باز کنید.")
+
+
+def retry_when_locked(method):
+    """Run a write again while another connection holds the database lock.
+
+    SQLite already waits BUSY_TIMEOUT for the lock, but some lock conflicts
+    fail at once instead (e.g. a read transaction that wants to write after
+    another register committed), so the whole write is rolled back and
+    repeated after a growing, randomized pause.
+    """
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                self.connection.rollback()
+                time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+    return write
+
+
+def promotion_time(value):
+    """Normalize a campaign time to "YYYY-MM-DD HH:MM:SS" (now when value is None)."""
+    try:
+        moment = datetime.now() if value is None else datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError("زمان نامعتبر است؛ به شکل YYYY-MM-DD HH:MM وارد کنید.")
+    return moment.isoformat(" ", timespec="seconds")
+
+
+def promotion_filter(fields):
+    """WHERE clause and parameters selecting the books of a campaign, from its PROMOTION_FIELDS.
+
+    Built from the fields that are set, so SQLite can use the index on that column.
+    """
+    author, min_price, max_price, min_stock, max_stock, book_ids = fields
+    conditions, params = [], ()
+    for value, condition in ((author, "author = ?"), (min_price, "price >= ?"), (max_price, "price <= ?"),
+                             (min_stock, "stock >= ?"), (max_stock, "stock <= ?"),
+                             (book_ids, "id IN (SELECT value FROM json_each(?))")):
+        if value is not None:
+            conditions.append(condition)
+            params += (value,)
+    return " AND ".join(conditions) or "1", params
+
+
+class BookstoreDatabase:
+    def __init__(self, path="bookstore.db", check_same_thread=True):
+        # check_same_thread=False is for connections handed between threads one at a time (see api_server)
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                                          check_same_thread=check_same_thread)
+        self.cursor = self.connection.cursor()
+        self.configure()
+        self.migrate()
+        if os.environ.get("BOOKSTORE_TRACE"):
+            # Imported only when asked for, so the apps and bookstore_cli start as fast without it
+            import db_tracing
+
+            db_tracing.environment_tracer().attach(self)
+
+    def configure(self):
+        """Apply the connection PRAGMAs."""
+        for name, value in PRAGMAS.items():
+            self.cursor.execute(f"PRAGMA {name} = {value}")
+
+    def migrations(self):
+        """Schema steps in order; a database at version N has run the first N of them."""
+        return [
+            self.create_tables,
+            self.create_title_author_index,
+            self.create_search_index,
+            self.create_sales_summaries,
+            self.create_secondary_indexes,
+            self.add_isbn,
+            self.add_book_versions,
+            self.create_sales_time_rollups,
+            self.create_promotions,
+            self.create_promotion_books,
+            self.fold_harakat_in_search,
+        ]
+
+    def migrate(self):
+        """Bring the schema up to date, recording progress in PRAGMA user_version.
+
+        Every step is written to be safe on databases created by the older
+        per-app classes, which have the tables but a user_version of 0.
+        """
+        self.cursor.execute("PRAGMA user_version")
+        version = self.cursor.fetchone()[0]
+        migrations = self.migrations()
+        if version > len(migrations):
+            raise RuntimeError(f"bookstore.db was created by a newer version (schema {version}).")
+        for number, migration in enumerate(migrations[version:], version + 1):
+            try:
+                self.cursor.execute("BEGIN")
+                migration()
+                self.cursor.execute(f"PRAGMA user_version = {number}")
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+
+    def add_column(self, table, column, definition):
+        """Add a column to a table created by an older version of the app."""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in self.cursor.fetchall()]:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def create_tables(self):
+        # Create table for books and sales if they do not exist
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                price REAL NOT NULL,
+                stock INTEGER NOT NULL,
+                sold INTEGER DEFAULT 0,
+                discount REAL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_id INTEGER,
+                quantity INTEGER,
+                total_price REAL,
+                sold_at TEXT DEFAULT (datetime('now', 'localtime')),
+                FOREIGN KEY(book_id) REFERENCES books(id)
+            )
+        ''')
+
+    def create_title_author_index(self):
+        # Natural key used to match books when importing catalogs
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_title_author ON books (title, author)
+        ''')
+
+    def create_search_index(self):
+        """Create the FTS5 index over title/author and the triggers that keep it in sync."""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'")
+        exists = self.cursor.fetchone() is not None
+        self.cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts
+            USING fts5(title, author, tokenize = 'unicode61 remove_diacritics 2')
+        ''')
+        self.create_search_triggers()
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+                DELETE FROM books_fts WHERE rowid = old.id;
+            END
+        ''')
+        if not exists:
+            # Index the books that were added before the index existed
+            self.index_books_for_search()
+
+    def create_search_triggers(self):
+        """Triggers that index a book's title and author, folded by persian_text, as they are written."""
+        title, author = persian_text.normalize_sql("new.title"), persian_text.normalize_sql("new.author")
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+                INSERT INTO books_fts (rowid, title, author) VALUES (new.id, {title}, {author});
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+                UPDATE books_fts SET title = {title}, author = {author} WHERE rowid = new.id;
+            END
+        ''')
+
+    def index_books_for_search(self):
+        self.cursor.execute(f'''
+            INSERT INTO books_fts (rowid, title, author)
+            SELECT id, {persian_text.normalize_sql("title")}, {persian_text.normalize_sql("author")} FROM books
+        ''')
+
+    def fold_harakat_in_search(self):
+        """Re-create the search triggers with the harakat folded too, and index every book again."""
+        self.cursor.execute("DROP TRIGGER IF EXISTS books_fts_insert")
+        self.cursor.execute("DROP TRIGGER IF EXISTS books_fts_update")
+        self.create_search_triggers()
+        self.cursor.execute("DELETE FROM books_fts")
+        self.index_books_for_search()
+
+    def create_sales_summaries(self):
+        """Create summary tables that triggers keep up to date on every sale."""
+        # Older databases have no sale timestamps; new sales set it explicitly
+        self.add_column("sales", "sold_at", "TEXT")
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sales_totals'")
+        exists = self.cursor.fetchone() is not None
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                sales INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_by_book (
+                book_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_by_author (
+                author TEXT PRIMARY KEY NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_by_day (
+                day TEXT PRIMARY KEY NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        # new.* is added on insert and old.* subtracted on delete, so each sale costs four key updates
+        for name, event, row, sign in (("sales_summary_insert", "INSERT", "new", "+"),
+                                       ("sales_summary_delete", "DELETE", "old", "-")):
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON sales BEGIN
+                    UPDATE sales_totals SET quantity = quantity {sign} {row}.quantity,
+                                            revenue = revenue {sign} {row}.total_price,
+                                            sales = sales {sign} 1 WHERE id = 1;
+                    INSERT INTO sales_by_book (book_id, quantity, revenue)
+                        VALUES ({row}.book_id, {sign}{row}.quantity, {sign}{row}.total_price)
+                        ON CONFLICT (book_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                            revenue = revenue + excluded.revenue;
+                    INSERT INTO sales_by_author (author, quantity, revenue)
+                        VALUES (COALESCE((SELECT author FROM books WHERE id = {row}.book_id), ''),
+                                {sign}{row}.quantity, {sign}{row}.total_price)
+                        ON CONFLICT (author) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                           revenue = revenue + excluded.revenue;
+                    INSERT INTO sales_by_day (day, quantity, revenue)
+                        SELECT date({row}.sold_at), {sign}{row}.quantity, {sign}{row}.total_price
+                        WHERE {row}.sold_at IS NOT NULL
+                        ON CONFLICT (day) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                        revenue = revenue + excluded.revenue;
+                END
+            ''')
+        if not exists:
+            # Summarise the sales recorded before the summary tables existed
+            self.cursor.execute('''
+                INSERT INTO sales_totals (id, quantity, revenue, sales)
+                SELECT 1, COALESCE(SUM(quantity), 0), COALESCE(SUM(total_price), 0), COUNT(*) FROM sales
+            ''')
+            self.cursor.execute('''
+                INSERT INTO sales_by_book (book_id, quantity, revenue)
+                SELECT book_id, SUM(quantity), SUM(total_price) FROM sales
+                WHERE book_id IS NOT NULL GROUP BY book_id
+            ''')
+            self.cursor.execute('''
+                INSERT INTO sales_by_author (author, quantity, revenue)
+                SELECT COALESCE(books.author, ''), SUM(quantity), SUM(total_price)
+                FROM sales LEFT JOIN books ON books.id = sales.book_id
+                GROUP BY COALESCE(books.author, '')
+            ''')
+            self.cursor.execute('''
+                INSERT INTO sales_by_day (day, quantity, revenue)
+                SELECT date(sold_at), SUM(quantity), SUM(total_price) FROM sales
+                WHERE sold_at IS NOT NULL GROUP BY date(sold_at)
+            ''')
+
+    def create_secondary_indexes(self):
+        """Index every column the front ends sort, join or rank by.
+
+        SQLite appends the rowid to every index, so books(price) is really
+        (price, id): exactly the keyset get_books_page seeks and orders by.
+        idx_books_title_author stays for import matching, but it cannot order
+        by (title, id), so title gets its own index. Run `python bench.py plans`
+        after changing a query to check none of them falls back to a scan.
+        """
+        for name, table, columns in (
+            ("idx_books_title", "books", "title"),
+            ("idx_books_author", "books", "author"),
+            ("idx_books_price", "books", "price"),
+            ("idx_books_stock", "books", "stock"),
+            # Covering: per-book sales totals are read without touching the sales rows
+            ("idx_sales_book", "sales", "book_id, quantity, total_price"),
+            ("idx_sales_by_book_revenue", "sales_by_book", "revenue"),
+            ("idx_sales_by_author_revenue", "sales_by_author", "revenue"),
+        ):
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+    def add_isbn(self):
+        """Store each book's 13-digit ISBN so a scanned barcode finds it with one index probe."""
+        self.add_column("books", "isbn", "TEXT")
+        # Partial, so the books nobody has scanned in yet can all stay NULL
+        self.cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn ON books (isbn) WHERE isbn IS NOT NULL
+        ''')
+
+    def add_book_versions(self):
+        """Count the changes to each book so concurrent edits can detect each other."""
+        self.add_column("books", "version", "INTEGER NOT NULL DEFAULT 0")
+
+    def create_sales_time_rollups(self):
+        """Index sales by time and keep an hourly rollup next to the daily one.
+
+        The index covers quantity and total_price, so the sales of any time
+        range are summed from the index alone; sales_by_hour lets an
+        end-of-day report read at most 24 rows.
+        """
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sales_sold_at ON sales (sold_at, quantity, total_price)
+        ''')
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sales_by_hour'")
+        exists = self.cursor.fetchone() is not None
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_by_hour (
+                hour TEXT PRIMARY KEY NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        for name, event, row, sign in (("sales_by_hour_insert", "INSERT", "new", "+"),
+                                       ("sales_by_hour_delete", "DELETE", "old", "-")):
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON sales WHEN {row}.sold_at IS NOT NULL BEGIN
+                    INSERT INTO sales_by_hour (hour, quantity, revenue)
+                        VALUES (strftime('%Y-%m-%d %H', {row}.sold_at), {sign}{row}.quantity, {sign}{row}.total_price)
+                        ON CONFLICT (hour) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                         revenue = revenue + excluded.revenue;
+                END
+            ''')
+        if not exists:
+            # Summarise the sales recorded before the hourly rollup existed
+            self.cursor.execute('''
+                INSERT INTO sales_by_hour (hour, quantity, revenue)
+                SELECT strftime('%Y-%m-%d %H', sold_at), SUM(quantity), SUM(total_price) FROM sales
+                WHERE sold_at IS NOT NULL GROUP BY strftime('%Y-%m-%d %H', sold_at)
+            ''')
+
+    def create_promotions(self):
+        """Scheduled discount campaigns, and the discount the running ones give each book.
+
+        books.promo_discount is written when a campaign starts or ends, so
+        reading a price never has to evaluate the campaigns.
+        """
+        self.add_column("books", "promo_discount", "REAL NOT NULL DEFAULT 0")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promotions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                discount REAL NOT NULL,
+                starts_at TEXT NOT NULL,
+                ends_at TEXT,
+                author TEXT,
+                min_price REAL,
+                max_price REAL,
+                min_stock INTEGER,
+                max_stock INTEGER,
+                book_ids TEXT,
+                active INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    def create_promotion_books(self):
+        """The books each running campaign covered when it started.
+
+        Ending a campaign resets exactly these books, whatever happened to
+        their stock, price or author while it ran.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promotion_books (
+                promotion_id INTEGER NOT NULL,
+                book_id INTEGER NOT NULL,
+                PRIMARY KEY (promotion_id, book_id)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_promotion_books_book ON promotion_books (book_id, promotion_id)
+        ''')
+        # Campaigns already running were recorded by their filters only; take the books they discount now
+        self.cursor.execute(f'''
+            SELECT id, discount, {PROMOTION_FIELDS} FROM promotions WHERE active = 1
+        ''')
+        for promotion in self.cursor.fetchall():
+            where, params = promotion_filter(promotion[2:])
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO promotion_books (promotion_id, book_id)
+                SELECT ?, id FROM books WHERE {where} AND promo_discount >= ?
+            ''', (promotion[0],) + params + (promotion[1],))
+
+    def check_version(self, book_id, version):
+        """Raise for an update that matched no row: ConflictError if the book still exists."""
+        self.connection.rollback()
+        self.cursor.execute('''
+            SELECT version FROM books WHERE id = ?
+        ''', (book_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError("کتاب پیدا نشد.")
+        raise ConflictError()
+
+    @retry_when_locked
+    def add_book(self, title, author, price, stock, code=None):
+        """Add a book, optionally with its ISBN/EAN barcode, and return its id."""
+        try:
+            self.cursor.execute('''
+                INSERT INTO books (title, author, price, stock, isbn)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, author, price, stock, isbn.normalize(code) if code else None))
+        except sqlite3.IntegrityError:
+            self.connection.rollback()
+            raise ValueError("این شابک برای کتاب دیگری ثبت شده است.")
+        self.connection.commit()
+        return self.cursor.lastrowid
+
+    @retry_when_locked
+    def set_isbn(self, book_id, code):
+        """Give a book its ISBN/EAN barcode, or remove it with code=None."""
+        try:
+            self.cursor.execute('''
+                UPDATE books SET isbn = ? WHERE id = ?
+            ''', (isbn.normalize(code) if code else None, book_id))
+        except sqlite3.IntegrityError:
+            self.connection.rollback()
+            raise ValueError("این شابک برای کتاب دیگری ثبت شده است.")
+        self.connection.commit()
+
+    def import_books(self, rows, chunk_size=1000, rejected=None):
+        """Upsert (title, author, price, stock[, isbn[, line]]) rows in chunks, one transaction per chunk.
+
+        Rows are matched on title + author: existing books get the new price
+        and stock (and ISBN, when the row has one), the rest are inserted.
+        A row whose ISBN already belongs to another book is skipped and
+        rejected(line, message) is called for it; the rest of its chunk is
+        still written. Returns the number of rows written.
+        """
+        written = 0
+        chunk = {}
+
+        def write_chunk():
+            skipped = self._import_chunk(chunk)
+            for line, code in skipped:
+                if rejected:
+                    rejected(line, f"شابک {code} برای کتاب دیگری ثبت شده است.")
+            return len(chunk) - len(skipped)
+
+        for title, author, price, stock, *extra in rows:
+            code = isbn.normalize(extra[0]) if extra and extra[0] else None
+            chunk[(title, author)] = (price, stock, code, extra[1] if len(extra) > 1 else None)
+            if len(chunk) >= chunk_size:
+                written += write_chunk()
+                chunk = {}
+        if chunk:
+            written += write_chunk()
+        return written
+
+    @retry_when_locked
+    def _import_chunk(self, chunk):
+        """Write one chunk and return (line, isbn) of the rows skipped for a duplicate ISBN."""
+        try:
+            try:
+                self.cursor.executemany(UPDATE_IMPORTED, [
+                    (price, stock, code, title, author) for (title, author), (price, stock, code, _) in chunk.items()])
+                self.cursor.executemany(INSERT_IMPORTED, [
+                    (title, author, price, stock, code, title, author)
+                    for (title, author), (price, stock, code, _) in chunk.items()])
+                skipped = []
+            except sqlite3.IntegrityError:
+                # Some ISBN is taken: write the chunk again a row at a time to find out which.
+                # A failed statement only undoes itself, so the other rows stay in the transaction.
+                self.connection.rollback()
+                skipped = []
+                for (title, author), (price, stock, code, line) in chunk.items():
+                    try:
+                        self.cursor.execute(UPDATE_IMPORTED, (price, stock, code, title, author))
+                        self.cursor.execute(INSERT_IMPORTED, (title, author, price, stock, code, title, author))
+                    except sqlite3.IntegrityError:
+                        skipped.append((line, code))
+            self.connection.commit()
+            return skipped
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def get_books_page(self, cursor=None, limit=5, sort="id", backward=False, descending=False, search=None):
+        """Seek to the page after (or before) a cursor instead of skipping rows with OFFSET.
+
+        Returns (books, first_cursor, last_cursor). Pass last_cursor to get the
+        next page and first_cursor with backward=True to get the previous one.
+        search restricts the pages to books matching the full-text index.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"ستون مرتب‌سازی نامعتبر: {sort}")
+        # Walking backward through a descending list is an ascending scan, and vice versa
+        op, order = ("<", "DESC") if backward != descending else (">", "ASC")
+        conditions, params = [], ()
+        if cursor is not None:
+            cursor_sort, value, book_id = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ValueError("نشانگر صفحه با ترتیب فعلی سازگار نیست.")
+            if sort == "id":
+                conditions.append(f"id {op} ?")
+                params += (book_id,)
+            else:
+                conditions.append(f"({sort}, id) {op} (?, ?)")
+                params += (value, book_id)
+        if search is not None:
+            query = persian_text.match_query(search)
+            if query is None:
+                return [], None, None
+            conditions.append("id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+            params += (query,)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        if sort == "id":
+            order_by = f"id {order}"
+        else:
+            order_by = f"{sort} {order}, id {order}"
+        self.cursor.execute(f'''
+            SELECT {BOOK_COLUMNS} FROM books {where} ORDER BY {order_by} LIMIT ?
+        ''', params + (limit,))
+        books = self.cursor.fetchall()
+        if backward:
+            books.reverse()
+        if not books:
+            return books, None, None
+        return books, encode_cursor(sort, books[0]), encode_cursor(sort, books[-1])
+
+    def get_book(self, book_id):
+        """Return one book row, or None."""
+        self.cursor.execute(f'''
+            SELECT {BOOK_COLUMNS} FROM books WHERE id = ?
+        ''', (book_id,))
+        return self.cursor.fetchone()
+
+    def get_book_by_title(self, title):
+        """Find books whose title words start with the given words, best match first."""
+        query = persian_text.match_query(title, column="title")
+        if query is None:
+            # Nothing the index can match on (e.g. only punctuation); fall back to a scan
+            self.cursor.execute(f'''
+                SELECT {BOOK_COLUMNS} FROM books WHERE title LIKE ?
+            ''', ('%' + title + '%',))
+            return self.cursor.fetchall()
+        self.cursor.execute(f'''
+            SELECT {BOOK_COLUMNS} FROM books_fts JOIN books ON books.id = books_fts.rowid
+            WHERE books_fts MATCH ? ORDER BY bm25(books_fts, 2.0, 1.0)
+        ''', (query,))
+        return self.cursor.fetchall()
+
+    def get_book_by_isbn(self, code):
+        """Find the book with a scanned ISBN/EAN; returns a list like get_book_by_title."""
+        self.cursor.execute(f'''
+            SELECT {BOOK_COLUMNS} FROM books WHERE isbn = ?
+        ''', (isbn.normalize(code),))
+        return self.cursor.fetchall()
+
+    def get_top_selling_isbns(self, limit=500):
+        """Return (isbn, book_id, title) of the best-selling books that have an ISBN."""
+        self.cursor.execute('''
+            SELECT books.isbn, books.id, books.title
+            FROM sales_by_book s JOIN books ON books.id = s.book_id
+            WHERE books.isbn IS NOT NULL ORDER BY s.revenue DESC LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+
+    def search_books(self, text, limit=50, candidates=None):
+        """Ranked prefix search over both title and author.
+
+        With candidates, only the first that many index matches are ranked, so
+        a one-letter query costs the same as a precise one (used while typing).
+        """
+        query = persian_text.match_query(text)
+        if query is None:
+            return []
+        if candidates:
+            self.cursor.execute(f'''
+                SELECT {BOOK_COLUMNS} FROM (
+                    SELECT rowid, bm25(books_fts, 2.0, 1.0) AS score FROM books_fts
+                    WHERE books_fts MATCH ? LIMIT ?
+                ) matches JOIN books ON books.id = matches.rowid
+                ORDER BY matches.score LIMIT ?
+            ''', (query, candidates, limit))
+        else:
+            self.cursor.execute(f'''
+                SELECT {BOOK_COLUMNS} FROM books_fts JOIN books ON books.id = books_fts.rowid
+                WHERE books_fts MATCH ? ORDER BY bm25(books_fts, 2.0, 1.0) LIMIT ?
+            ''', (query, limit))
+        return self.cursor.fetchall()
+
+    @retry_when_locked
+    def update_book(self, book_id, title, author, price, stock, version=None):
+        """Change a book's details.
+
+        Pass the version the book was read with: if anyone changed the book
+        since (another edit, or a sale that moved its stock), nothing is
+        written and ConflictError is raised.
+        """
+        self.cursor.execute('''
+            UPDATE books SET title = ?, author = ?, price = ?, stock = ?, version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
+        ''', (title, author, price, stock, book_id, version, version))
+        if self.cursor.rowcount == 0 and version is not None:
+            self.check_version(book_id, version)
+        self.connection.commit()
+
+    @retry_when_locked
+    def delete_book(self, book_id):
+        self.cursor.execute('''
+            DELETE FROM books WHERE id = ?
+        ''', (book_id,))
+        self.connection.commit()
+
+    @retry_when_locked
+    def apply_discount(self, book_id, discount_percentage, version=None):
+        """Set a book's discount; version works as in update_book."""
+        self.cursor.execute('''
+            UPDATE books SET discount = ?, version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
+        ''', (discount_percentage, book_id, version, version))
+        if self.cursor.rowcount == 0 and version is not None:
+            self.check_version(book_id, version)
+        self.connection.commit()
+
+    @retry_when_locked
+    def record_sale(self, book_id, quantity, total_price):
+        self.cursor.execute('''
+            INSERT INTO sales (book_id, quantity, total_price, sold_at)
+            VALUES (?, ?, ?, datetime('now', 'localtime'))
+        ''', (book_id, quantity, total_price))
+        self.connection.commit()
+
+    @retry_when_locked
+    def checkout(self, basket):
+        """Sell a basket of (book_id, quantity) lines in a single transaction.
+
+        Stock is decremented with a conditional UPDATE so concurrent registers
+        can never oversell. If any line cannot be filled nothing is written and
+        InsufficientStockError lists every failing line. The transaction
+        takes the write lock up front (BEGIN IMMEDIATE), so two registers
+        never both read stock and then race to write it.
+        """
+        quantities = self._basket_quantities(basket)
+        if not quantities:
+            return
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self._sell(quantities)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    @retry_when_locked
+    def checkout_many(self, baskets):
+        """Sell several baskets with a single commit, e.g. sales that arrived together at the API server.
+
+        Each basket is still all or nothing: it runs in its own savepoint and
+        a basket that cannot be filled is rolled back alone. Returns one entry
+        per basket, None if it was sold or the ValueError that refused it.
+        """
+        results = []
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            for basket in baskets:
+                self.cursor.execute("SAVEPOINT basket")
+                try:
+                    self._sell(self._basket_quantities(basket))
+                except ValueError as e:
+                    self.cursor.execute("ROLLBACK TO basket")
+                    results.append(e)
+                else:
+                    results.append(None)
+                self.cursor.execute("RELEASE basket")
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return results
+
+    @retry_when_locked
+    def add_promotion(self, name, discount, starts_at=None, ends_at=None, author=None, min_price=None,
+                      max_price=None, min_stock=None, max_stock=None, book_ids=None):
+        """Schedule a discount campaign and return its id.
+
+        The campaign covers the books matching every given field (all books if
+        none is given) from starts_at (now by default) until ends_at (open
+        ended by default); times are "YYYY-MM-DD[ HH:MM[:SS]]" in local time.
+        If it has already started it is applied in the same transaction.
+        """
+        if not 0 < discount <= 100:
+            raise ValueError("درصد تخفیف باید بیشتر از ۰ و حداکثر ۱۰۰ باشد.")
+        now = promotion_time(None)
+        starts_at = promotion_time(starts_at) if starts_at else now
+        ends_at = promotion_time(ends_at) if ends_at else None
+        if ends_at is not None and ends_at <= starts_at:
+            raise ValueError("پایان کمپین باید بعد از شروع آن باشد.")
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute(f'''
+                INSERT INTO promotions (name, discount, starts_at, ends_at, {PROMOTION_FIELDS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (name, discount, starts_at, ends_at, author, min_price, max_price, min_stock, max_stock,
+                  None if book_ids is None else json.dumps([int(book_id) for book_id in book_ids])))
+            promotion_id = self.cursor.lastrowid
+            self._apply_promotions(now)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return promotion_id
+
+    @retry_when_locked
+    def end_promotion(self, promotion_id):
+        """End a campaign now (or cancel one that has not started yet)."""
+        now = promotion_time(None)
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            self.cursor.execute('''
+                UPDATE promotions SET ends_at = ? WHERE id = ? AND (ends_at IS NULL OR ends_at > ?)
+            ''', (now, promotion_id, now))
+            self._apply_promotions(now)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    @retry_when_locked
+    def refresh_promotions(self, now=None):
+        """Start the campaigns whose time has come and end the expired ones, in one transaction.
+
+        Returns (ids started, ids ended); the front ends call it every
+        PROMOTION_CHECK_SECONDS.
+        """
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            changed = self._apply_promotions(promotion_time(now))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return changed
+
+    def _apply_promotions(self, now):
+        """Bring books.promo_discount in line with the campaigns running at now, inside the caller's transaction.
+
+        Each campaign that starts or ends costs one set-based UPDATE over its
+        own books. Which books a campaign covers is decided when it starts and
+        kept in promotion_books, so a book that later drops below a campaign's
+        min_stock keeps the discount until the campaign ends, and then loses it.
+        """
+        self.cursor.execute(f'''
+            SELECT id, discount, {PROMOTION_FIELDS} FROM promotions
+            WHERE active = 0 AND starts_at <= ? AND (ends_at IS NULL OR ends_at > ?)
+        ''', (now, now))
+        starting = self.cursor.fetchall()
+        self.cursor.execute(f'''
+            SELECT id, discount, {PROMOTION_FIELDS} FROM promotions
+            WHERE active = 1 AND ends_at IS NOT NULL AND ends_at <= ?
+        ''', (now,))
+        ending = self.cursor.fetchall()
+        self.cursor.executemany('''
+            UPDATE promotions SET active = ? WHERE id = ?
+        ''', [(1, promotion[0]) for promotion in starting] + [(0, promotion[0]) for promotion in ending])
+        for promotion in ending:
+            # Fall back to the best campaign still running on each of its books, if any
+            self.cursor.execute('''
+                UPDATE books SET promo_discount = COALESCE((
+                    SELECT MAX(p.discount) FROM promotion_books pb JOIN promotions p ON p.id = pb.promotion_id
+                    WHERE pb.book_id = books.id AND p.active = 1
+                ), 0) WHERE id IN (SELECT book_id FROM promotion_books WHERE promotion_id = ?)
+            ''', (promotion[0],))
+            self.cursor.execute('''
+                DELETE FROM promotion_books WHERE promotion_id = ?
+            ''', (promotion[0],))
+        for promotion in starting:
+            where, params = promotion_filter(promotion[2:])
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO promotion_books (promotion_id, book_id) SELECT ?, id FROM books WHERE {where}
+            ''', (promotion[0],) + params)
+            self.cursor.execute('''
+                UPDATE books SET promo_discount = ?
+                WHERE id IN (SELECT book_id FROM promotion_books WHERE promotion_id = ?) AND promo_discount < ?
+            ''', (promotion[1], promotion[0], promotion[1]))
+        return [promotion[0] for promotion in starting], [promotion[0] for promotion in ending]
+
+    def get_promotions(self):
+        """Return (id, name, discount, starts_at, ends_at, active) for every campaign, newest first."""
+        self.cursor.execute('''
+            SELECT id, name, discount, starts_at, ends_at, active FROM promotions ORDER BY id DESC
+        ''')
+        return self.cursor.fetchall()
+
+    def _basket_quantities(self, basket):
+        quantities = {}
+        for book_id, quantity in basket:
+            if quantity <= 0:
+                raise ValueError("تعداد باید بیشتر از صفر باشد.")
+            quantities[book_id] = quantities.get(book_id, 0) + quantity
+        return quantities
+
+    def _sell(self, quantities):
+        """Take {book_id: quantity} out of stock and record the sales, inside the caller's transaction."""
+        failed = []
+        for book_id, quantity in quantities.items():
+            self.cursor.execute('''
+                UPDATE books SET stock = stock - ?, sold = sold + ?, version = version + 1
+                WHERE id = ? AND stock >= ?
+            ''', (quantity, quantity, book_id, quantity))
+            if self.cursor.rowcount == 0:
+                self.cursor.execute('''
+                    SELECT stock FROM books WHERE id = ?
+                ''', (book_id,))
+                row = self.cursor.fetchone()
+                failed.append((book_id, quantity, row[0] if row else None))
+        if failed:
+            raise InsufficientStockError(failed)
+        self.cursor.executemany('''
+            INSERT INTO sales (book_id, quantity, total_price, sold_at)
+            SELECT id, ?, price * ? * (1 - MAX(discount, promo_discount) / 100), datetime('now', 'localtime')
+            FROM books WHERE id = ?
+        ''', [(quantity, quantity, book_id) for book_id, quantity in quantities.items()])
+
+    def get_total_sales(self):
+        """Return (books sold, revenue) from the running totals."""
+        self.cursor.execute('''
+            SELECT quantity, revenue FROM sales_totals WHERE id = 1
+        ''')
+        return self.cursor.fetchone()
+
+    def get_sales_by_book(self, limit=10):
+        """Return (book_id, title, quantity, revenue) for the best-selling books."""
+        self.cursor.execute('''
+            SELECT s.book_id, books.title, s.quantity, s.revenue
+            FROM sales_by_book s LEFT JOIN books ON books.id = s.book_id
+            ORDER BY s.revenue DESC LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+
+    def get_sales_by_author(self, limit=10):
+        """Return (author, quantity, revenue) for the best-selling authors."""
+        self.cursor.execute('''
+            SELECT author, quantity, revenue FROM sales_by_author
+            ORDER BY revenue DESC LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+
+    def get_sales_by_day(self, start=None, end=None):
+        """Return (day, quantity, revenue) for each day between start and end (YYYY-MM-DD, inclusive)."""
+        self.cursor.execute('''
+            SELECT day, quantity, revenue FROM sales_by_day
+            WHERE day >= ? AND day <= ? ORDER BY day
+        ''', (start or "", end or "9999-12-31"))
+        return self.cursor.fetchall()
+
+    def get_sales_by_hour(self, start=None, end=None):
+        """Return (hour, quantity, revenue) for each hour between start and end ("YYYY-MM-DD HH", inclusive)."""
+        self.cursor.execute('''
+            SELECT hour, quantity, revenue FROM sales_by_hour
+            WHERE hour >= ? AND hour <= ? ORDER BY hour
+        ''', (start or "", end or "9999-12-31 23"))
+        return self.cursor.fetchall()
+
+    def get_period_totals(self, start, end):
+        """Return (quantity, revenue) for the days from start to end (YYYY-MM-DD, inclusive)."""
+        self.cursor.execute('''
+            SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(revenue), 0) FROM sales_by_day
+            WHERE day >= ? AND day <= ?
+        ''', (start, end))
+        return self.cursor.fetchone()
+
+    def get_sales_between(self, start, end):
+        """Return (quantity, revenue) for the sales from start up to, not including, end.
+
+        start and end are "YYYY-MM-DD HH:MM:SS" in local time, like sold_at.
+        """
+        self.cursor.execute('''
+            SELECT COALESCE(SUM(quantity), 0), COALESCE(SUM(total_price), 0) FROM sales
+            WHERE sold_at >= ? AND sold_at < ?
+        ''', (start, end))
+        return self.cursor.fetchone()
+
+    def data_version(self):
+        """A value that changes whenever any connection commits a change to the database."""
+        self.cursor.execute("PRAGMA data_version")
+        # data_version only moves for other connections' commits; total_changes covers our own
+        return self.cursor.fetchone()[0], self.connection.total_changes
+
+    def get_sales_report(self, top=3, days=30):
+        """Return (totals, today's sales, best-selling books, best-selling authors, the last days' totals) in one call."""
+        today = date.today()
+        return (self.get_total_sales(), self.get_sales_by_day(today.isoformat(), today.isoformat()),
+                self.get_sales_by_book(top), self.get_sales_by_author(top),
+                self.get_period_totals((today - timedelta(days=days - 1)).isoformat(), today.isoformat()))
+
+    def close(self):
+        self.connection.close()
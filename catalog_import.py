@@ -0,0 +1,124 @@
+"""Stream a supplier catalog (CSV or JSONL) into bookstore.db.
+
+Usage:
+    python catalog_import.py feed.csv [--db bookstore.db] [--chunk-size 5000]
+
+CSV files need a header row with title, author, price and stock columns
+and may add an isbn column; JSONL files hold one object per line with the
+same keys. Books are matched on
+title + author: existing ones get the new price and stock, others are added.
+Lines that are invalid, or whose ISBN already belongs to another book, are
+skipped and listed with their line numbers.
+"""
+import argparse
+import csv
+import json
+import time
+
+import isbn
+from bookstore_db import BookstoreDatabase
+
+# Only the first invalid lines are kept so a broken feed cannot exhaust memory
+MAX_REPORTED_ERRORS = 100
+
+
+def read_records(path, file_format=None):
+    """Yield (line_number, record) from a CSV or JSONL file without loading it all.
+
+    A record is a dict, or None when the line could not be parsed.
+    """
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield line_number, record if isinstance(record, dict) else None
+
+
+def parse_book(title, author, price, stock, code=None):
+    """Validate one book the same way the add-book forms do."""
+    title = (title or "").strip()
+    author = (author or "").strip()
+    try:
+        price = float(price)
+        stock = int(stock)
+    except (TypeError, ValueError):
+        raise ValueError("قیمت یا موجودی معتبر وارد کنید.")
+    if not title or not author:
+        raise ValueError("لطفا عنوان و نویسنده را وارد کنید.")
+    code = str(code or "").strip()
+    return title, author, price, stock, isbn.normalize(code) if code else None
+
+
+def skip_line(report, line_number, message):
+    """Count a line that was not imported and list it if there is still room."""
+    report["skipped"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append((line_number, message))
+
+
+def valid_books(records, report):
+    """Yield validated (title, author, price, stock, isbn, line_number) rows.
+
+    Invalid lines are counted in report["skipped"] and the first few are
+    listed in report["errors"] as (line_number, message).
+    """
+    for line_number, record in records:
+        try:
+            if record is None:
+                raise ValueError("سطر قابل خواندن نیست.")
+            yield parse_book(record.get("title"), record.get("author"), record.get("price"), record.get("stock"),
+                             record.get("isbn")) + (line_number,)
+        except ValueError as e:
+            skip_line(report, line_number, str(e))
+
+
+def import_file(db, path, chunk_size=1000, file_format=None):
+    """Import a catalog file into db and return a report of what happened.
+
+    Lines whose ISBN is already another book's are skipped and reported
+    like invalid ones.
+    """
+    report = {"imported": 0, "skipped": 0, "errors": []}
+    start = time.perf_counter()
+    report["imported"] = db.import_books(valid_books(read_records(path, file_format), report), chunk_size,
+                                         lambda line_number, message: skip_line(report, line_number, message))
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def show_report(report):
+    for line_number, message in report["errors"][:20]:
+        print(f"line {line_number}: {message}")
+    if report["skipped"] > 20:
+        print(f"... and {report['skipped'] - 20} more skipped lines")
+    rate = report["imported"] / report["seconds"] if report["seconds"] else 0
+    print(f"imported {report['imported']} books, skipped {report['skipped']} lines "
+          f"in {report['seconds']:.2f}s ({rate:.0f} rows/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a book catalog from CSV or JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--db", default="bookstore.db")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    db = BookstoreDatabase(args.db)
+    report = import_file(db, args.path, args.chunk_size, args.format)
+    db.close()
+    show_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Opt-in latency tracing for BookstoreDatabase.
+
+Set BOOKSTORE_TRACE to a file name and every BookstoreDatabase the process
+opens is instrumented:
+
+    BOOKSTORE_TRACE=trace.json python "(SQLlite)نرم افزار کتاب داری با بانک اطلاعاتی.py"
+    BOOKSTORE_TRACE=/var/lib/node_exporter/bookstore.prom python api_server.py
+
+The stats are written there every DUMP_SECONDS and on exit, as JSON when the
+name ends in .json and in the Prometheus text format otherwise (a node
+exporter's textfile collector can pick the file up as it is).
+
+A QueryTracer records, each as a latency histogram with the rows returned:
+
+- every public BookstoreDatabase method, i.e. every button press and API
+  call, since the front ends call exactly one method per action;
+- every statement run through db.cursor, timed from execute to the last
+  fetch, because SQLite does most of a SELECT's work while rows are fetched;
+- every commit (WAL files are only fsynced at checkpoints under
+  synchronous=NORMAL, so slow commits point at checkpoints).
+
+Statements slower than BOOKSTORE_TRACE_SLOW_MS (SLOW_MS by default) are kept
+with their parameters and EXPLAIN QUERY PLAN, explained with those same
+parameters.
+
+BOOKSTORE_TRACE_STATEMENTS=1 also hooks sqlite3's trace callback to count,
+per method, every statement SQLite runs, including the ones run by triggers
+and by the FTS5 index behind search. That exposes hidden work a method
+causes, but the callback runs for each of FTS5's internal statements and
+adds about a millisecond to a search, so it is off by default.
+
+Without BOOKSTORE_TRACE nothing here is imported.
+"""
+import atexit
+import bisect
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from bookstore_db import BOOK_COLUMNS
+
+TRACE_ENV = "BOOKSTORE_TRACE"
+SLOW_ENV = "BOOKSTORE_TRACE_SLOW_MS"
+STATEMENTS_ENV = "BOOKSTORE_TRACE_STATEMENTS"
+SLOW_MS = 50.0
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Only the latest slow statements are kept, so a bad day cannot exhaust memory
+MAX_SLOW = 100
+DUMP_SECONDS = 15
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """One key per query whatever it was called with: whitespace, literals and IN (...) lists collapsed."""
+    sql = " ".join(sql.split()).replace(" ".join(BOOK_COLUMNS.split()), "*")
+    sql = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", "?", sql)
+    return re.sub(r"IN \(\?(?:, \?)+\)", "IN (?, ...)", sql)
+
+
+def result_rows(result):
+    """Rows in what a BookstoreDatabase method returned (a list, or a tuple starting with one)."""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    return 0
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def observe(self, ms, rows=0):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (max_ms for the last bucket)."""
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {"count": self.count, "total_ms": round(self.total_ms, 3), "max_ms": round(self.max_ms, 3),
+                "p50_ms": self.quantile(0.5), "p99_ms": self.quantile(0.99), "rows": self.rows,
+                "buckets_ms": dict(zip([*map(str, BUCKETS_MS), "inf"], self.counts))}
+
+
+class TracedConnection:
+    """Stands in for db.connection: times commits and explains slow statements."""
+
+    def __init__(self, connection, tracer):
+        self.connection = connection
+        self.tracer = tracer
+        # Innermost traced method first; statements are charged to it
+        self.methods = []
+        self.explaining = False
+        if tracer.count_statements:
+            connection.set_trace_callback(self.traced)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def traced(self, sql):
+        if not self.explaining:
+            self.tracer.count_statement(self.methods[-1] if self.methods else None)
+
+    def commit(self):
+        start = time.perf_counter()
+        self.connection.commit()
+        self.tracer.observe_commit((time.perf_counter() - start) * 1000)
+
+    def explain(self, sql, parameters):
+        """The query plan of a statement with the parameters it ran with ([] for BEGIN, executemany...)."""
+        if parameters is None or sql.split(None, 1)[0].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            return []
+        self.explaining = True
+        try:
+            return [row[3] for row in self.connection.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        except sqlite3.Error:
+            return []
+        finally:
+            self.explaining = False
+
+
+class TracedCursor:
+    """Stands in for db.cursor: times each statement from execute to its last fetch."""
+
+    def __init__(self, cursor, connection, tracer):
+        self.cursor = cursor
+        self.connection = connection
+        self.tracer = tracer
+        # [sql, parameters, ms, rows] of the statement whose rows are being fetched
+        self.statement = None
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(256)
+            if not rows:
+                return
+            yield from rows
+
+    def run(self, call, sql, parameters, explained):
+        self.finish()
+        start = time.perf_counter()
+        call(sql, parameters)
+        self.statement = [sql, explained, (time.perf_counter() - start) * 1000, 0]
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self.run(self.cursor.execute, sql, parameters, parameters)
+
+    def executemany(self, sql, parameters):
+        # The rows were consumed by the call, so there is nothing to explain it with
+        return self.run(self.cursor.executemany, sql, parameters, None)
+
+    def fetch(self, call, *args):
+        start = time.perf_counter()
+        rows = call(*args)
+        if self.statement:
+            self.statement[2] += (time.perf_counter() - start) * 1000
+            self.statement[3] += len(rows) if isinstance(rows, list) else rows is not None
+        return rows
+
+    def fetchone(self):
+        return self.fetch(self.cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self.fetch(self.cursor.fetchmany, size or self.cursor.arraysize)
+
+    def fetchall(self):
+        return self.fetch(self.cursor.fetchall)
+
+    def finish(self):
+        """Record the current statement; called on the next execute and when the method returns."""
+        if self.statement:
+            sql, parameters, ms, rows = self.statement
+            self.statement = None
+            method = self.connection.methods[-1] if self.connection.methods else None
+            plan = self.connection.explain(sql, parameters) if ms >= self.tracer.slow_ms else None
+            self.tracer.observe_statement(method, sql, parameters, ms, rows, plan)
+
+
+class QueryTracer:
+    """Latency histograms for the methods, statements and commits of instrumented databases.
+
+    One tracer can serve several connections on several threads (see
+    api_server's ReadPool); each connection is still used by one thread at a
+    time, as BookstoreDatabase requires.
+    """
+
+    def __init__(self, slow_ms=SLOW_MS, count_statements=False):
+        self.slow_ms = slow_ms
+        self.count_statements = count_statements
+        self.methods = {}
+        self.statements = {}
+        # Statements SQLite ran per method, with count_statements
+        self.sqlite_statements = {}
+        self.commits = Histogram()
+        self.slow = deque(maxlen=MAX_SLOW)
+        self.slow_count = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def attach(self, db):
+        """Instrument db (a BookstoreDatabase) and return it."""
+        connection = TracedConnection(db.connection, self)
+        db.connection = connection
+        db.cursor = TracedCursor(db.cursor, connection, self)
+        for name in dir(type(db)):
+            if not name.startswith("_") and name != "close" and callable(getattr(type(db), name)):
+                setattr(db, name, self.wrap(db, name, getattr(db, name)))
+        return db
+
+    def wrap(self, db, name, method):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            connection = db.connection
+            db.cursor.finish()
+            connection.methods.append(name)
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                db.cursor.finish()
+                connection.methods.pop()
+            ms = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.methods.setdefault(name, Histogram()).observe(ms, result_rows(result))
+            return result
+        return traced
+
+    def observe_statement(self, method, sql, parameters, ms, rows, plan):
+        shape = statement_shape(sql)
+        with self.lock:
+            self.statements.setdefault(shape, Histogram()).observe(ms, rows)
+            if plan is not None:
+                self.slow_count += 1
+                self.slow.append({"at": time.strftime("%Y-%m-%d %H:%M:%S"), "method": method, "ms": round(ms, 3),
+                                  "rows": rows, "sql": shape,
+                                  "parameters": list(parameters) if isinstance(parameters, (tuple, list)) else None,
+                                  "plan": plan})
+
+    def count_statement(self, method):
+        with self.lock:
+            self.sqlite_statements[method] = self.sqlite_statements.get(method, 0) + 1
+
+    def observe_commit(self, ms):
+        with self.lock:
+            self.commits.observe(ms)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "slow_ms": self.slow_ms,
+                "methods": {name: histogram.as_dict() for name, histogram in sorted(self.methods.items())},
+                "statements": {shape: histogram.as_dict() for shape, histogram in sorted(self.statements.items())},
+                "commits": self.commits.as_dict(),
+                "sqlite_statements": {str(method): count for method, count in self.sqlite_statements.items()},
+                "slow_statements": self.slow_count,
+                "slowest_recent": list(self.slow),
+            }
+
+    def prometheus(self):
+        """The stats in the Prometheus text exposition format (times in seconds)."""
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+        lines = []
+        with self.lock:
+            for metric, description, key, histograms in (
+                    ("bookstore_method_seconds", "BookstoreDatabase method latency", "method", self.methods),
+                    ("bookstore_statement_seconds", "SQL statement latency, execute to last fetch", "statement",
+                     self.statements),
+                    ("bookstore_commit_seconds", "Commit latency", None, {None: self.commits})):
+                lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+                for name, histogram in sorted(histograms.items(), key=lambda item: item[0] or ""):
+                    labels = f'{key}="{label(name)}",' if key else ""
+                    seen = 0
+                    for bound, count in zip([*(f"{bound / 1000:g}" for bound in BUCKETS_MS), "+Inf"],
+                                            histogram.counts):
+                        seen += count
+                        lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {seen}')
+                    labels = "{" + labels.rstrip(",") + "}" if labels else ""
+                    lines.append(f"{metric}_sum{labels} {histogram.total_ms / 1000:.6f}")
+                    lines.append(f"{metric}_count{labels} {histogram.count}")
+            lines += ["# HELP bookstore_method_rows_total Rows returned by BookstoreDatabase methods",
+                      "# TYPE bookstore_method_rows_total counter"]
+            lines += [f'bookstore_method_rows_total{{method="{name}"}} {histogram.rows}'
+                      for name, histogram in sorted(self.methods.items())]
+            if self.count_statements:
+                lines += ["# HELP bookstore_sqlite_statements_total Statements SQLite ran, by method",
+                          "# TYPE bookstore_sqlite_statements_total counter"]
+                lines += [f'bookstore_sqlite_statements_total{{method="{method}"}} {count}'
+                          for method, count in sorted(self.sqlite_statements.items(), key=lambda item: str(item[0]))]
+            lines += [f"# HELP bookstore_slow_statements_total Statements slower than {self.slow_ms:g} ms",
+                      "# TYPE bookstore_slow_statements_total counter",
+                      f"bookstore_slow_statements_total {self.slow_count}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the stats to path, as JSON for a .json name and in the Prometheus format otherwise."""
+        if path.endswith(".json"):
+            # Parameters can be bytes or other values JSON has no type for
+            text = json.dumps(self.as_dict(), ensure_ascii=False, indent=1, default=str)
+        else:
+            text = self.prometheus()
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(text)
+        # Readers (and a scraping collector) see the old file or the new one, never half of one
+        os.replace(temporary, path)
+
+
+_environment_tracer = None
+_environment_lock = threading.Lock()
+
+
+def environment_tracer():
+    """The process-wide tracer BOOKSTORE_TRACE asks for, dumping to that file; None when it is unset."""
+    global _environment_tracer
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+    with _environment_lock:
+        if _environment_tracer is None:
+            tracer = QueryTracer(float(os.environ.get(SLOW_ENV) or SLOW_MS), os.environ.get(STATEMENTS_ENV) == "1")
+
+            def dump_periodically():
+                while True:
+                    time.sleep(DUMP_SECONDS)
+                    tracer.write(path)
+
+            threading.Thread(target=dump_periodically, name="bookstore-trace", daemon=True).start()
+            atexit.register(tracer.write, path)
+            _environment_tracer = tracer
+    return _environment_tracer
@@ -0,0 +1,139 @@
+"""Run BookstoreDatabase calls off the GUI thread.
+
+A slow disk or a long scan must not freeze the window, so the SQLite front
+ends hand every storage call to a DatabaseWorker. The worker owns its own
+BookstoreDatabase on one dedicated thread (an SQLite connection belongs to
+the thread that opened it, and a single writer never waits on itself), runs
+the calls in the order they were submitted and returns a Future for each.
+
+Callbacks are handed back to the UI thread through the post function the
+front end passes in: TkDispatcher.post for tkinter, kivy_views.post_to_ui
+for Kivy and qt_models.UiDispatcher.post for PyQt.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from bookstore_db import BookstoreDatabase
+
+
+class DatabaseWorker:
+    def __init__(self, post, path="bookstore.db"):
+        self.post = post
+        self.jobs = queue.SimpleQueue()
+        # Latest future per key, so a newer search can cancel a stale one
+        self.latest = {}
+        self.running = None
+        self.lock = threading.Lock()
+        opened = Future()
+        self.thread = threading.Thread(target=self.run, args=(path, opened), name="bookstore-db", daemon=True)
+        self.thread.start()
+        # Opening (and migrating) the database is the one call that is waited for,
+        # so a broken database file fails at startup instead of on the first click
+        opened.result()
+
+    def run(self, path, opened):
+        try:
+            self.db = BookstoreDatabase(path)
+        except Exception as e:
+            opened.set_exception(e)
+            return
+        opened.set_result(None)
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, call = job
+            with self.lock:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.running = future
+            try:
+                result = call(self.db)
+            except BaseException as e:
+                with self.lock:
+                    self.running = None
+                future.set_exception(e)
+            else:
+                with self.lock:
+                    self.running = None
+                future.set_result(result)
+        self.db.close()
+
+    def submit(self, call, *args, on_done=None, on_error=None, key=None, **kwargs):
+        """Queue a storage call and return its Future.
+
+        call is the name of a BookstoreDatabase method, or a function that
+        takes the database as its first argument. on_done(result) and
+        on_error(exception) run on the UI thread. Submitting with a key
+        cancels the previous call submitted with the same key if it has not
+        finished yet; its callbacks are then never run.
+        """
+        def run(db):
+            if isinstance(call, str):
+                return getattr(db, call)(*args, **kwargs)
+            return call(db, *args, **kwargs)
+        future = Future()
+        if key is not None:
+            previous = self.latest.get(key)
+            if previous is not None:
+                self.cancel(previous)
+            self.latest[key] = future
+        if on_done or on_error:
+            future.add_done_callback(lambda done: self.post(lambda: self.deliver(done, on_done, on_error)))
+        self.jobs.put((future, run))
+        return future
+
+    def cancel(self, future):
+        """Cancel a queued call, or interrupt it if the worker is already running it."""
+        with self.lock:
+            if future.cancel():
+                return
+            if self.running is future:
+                self.db.connection.interrupt()
+
+    def deliver(self, future, on_done, on_error):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            if on_done:
+                on_done(future.result())
+        elif isinstance(error, sqlite3.OperationalError) and str(error) == "interrupted":
+            # Cancelled while it was running
+            return
+        elif on_error:
+            on_error(error)
+        else:
+            raise error
+
+    def close(self):
+        """Finish the queued calls and close the database."""
+        self.jobs.put(None)
+        self.thread.join()
+
+
+class TkDispatcher:
+    """Runs callbacks from the worker thread on the Tk mainloop.
+
+    Tk may only be used from the thread running mainloop, so callbacks are
+    queued here and picked up by a short root.after poll.
+    """
+
+    POLL_MS = 20
+
+    def __init__(self, root):
+        self.root = root
+        self.callbacks = queue.SimpleQueue()
+        self.poll()
+
+    def post(self, callback):
+        self.callbacks.put(callback)
+
+    def poll(self):
+        try:
+            while not self.callbacks.empty():
+                self.callbacks.get()()
+        finally:
+            self.root.after(self.POLL_MS, self.poll)
@@ -1,7 +1,7 @@
+from datetime import date, timedelta
 import kivy
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
@@ -11,67 +11,23 @@ from kivy.uix.popup import Popup
 from kivy.uix.spinner import Spinner
 from kivy.uix.checkbox import CheckBox
 from kivy.uix.spinner import Spinner
-from kivy.uix.gridlayout import GridLayout
+from memory_catalog import Book
+from memory_store import MemoryStore
+from kivy_views import BookRecycleView, ListBookSource
 
 kivy.require('2.0.0')
 
-class Book:
-    def __init__(self, title, author, price, stock):
-        self.title = title
-        self.author = author
-        self.price = price
-        self.stock = stock
-        self.sold = 0
-        self.discount = 0
-
-    def add_stock(self, quantity):
-        self.stock += quantity
-
-    def sell_book(self, quantity):
-        if self.stock >= quantity:
-            self.stock -= quantity
-            self.sold += quantity
-        else:
-            raise ValueError("موجودی کافی نیست.")
-
-    def apply_discount(self, discount_percentage):
-        self.discount = discount_percentage
-
-    def get_discounted_price(self):
-        return self.price * (1 - self.discount / 100)
-
-    def __str__(self):
-        return f"عنوان: {self.title}, نویسنده: {self.author}, قیمت: {self.price}, تخفیف: {self.discount}%, قیمت نهایی: {self.get_discounted_price()}, موجودی: {self.stock}, فروخته شده: {self.sold}"
-
-class SalesTracker:
-    def __init__(self):
-        self.sales = []
-
-    def record_sale(self, book, quantity):
-        if book.stock >= quantity:
-            book.sell_book(quantity)
-            self.sales.append((book.title, quantity, book.get_discounted_price() * quantity))
-        else:
-            raise ValueError("موجودی کافی نیست.")
-
-    def total_sales(self):
-        total_books = sum(sale[1] for sale in self.sales)
-        total_income = sum(sale[2] for sale in self.sales)
-        return total_books, total_income
-
 class BookstoreGUI(App):
     def build(self):
-        self.books = []
-        self.tracker = SalesTracker()
+        # Books and sales are kept on disk as a snapshot plus a journal of changes
+        self.store = MemoryStore()
+        self.books = self.store.catalog
+        self.tracker = self.store.tracker
 
         self.layout = BoxLayout(orientation='vertical')
 
-        self.table_layout = GridLayout(cols=5, size_hint_y=None, height=400)
-        self.table_layout.bind(minimum_height=self.table_layout.setter('height'))
-
-        self.load_books()
-
-        self.layout.add_widget(self.table_layout)
+        self.book_view = BookRecycleView(ListBookSource(self.books))
+        self.layout.add_widget(self.book_view)
 
         self.form_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=50)
 
@@ -114,12 +70,7 @@ class BookstoreGUI(App):
         return self.layout
 
     def load_books(self):
-        for book in self.books:
-            self.table_layout.add_widget(Label(text=book.title))
-            self.table_layout.add_widget(Label(text=book.author))
-            self.table_layout.add_widget(Label(text=str(book.price)))
-            self.table_layout.add_widget(Label(text=str(book.stock)))
-            self.table_layout.add_widget(Label(text=str(book.get_discounted_price())))
+        self.book_view.refresh()
 
     def add_book(self, instance):
         title = self.title_input.text
@@ -129,7 +80,7 @@ class BookstoreGUI(App):
             stock = int(self.stock_input.text)
             if title and author:
                 book = Book(title, author, price, stock)
-                self.books.append(book)
+                self.store.add_book(book)
                 self.title_input.text = ""
                 self.author_input.text = ""
                 self.price_input.text = ""
@@ -148,7 +99,7 @@ class BookstoreGUI(App):
                 quantity = self.show_input_popup("فروش کتاب", f"تعداد را برای فروش {book[0].title} وارد کنید:")
                 if quantity:
                     try:
-                        self.tracker.record_sale(book[0], int(quantity))
+                        self.store.record_sale(book[0], int(quantity))
                         self.load_books()
                     except ValueError as e:
                         self.show_popup("خطا", str(e))
@@ -162,7 +113,7 @@ class BookstoreGUI(App):
             if book:
                 try:
                     discount = float(self.show_input_popup("تخفیف", "درصد تخفیف را وارد کنید:"))
-                    book[0].apply_discount(discount)
+                    self.store.apply_discount(book[0], discount)
                     self.load_books()
                 except ValueError:
                     self.show_popup("ورودی نامعتبر", "درصد تخفیف معتبر وارد کنید.")
@@ -170,15 +121,18 @@ class BookstoreGUI(App):
     def show_sales_report(self, instance):
         total_books, total_income = self.tracker.total_sales()
         report = f"کل کتاب‌های فروخته شده: {total_books}\nکل درآمد حاصله: {total_income}"
+        today = date.today()
+        today_books, today_income = self.tracker.by_day.get(today.isoformat(), (0, 0))
+        report += f"\nفروش امروز: {today_books} کتاب، {today_income}"
+        period_books, period_income = self.tracker.period_totals(today - timedelta(days=29), today)
+        report += f"\nفروش ۳۰ روز گذشته: {period_books} کتاب، {period_income}"
+        for title, books, income in self.tracker.top_titles():
+            report += f"\n{title}: {books} کتاب، {income}"
         self.show_popup("گزارش فروش", report)
 
     def search_books(self, title=None, author=None):
         """Search for books based on title or author."""
-        results = []
-        for book in self.books:
-            if (title and title.lower() in book.title.lower()) or (author and author.lower() in book.author.lower()):
-                results.append(book)
-        return results
+        return self.books.find(title=title, author=author)
 
     def search_books_button(self, instance):
         """Prompt the user for a title to search and display the results."""
@@ -202,6 +156,9 @@ class BookstoreGUI(App):
         popup = Popup(title=title, content=Label(text=message), size_hint=(None, None), size=(400, 200))
         popup.open()
 
+    def on_stop(self):
+        self.store.close()
+
 
 if __name__ == '__main__':
     BookstoreGUI().run()
@@ -0,0 +1,227 @@
+"""Recycled book list for the Kivy front ends.
+
+BookRecycleView keeps a fixed pool of BookRow widgets and only swaps the data
+they display, and it holds at most a few pages of rows at a time: scrolling
+near either edge pulls the next page from a book source and drops the page
+at the other end. Frame time and memory therefore do not grow with the size
+of the catalog. Pages from the database are read on a DatabaseWorker, so the
+list keeps scrolling while a page is on its way.
+"""
+from kivy.clock import Clock, mainthread
+from kivy.lang import Builder
+from kivy.metrics import dp
+from kivy.properties import StringProperty
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.recycleview import RecycleView
+
+from bookstore_db import encode_cursor
+
+ROW_HEIGHT = dp(30)
+
+Builder.load_string('''
+<BookRow>:
+    orientation: 'horizontal'
+    size_hint_y: None
+    height: dp(30)
+    Label:
+        text: root.title
+    Label:
+        text: root.author
+    Label:
+        text: root.price
+    Label:
+        text: root.stock
+    Label:
+        text: root.final_price
+
+<BookRecycleView>:
+    viewclass: 'BookRow'
+    RecycleBoxLayout:
+        default_size: None, dp(30)
+        default_size_hint: 1, None
+        size_hint_y: None
+        height: self.minimum_height
+        orientation: 'vertical'
+''')
+
+
+@mainthread
+def post_to_ui(callback):
+    """Run callback on the Kivy main thread; the post function for DatabaseWorker."""
+    callback()
+
+
+def book_row(title, author, price, stock, final_price):
+    """Data dict for one BookRow."""
+    return {"title": str(title), "author": str(author), "price": str(price),
+            "stock": str(stock), "final_price": str(final_price)}
+
+
+def fetch_rows(db, anchor, count, backward, search):
+    """Read a page of BookRow data on the worker, with the cursor of every row."""
+    books = db.get_books_page(anchor, count, backward=backward, search=search)[0]
+    rows = [book_row(book[1], book[2], book[3], book[4], book[3] * (1 - book[6] / 100)) for book in books]
+    return rows, [encode_cursor("id", book) for book in books]
+
+
+class BookRow(BoxLayout):
+    title = StringProperty("")
+    author = StringProperty("")
+    price = StringProperty("")
+    stock = StringProperty("")
+    final_price = StringProperty("")
+
+
+class DatabaseBookSource:
+    """Pages books out of the database through a DatabaseWorker, with keyset cursors as anchors.
+
+    Every source of one view should share a key, so that a new request
+    cancels the one it supersedes.
+    """
+
+    def __init__(self, worker, search=None, key="books"):
+        self.worker = worker
+        self.search = search
+        self.key = key
+
+    def page(self, anchor, count, backward, on_done, on_error):
+        """Call on_done(rows, anchors) with up to count rows after (or before) anchor, or on_error(exception)."""
+        self.worker.submit(fetch_rows, anchor, count, backward, self.search,
+                           on_done=lambda result: on_done(*result), on_error=on_error, key=self.key)
+
+
+class ListBookSource:
+    """Pages an in-memory list of Book objects with list positions as anchors."""
+
+    def __init__(self, books):
+        self.books = books
+
+    def page(self, anchor, count, backward, on_done, on_error):
+        if backward:
+            start, end = max(0, anchor - count), anchor
+        else:
+            start = 0 if anchor is None else anchor + 1
+            end = min(len(self.books), start + count)
+        rows = [self.row(book) for book in self.books[start:end]]
+        on_done(rows, list(range(start, start + len(rows))))
+
+    def row(self, book):
+        return book_row(book.title, book.author, book.price, book.stock, book.get_discounted_price())
+
+
+class ResultBookSource(ListBookSource):
+    """Pages a list of book rows already read from the database, such as search results."""
+
+    def row(self, book):
+        return book_row(book[1], book[2], book[3], book[4], book[3] * (1 - book[6] / 100))
+
+
+class BookRecycleView(RecycleView):
+    PAGE_SIZE = 50
+    MAX_PAGES = 6
+
+    def __init__(self, source, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self.loading = False
+        # Anchor of each row in self.data
+        self.anchors = []
+        # The anchor just before the window; None means the window starts at the first book
+        self.window_anchor = None
+        self.at_end = False
+        # Only the answer to the latest request is shown
+        self.request = 0
+        self.bind(scroll_y=self.on_scroll)
+        self.refresh(keep_position=False)
+
+    def set_source(self, source):
+        self.source = source
+        self.refresh(keep_position=False)
+
+    def fetch(self, anchor, count, backward, apply):
+        self.loading = True
+        self.request += 1
+        request = self.request
+
+        def done(rows, anchors):
+            if request == self.request:
+                apply(rows, anchors)
+
+        def failed(error):
+            # Let the next scroll ask for the rows again
+            if request == self.request:
+                self.loading = False
+        self.source.page(anchor, count, backward, done, failed)
+
+    def refresh(self, keep_position=True):
+        """Re-read the rows in the current window, e.g. after the catalog changed."""
+        if keep_position:
+            count, top = max(len(self.data), self.PAGE_SIZE), self.top_row()
+        else:
+            self.window_anchor = None
+            count, top = self.PAGE_SIZE, 0
+
+        def apply(rows, anchors):
+            self.anchors = anchors
+            self.at_end = len(rows) < count
+            self.show(rows, min(top, max(len(rows) - 1, 0)))
+        self.fetch(self.window_anchor, count, False, apply)
+
+    def show(self, rows, top_row):
+        self.loading = True
+        self.data = rows
+        Clock.schedule_once(lambda dt: self.scroll_to_row(top_row))
+
+    def content_height(self):
+        return len(self.data) * ROW_HEIGHT - self.height
+
+    def top_row(self):
+        """Index of the row currently at the top of the viewport."""
+        content = self.content_height()
+        return int((1 - self.scroll_y) * content / ROW_HEIGHT) if content > 0 else 0
+
+    def scroll_to_row(self, row):
+        content = self.content_height()
+        self.scroll_y = max(0, min(1, 1 - row * ROW_HEIGHT / content)) if content > 0 else 1
+        self.loading = False
+
+    def on_scroll(self, instance, value):
+        if self.loading or not self.data:
+            return
+        if value <= 0.05 and not self.at_end:
+            self.load_next()
+        elif value >= 0.95 and self.window_anchor is not None:
+            self.load_previous()
+
+    def load_next(self):
+        def apply(rows, anchors):
+            self.at_end = len(rows) < self.PAGE_SIZE
+            if not rows:
+                self.loading = False
+                return
+            top = self.top_row()
+            data, self.anchors = self.data + rows, self.anchors + anchors
+            excess = len(data) - self.MAX_PAGES * self.PAGE_SIZE
+            if excess > 0:
+                self.window_anchor = self.anchors[excess - 1]
+                data, self.anchors = data[excess:], self.anchors[excess:]
+                top -= excess
+            self.show(data, top)
+        self.fetch(self.anchors[-1], self.PAGE_SIZE, False, apply)
+
+    def load_previous(self):
+        def apply(rows, anchors):
+            if len(rows) > self.PAGE_SIZE:
+                # One row more than a page was read: it is the row just before the window
+                self.window_anchor = anchors[0]
+                rows, anchors = rows[1:], anchors[1:]
+            else:
+                self.window_anchor = None
+            top = self.top_row() + len(rows)
+            data, self.anchors = rows + self.data, anchors + self.anchors
+            excess = len(data) - self.MAX_PAGES * self.PAGE_SIZE
+            if excess > 0:
+                data, self.anchors = data[:-excess], self.anchors[:-excess]
+                self.at_end = False
+            self.show(data, top)
+        self.fetch(self.anchors[0], self.PAGE_SIZE + 1, True, apply)
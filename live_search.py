@@ -0,0 +1,111 @@
+"""Search-as-you-type for the SQLite front ends.
+
+LiveSearch waits until the user pauses typing for DEBOUNCE_MS before it asks
+the DatabaseWorker for results, and a newer keystroke cancels the search it
+supersedes. On the worker, SearchCache remembers the results of recent
+queries: a query typed again is answered from the cache, and a query that
+extends a cached one whose results were complete (fewer than RESULT_LIMIT
+books) is answered by filtering those results instead of asking SQLite. The
+cache is emptied as soon as the database changes, whichever front end or
+connection changed it.
+"""
+import unicodedata
+from collections import OrderedDict
+
+import persian_text
+
+DEBOUNCE_MS = 150
+RESULT_LIMIT = 50
+# Only this many index matches are ranked per query, so one letter costs as much as a whole title
+CANDIDATES = 1000
+
+
+def fold(text):
+    """Normalize text and drop accents, as the FTS tokenizer does."""
+    text = unicodedata.normalize("NFKD", persian_text.normalize(text))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def book_matches(book, terms):
+    """True when every search term starts a word of the book's title or author."""
+    words = persian_text.search_terms(fold(f"{book[1]} {book[2]}"))
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+class SearchCache:
+    """LRU of recent search results. Only used on the DatabaseWorker thread."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.results = OrderedDict()
+        self.version = None
+
+    def search(self, db, text):
+        """Return the books matching text, ranked as BookstoreDatabase.search_books does."""
+        version = db.data_version()
+        if version != self.version:
+            self.results.clear()
+            self.version = version
+        terms = persian_text.search_terms(fold(text))
+        if not terms:
+            return []
+        query = " ".join(terms)
+        books = self.results.get(query)
+        if books is None:
+            books = self.narrow(query, terms)
+        if books is None:
+            books = db.search_books(text, RESULT_LIMIT, candidates=CANDIDATES)
+        self.results[query] = books
+        self.results.move_to_end(query)
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+        return books
+
+    def narrow(self, query, terms):
+        """Filter the results of a cached query that query extends, or return None.
+
+        Only results that held every match can be narrowed down; a capped list
+        may be missing books that match the longer query.
+        """
+        for previous in reversed(self.results):
+            books = self.results[previous]
+            if query.startswith(previous) and len(books) < RESULT_LIMIT:
+                return [book for book in books if book_matches(book, terms)]
+        return None
+
+
+class LiveSearch:
+    """Debounces the text of a search box and delivers its results on the UI thread.
+
+    schedule(delay_ms, callback) and cancel(handle) are the toolkit's timer
+    functions. on_results(books) gets the ranked books, or None once the box
+    is cleared so the front end can go back to the full list; on_error(exception)
+    gets a failed search.
+    """
+
+    def __init__(self, worker, schedule, cancel, on_results, on_error=None, key="live-search",
+                 delay_ms=DEBOUNCE_MS):
+        self.worker = worker
+        self.schedule = schedule
+        self.cancel = cancel
+        self.on_results = on_results
+        self.on_error = on_error
+        self.key = key
+        self.delay_ms = delay_ms
+        self.cache = SearchCache()
+        self.pending = None
+
+    def text_changed(self, text):
+        if self.pending is not None:
+            self.cancel(self.pending)
+        self.pending = self.schedule(self.delay_ms, lambda: self.run(text))
+
+    def run(self, text):
+        self.pending = None
+        if not persian_text.search_terms(text):
+            # Cancel a search still on its way so it cannot replace the full list
+            self.worker.submit(lambda db: None, key=self.key)
+            self.on_results(None)
+            return
+        self.worker.submit(self.cache.search, text, on_done=self.on_results, on_error=self.on_error,
+                           key=self.key)
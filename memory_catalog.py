@@ -0,0 +1,358 @@
+"""In-memory books and sales for the front ends that run without a database.
+
+Catalog behaves like the plain list of Book objects the apps used to keep
+(len, iteration, indexing and slicing in insertion order) but also indexes
+each book's normalized title and author, so lookups no longer lowercase and
+scan every book for every query. Book and SalesTracker are laid out to stay
+small when there are millions of books and sales.
+"""
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from persian_text import normalize, search_terms
+
+
+class Book:
+    # No per-instance __dict__, which matters once the catalog holds millions of books
+    __slots__ = ("book_id", "title", "author", "price", "stock", "sold", "discount")
+
+    def __init__(self, title, author, price, stock):
+        self.book_id = None
+        self.title = title
+        self.author = author
+        self.price = price
+        self.stock = stock
+        self.sold = 0
+        self.discount = 0
+
+    def add_stock(self, quantity):
+        self.stock += quantity
+
+    def sell_book(self, quantity):
+        if self.stock >= quantity:
+            self.stock -= quantity
+            self.sold += quantity
+        else:
+            raise ValueError("موجودی کافی نیست.")
+
+    def apply_discount(self, discount_percentage):
+        self.discount = discount_percentage
+
+    def get_discounted_price(self):
+        return self.price * (1 - self.discount / 100)
+
+    def __str__(self):
+        return f"عنوان: {self.title}, نویسنده: {self.author}, قیمت: {self.price}, تخفیف: {self.discount}%, قیمت نهایی: {self.get_discounted_price()}, موجودی: {self.stock}, فروخته شده: {self.sold}"
+
+
+class SalesLedger:
+    """Every sale as four parallel typed columns instead of a list of tuples.
+
+    A sale costs 28 bytes (book_id, quantity, discounted unit price and the
+    POSIX time it was sold at) and refers to its book by book_id rather than
+    repeating the title.
+    """
+
+    def __init__(self):
+        self.book_ids = array("q")
+        self.quantities = array("i")
+        self.prices = array("d")
+        self.times = array("d")
+
+    def append(self, book_id, quantity, price, time):
+        self.book_ids.append(book_id)
+        self.quantities.append(quantity)
+        self.prices.append(price)
+        self.times.append(time)
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __getitem__(self, index):
+        """Return (book_id, quantity, income) for one sale."""
+        return self.book_ids[index], self.quantities[index], self.quantities[index] * self.prices[index]
+
+    def __iter__(self):
+        for book_id, quantity, price in zip(self.book_ids, self.quantities, self.prices):
+            yield book_id, quantity, quantity * price
+
+
+class SalesTracker:
+    def __init__(self):
+        self.sales = SalesLedger()
+        # Running totals kept up to date on every sale so reports never re-scan self.sales
+        self.total_books = 0
+        self.total_income = 0
+        self.by_title = {}
+        self.by_author = {}
+        # Keyed "YYYY-MM-DD" and "YYYY-MM-DD HH", like sales_by_day and sales_by_hour in bookstore.db
+        self.by_day = {}
+        self.by_hour = {}
+
+    def record_sale(self, book, quantity, when=None):
+        """Sell quantity copies of book at when (a datetime, now by default)."""
+        if book.stock >= quantity:
+            when = when or datetime.now()
+            book.sell_book(quantity)
+            price = book.get_discounted_price()
+            income = price * quantity
+            # book_id 0 stands for a book that was never added to a Catalog
+            self.sales.append(book.book_id or 0, quantity, price, when.timestamp())
+            self.total_books += quantity
+            self.total_income += income
+            day = when.date().isoformat()
+            for totals, key in ((self.by_title, book.title), (self.by_author, book.author),
+                                (self.by_day, day), (self.by_hour, f"{day} {when.hour:02d}")):
+                books, total = totals.get(key, (0, 0))
+                totals[key] = (books + quantity, total + income)
+        else:
+            raise ValueError("موجودی کافی نیست.")
+
+    def total_sales(self):
+        return self.total_books, self.total_income
+
+    def top_titles(self, count=3):
+        """Return (title, books sold, income) for the best-selling titles."""
+        return sorted(((title, books, income) for title, (books, income) in self.by_title.items()),
+                      key=lambda sale: sale[2], reverse=True)[:count]
+
+    def top_authors(self, count=3):
+        """Return (author, books sold, income) for the best-selling authors."""
+        return sorted(((author, books, income) for author, (books, income) in self.by_author.items()),
+                      key=lambda sale: sale[2], reverse=True)[:count]
+
+    def period_totals(self, start, end):
+        """Return (books sold, income) for the days from start to end (dates, inclusive)."""
+        books = income = 0
+        day = start
+        while day <= end:
+            day_books, day_income = self.by_day.get(day.isoformat(), (0, 0))
+            books += day_books
+            income += day_income
+            day += timedelta(days=1)
+        return books, income
+
+    def hourly(self, day):
+        """Return (hour, books sold, income) for each hour of day (a date) that had sales."""
+        hours = []
+        for hour in range(24):
+            totals = self.by_hour.get(f"{day.isoformat()} {hour:02d}")
+            if totals:
+                hours.append((hour, *totals))
+        return hours
+
+
+class TextIndex:
+    """Hash and sorted-word index over one text field of the books.
+
+    exact maps the whole normalized text to the ids of the books that have it;
+    words is a sorted list of (word, book_id) so a prefix is found by bisect.
+
+    base is the index saved with a snapshot (memory_store.SavedIndex), which
+    is searched in place; only books added or edited since are indexed here,
+    and those removed or edited since are hidden from base.
+    """
+
+    def __init__(self, base=None):
+        self.texts = {}
+        self.exact = {}
+        self.words = []
+        self.base = base
+        self.hidden = set()
+
+    def add(self, book_id, text, keep_sorted=True):
+        text = normalize(text).strip()
+        self.texts[book_id] = text
+        self.exact.setdefault(text, set()).add(book_id)
+        for word in set(search_terms(text)):
+            if keep_sorted:
+                insort(self.words, (word, book_id))
+            else:
+                self.words.append((word, book_id))
+
+    def remove(self, book_id):
+        if book_id not in self.texts:
+            # Indexed in the snapshot, which is never changed
+            self.hidden.add(book_id)
+            return
+        text = self.texts.pop(book_id)
+        ids = self.exact[text]
+        ids.discard(book_id)
+        if not ids:
+            del self.exact[text]
+        for word in set(search_terms(text)):
+            del self.words[bisect_left(self.words, (word, book_id))]
+
+    def lookup(self, query):
+        """Return (exact ids, other ids) of the books whose text contains query at a word start."""
+        query = normalize(query).strip()
+        exact = set(self.exact.get(query, ()))
+        terms = search_terms(query)
+        # Candidates have a word starting with the first search word; the rest of
+        # the query is checked against the stored text instead of the index.
+        others = set()
+        if terms:
+            i = bisect_left(self.words, (terms[0],))
+            while i < len(self.words) and self.words[i][0].startswith(terms[0]):
+                book_id = self.words[i][1]
+                if book_id not in exact and query in self.texts[book_id]:
+                    others.add(book_id)
+                i += 1
+        if self.base:
+            saved_exact, saved_others = self.base.lookup(query, terms)
+            exact |= saved_exact - self.hidden
+            others |= saved_others - self.hidden
+        return exact, others - exact
+
+
+class Catalog:
+    """List of Book objects with title and author indexes kept up to date.
+
+    Every book added gets a book_id; books are kept in book_id order, which is
+    the order they were added in.
+
+    A catalog restored from a snapshot (see memory_store) starts out lazy:
+    each Book is only built when it is first accessed, and the title/author
+    indexes are searched in the snapshot they were saved in, so opening a
+    large catalog or searching it first does not pay for building either.
+    """
+
+    def __init__(self, books=()):
+        self.books = []
+        self.ids = array("q")
+        self.titles = TextIndex()
+        self.authors = TextIndex()
+        self.indexed = True
+        self.load_book = None
+        self.next_id = 1
+        self.extend(books)
+
+    @classmethod
+    def lazy(cls, ids, next_id, load_book, indexes=None):
+        """Catalog of the given book ids whose Book objects come from load_book(book_id).
+
+        indexes are the saved (title, author) indexes of the books; without
+        them, as from a snapshot written before they were saved, the first
+        search builds the indexes from the books.
+        """
+        catalog = cls()
+        catalog.ids = ids
+        catalog.books = [None] * len(ids)
+        catalog.next_id = next_id
+        catalog.load_book = load_book
+        if indexes:
+            catalog.use_indexes(indexes, ())
+        else:
+            catalog.indexed = False
+        return catalog
+
+    def use_indexes(self, indexes, changed):
+        """Search the saved (title, author) indexes from now on.
+
+        They were saved before the books whose ids are in changed were added,
+        edited or removed, so those are hidden from them and indexed anew.
+        """
+        self.titles, self.authors = (TextIndex(base) for base in indexes)
+        self.indexed = True
+        for book_id in changed:
+            self.titles.hidden.add(book_id)
+            self.authors.hidden.add(book_id)
+            i = bisect_left(self.ids, book_id)
+            if i < len(self.ids) and self.ids[i] == book_id:
+                book = self[i]
+                self.titles.add(book_id, book.title)
+                self.authors.add(book_id, book.author)
+
+    def __len__(self):
+        return len(self.books)
+
+    def __iter__(self):
+        for i in range(len(self.books)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.books)))]
+        book = self.books[index]
+        if book is None:
+            book = self.books[index] = self.load_book(self.ids[index])
+            book.book_id = self.ids[index]
+        return book
+
+    def get(self, book_id):
+        return self[self.position(book_id)]
+
+    def add(self, book, keep_sorted=True):
+        book.book_id = self.next_id
+        self.next_id += 1
+        self.books.append(book)
+        self.ids.append(book.book_id)
+        if self.indexed:
+            self.titles.add(book.book_id, book.title, keep_sorted)
+            self.authors.add(book.book_id, book.author, keep_sorted)
+        return book
+
+    def extend(self, books):
+        """Add many books, sorting the word indexes once at the end."""
+        for book in books:
+            self.add(book, keep_sorted=False)
+        self.titles.words.sort()
+        self.authors.words.sort()
+
+    def ensure_indexed(self):
+        """Build the title/author indexes of a lazy catalog from its current books."""
+        if self.indexed:
+            return
+        for book in self:
+            self.titles.add(book.book_id, book.title, keep_sorted=False)
+            self.authors.add(book.book_id, book.author, keep_sorted=False)
+        self.titles.words.sort()
+        self.authors.words.sort()
+        self.indexed = True
+
+    def edit(self, book, title, author, price, stock):
+        """Change a book's details and re-index its title and author."""
+        if self.indexed:
+            self.titles.remove(book.book_id)
+            self.authors.remove(book.book_id)
+        book.title, book.author, book.price, book.stock = title, author, price, stock
+        if self.indexed:
+            self.titles.add(book.book_id, title)
+            self.authors.add(book.book_id, author)
+
+    def remove(self, book):
+        i = self.index(book)
+        del self.books[i]
+        del self.ids[i]
+        if self.indexed:
+            self.titles.remove(book.book_id)
+            self.authors.remove(book.book_id)
+
+    def position(self, book_id):
+        """Position of the book with the given id in the catalog."""
+        i = bisect_left(self.ids, book_id)
+        if i == len(self.ids) or self.ids[i] != book_id:
+            raise ValueError("کتاب در فهرست نیست.")
+        return i
+
+    def index(self, book):
+        """Position of a book in the catalog."""
+        return self.position(book.book_id)
+
+    def find(self, title=None, author=None):
+        """Search for books based on title or author.
+
+        A book matches when the query appears in its title (or author) starting
+        at the beginning of a word; case, Arabic/Persian letter forms and ZWNJ
+        are ignored. Exact title/author matches come first, then the rest in
+        the order the books were added.
+        """
+        self.ensure_indexed()
+        exact, others = set(), set()
+        for index, query in ((self.titles, title), (self.authors, author)):
+            if query:
+                matched_exact, matched_others = index.lookup(query)
+                exact |= matched_exact
+                others |= matched_others
+        return [self.get(book_id) for book_id in sorted(exact) + sorted(others - exact)]
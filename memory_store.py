@@ -0,0 +1,549 @@
+"""Snapshot + journal persistence for the front ends that run without a database.
+
+Every change to the books or the sales (add, edit, delete, discount, sell) is
+appended to a journal file as one JSON line and synced to disk. Every
+COMPACT_EVERY changes the whole state is written to a binary snapshot, on a
+thread of its own, and the journal starts over.
+
+On start the snapshot is opened with mmap: its numeric columns are copied
+into arrays in one go, while titles and authors stay in the mapped file and
+a Book is only built when the app first touches it. The title and author
+indexes are saved too and searched in the mapped file, so the first search
+does not have to build them. Only the journal written since the last
+snapshot is replayed, so restarting stays fast however many books there are.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future
+from datetime import datetime
+
+from memory_catalog import Book, Catalog, SalesTracker
+from persian_text import normalize, search_terms
+
+MAGIC = b"BKSNAP1\n"
+HEADER_LENGTH = struct.Struct("<Q")
+
+# Compact the journal into a new snapshot after this many changes
+COMPACT_EVERY = 10000
+
+# (name, array typecode) of the columns in a snapshot, in file order.
+# text_offsets has two entries per book (title start, author start) plus the end
+# of the text section; titles and authors are stored back to back as UTF-8.
+BOOK_COLUMNS = [("ids", "q"), ("prices", "d"), ("stocks", "q"), ("solds", "q"), ("discounts", "d"),
+                ("text_offsets", "q")]
+SALE_COLUMNS = [("book_ids", "q"), ("quantities", "i"), ("prices", "d"), ("times", "d")]
+# The title and author indexes (see SavedIndex), by the Catalog attribute each belongs to
+INDEXES = ("titles", "authors")
+# An index entry is the number of its word in the sorted vocabulary, shifted
+# up, with the book id in the low bits, so entries sort by (word, book_id)
+WORD_SHIFT = 32
+BOOK_MASK = (1 << WORD_SHIFT) - 1
+
+
+def entry(number, book_id):
+    return number << WORD_SHIFT | book_id
+
+
+def index_words(text):
+    """The words a TextIndex files a text under; "" for a text without any, so it still matches exactly."""
+    return set(search_terms(text)) or {""}
+
+
+class SavedIndex:
+    """A TextIndex as saved in a snapshot, searched without building it.
+
+    vocabulary is every word indexed, sorted, and entries an array of the
+    entry() of each (word, book_id), sorted too; the texts themselves are
+    the snapshot's titles or authors. A prefix is a range of the vocabulary
+    and so a range of the entries, both found by bisect.
+    """
+
+    def __init__(self, snapshot, field, vocabulary, entries):
+        self.snapshot = snapshot
+        self.field = field
+        self.vocabulary = vocabulary
+        self.entries = entries
+
+    def text(self, book_id):
+        return normalize(self.snapshot.raw_texts(self.snapshot.row(book_id))[self.field].decode("utf-8")).strip()
+
+    def lookup(self, query, terms):
+        """(exact ids, other ids) as TextIndex.lookup finds them, for a normalized query and its terms."""
+        if terms:
+            prefix = terms[0]
+            first = bisect_left(self.vocabulary, prefix)
+            # The first string after every word that starts with prefix
+            last = bisect_left(self.vocabulary, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        else:
+            # Only a book without a word can equal a query without one
+            first, last = 0, int(self.vocabulary[:1] == [""])
+        exact, others = set(), set()
+        start = bisect_left(self.entries, entry(first, 0))
+        for book_entry in self.entries[start:bisect_left(self.entries, entry(last, 0))]:
+            book_id = book_entry & BOOK_MASK
+            text = self.text(book_id)
+            if text == query:
+                exact.add(book_id)
+            elif terms and query in text:
+                others.add(book_id)
+        return exact, others
+
+
+def saved_index(index):
+    """(vocabulary, entries) of a TextIndex: the part saved in its base with the changes made since.
+
+    Only entries of books added, edited or removed since are looked up; the
+    rest are copied in slices, renumbered only when the vocabulary grew.
+    """
+    base = index.base
+    vocabulary = base.vocabulary if base else []
+    entries = base.entries if base else array("Q")
+    removed = [(word, book_id) for book_id in index.hidden for word in index_words(base.text(book_id))]
+    with_words = {book_id for _, book_id in index.words}
+    added = index.words + [("", book_id) for book_id in index.texts if book_id not in with_words]
+    new_words = {word for word, _ in added}.difference(vocabulary)
+    if new_words:
+        grown = sorted(new_words.union(vocabulary))
+        numbers = array("Q", (bisect_left(grown, word) for word in vocabulary))
+        entries = array("Q", (entry(numbers[book_entry >> WORD_SHIFT], book_entry & BOOK_MASK)
+                              for book_entry in entries))
+        vocabulary = grown
+    removed = [entry(bisect_left(vocabulary, word), book_id) for word, book_id in removed]
+    added = [entry(bisect_left(vocabulary, word), book_id) for word, book_id in added]
+    if not entries:
+        # Nothing saved yet, as in the first snapshot of a store
+        return vocabulary, array("Q", sorted(added))
+    # At the same position a new entry goes in before the saved one there is dropped
+    changes = sorted([(bisect_left(entries, book_entry), True, book_entry) for book_entry in removed]
+                     + [(bisect_left(entries, book_entry), False, book_entry) for book_entry in added])
+    merged = array("Q")
+    start = 0
+    for position, dropped, book_entry in changes:
+        merged.extend(entries[start:position])
+        if dropped:
+            start = position + 1
+        else:
+            start = position
+            merged.append(book_entry)
+    merged.extend(entries[start:])
+    return vocabulary, merged
+
+
+class Snapshot:
+    """Read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("فایل ذخیره کتاب‌ها معتبر نیست.")
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack_from(self.map, len(MAGIC))
+        self.header = json.loads(self.map[start:start + header_length])
+        data_start = start + header_length
+
+        def read_column(table, name, typecode):
+            offset, length = self.header["columns"][table][name]
+            column = array(typecode)
+            column.frombytes(self.map[data_start + offset:data_start + offset + length])
+            return column
+
+        self.books = {}
+        self.sales = {}
+        for table, columns, layout in (("books", self.books, BOOK_COLUMNS), ("sales", self.sales, SALE_COLUMNS)):
+            for name, typecode in layout:
+                if name not in self.header["columns"][table]:
+                    # A column added since this snapshot was written (sale times), unknown for its rows
+                    columns[name] = array(typecode, [0]) * len(columns[layout[0][0]])
+                    continue
+                columns[name] = read_column(table, name, typecode)
+        self.texts_start = data_start + self.header["texts_offset"]
+        # Snapshots written before the indexes were saved have none
+        self.indexes = None
+        if all(table in self.header["columns"] for table in INDEXES):
+            self.indexes = []
+            # INDEXES are in the order of raw_texts
+            for field, table in enumerate(INDEXES):
+                offset, length = self.header["columns"][table]["vocabulary"]
+                vocabulary = self.map[data_start + offset:data_start + offset + length].decode("utf-8")
+                self.indexes.append(SavedIndex(self, field, vocabulary.split("\n")[:-1],
+                                               read_column(table, "entries", "Q")))
+
+    def row(self, book_id):
+        return bisect_left(self.books["ids"], book_id)
+
+    def raw_texts(self, row):
+        """Return the UTF-8 encoded (title, author) of a row."""
+        offsets = self.books["text_offsets"]
+        start = self.texts_start
+        return (self.map[start + offsets[2 * row]:start + offsets[2 * row + 1]],
+                self.map[start + offsets[2 * row + 1]:start + offsets[2 * row + 2]])
+
+    def book(self, book_id):
+        row = self.row(book_id)
+        title, author = self.raw_texts(row)
+        book = Book(title.decode("utf-8"), author.decode("utf-8"), self.books["prices"][row], self.books["stocks"][row])
+        book.sold = self.books["solds"][row]
+        if self.books["discounts"][row]:
+            book.discount = self.books["discounts"][row]
+        return book
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def write_snapshot(path, catalog, tracker, generation, old=None):
+    """Write the catalog and the sales to a new snapshot file.
+
+    Books the app never loaded are copied from the old snapshot without being
+    decoded. The catalog's indexes are saved along with the books; the part
+    of them saved in the old snapshot is copied rather than built again.
+    """
+    books = {name: array(typecode) for name, typecode in BOOK_COLUMNS}
+    texts = bytearray()
+    books["text_offsets"].append(0)
+    for i, book_id in enumerate(catalog.ids):
+        book = catalog.books[i]
+        if book is None:
+            row = old.row(book_id)
+            values = [old.books[name][row] for name in ("prices", "stocks", "solds", "discounts")]
+            title, author = old.raw_texts(row)
+        else:
+            values = [book.price, book.stock, book.sold, book.discount]
+            title, author = str(book.title).encode("utf-8"), str(book.author).encode("utf-8")
+        books["ids"].append(book_id)
+        for name, value in zip(("prices", "stocks", "solds", "discounts"), values):
+            books[name].append(value)
+        texts += title
+        books["text_offsets"].append(len(texts))
+        texts += author
+        books["text_offsets"].append(len(texts))
+    sales = {name: getattr(tracker.sales, name) for name, _ in SALE_COLUMNS}
+
+    sections = []
+    columns, offset = {"books": {}, "sales": {}}, 0
+    for table, values, layout in (("books", books, BOOK_COLUMNS), ("sales", sales, SALE_COLUMNS)):
+        for name, _ in layout:
+            section = values[name].tobytes()
+            sections.append(section)
+            columns[table][name] = [offset, len(section)]
+            offset += len(section)
+    for table in INDEXES:
+        vocabulary, entries = saved_index(getattr(catalog, table))
+        columns[table] = {}
+        # Every word is followed by a newline, which no word contains
+        for name, section in (("vocabulary", "".join(word + "\n" for word in vocabulary).encode("utf-8")),
+                              ("entries", entries.tobytes())):
+            sections.append(section)
+            columns[table][name] = [offset, len(section)]
+            offset += len(section)
+    header = {
+        "generation": generation,
+        "next_id": catalog.next_id,
+        "columns": columns,
+        "texts_offset": offset,
+        "total_books": tracker.total_books,
+        "total_income": tracker.total_income,
+        "by_title": tracker.by_title,
+        "by_author": tracker.by_author,
+        "by_day": tracker.by_day,
+        "by_hour": tracker.by_hour,
+    }
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for section in sections:
+            f.write(section)
+        f.write(texts)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class StoreState:
+    """A Catalog and a SalesTracker restored from a snapshot, with journals applied on top.
+
+    Nothing is written; MemoryStore adds the journal the app's changes go to,
+    and a compaction rebuilds the state it snapshots on its own thread.
+    """
+
+    def __init__(self, snapshot_path):
+        self.snapshot_path = snapshot_path
+        self.snapshot = None
+        self.generation = 0
+        self.catalog = Catalog()
+        self.tracker = SalesTracker()
+        if os.path.exists(self.snapshot_path):
+            self.load_snapshot()
+
+    def load_snapshot(self):
+        self.snapshot = Snapshot(self.snapshot_path)
+        header = self.snapshot.header
+        self.generation = header["generation"]
+        # The catalog gets its own copy of the ids; the snapshot's stay sorted for row lookups
+        self.catalog = Catalog.lazy(array("q", self.snapshot.books["ids"]), header["next_id"], self.snapshot.book,
+                                    self.snapshot.indexes)
+        for name, _ in SALE_COLUMNS:
+            setattr(self.tracker.sales, name, self.snapshot.sales[name])
+        self.tracker.total_books = header["total_books"]
+        self.tracker.total_income = header["total_income"]
+        for name in ("by_title", "by_author", "by_day", "by_hour"):
+            # by_hour is missing from snapshots written before it existed
+            setattr(self.tracker, name, {key: tuple(value) for key, value in header.get(name, {}).items()})
+
+    def replay(self, f):
+        """Apply the changes in f, a journal opened in binary and read past its header.
+
+        Returns how many there were and the offset after the last whole one;
+        a torn last line (the app died mid-write) is not applied.
+        """
+        changes = 0
+        good = f.tell()
+        for line in f:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                break
+            self.apply(*change)
+            changes += 1
+            good = f.tell()
+        return changes, good
+
+    def apply(self, action, book_id, *args):
+        if action == "add":
+            book = self.catalog.add(Book(*args))
+            if book.book_id != book_id:
+                raise ValueError("ترتیب دفتر تغییرات با فهرست کتاب‌ها نمی‌خواند.")
+            return
+        book = self.catalog.get(book_id)
+        if action == "edit":
+            self.catalog.edit(book, *args)
+        elif action == "delete":
+            self.catalog.remove(book)
+        elif action == "discount":
+            book.apply_discount(*args)
+        elif action == "sell":
+            # Older journals have just the day, which reads as its midnight
+            quantity, when = args
+            self.tracker.record_sale(book, quantity, datetime.fromisoformat(when))
+
+
+def journal_generation(f):
+    """Read the header of a journal: the generation of the snapshot it applies to, or None."""
+    try:
+        return json.loads(f.readline())["generation"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def compact_files(snapshot_path, journal_path, temp_path, generation):
+    """Write a snapshot plus a journal set aside for compaction to temp_path as one new snapshot.
+
+    Runs on the compaction thread, on a state of its own, so the app's
+    catalog is neither read nor locked while the snapshot is written.
+    """
+    state = StoreState(snapshot_path)
+    try:
+        with open(journal_path, "rb") as f:
+            journal_generation(f)
+            state.replay(f)
+        # Only a catalog from a snapshot that saved no indexes has none yet
+        state.catalog.ensure_indexed()
+        write_snapshot(temp_path, state.catalog, state.tracker, generation, state.snapshot)
+    finally:
+        # Windows cannot replace a file that is still mapped
+        if state.snapshot:
+            state.snapshot.close()
+
+
+class MemoryStore(StoreState):
+    """Keeps a Catalog and a SalesTracker on disk as a snapshot plus a journal.
+
+    The apps make every change through the methods below so that it is
+    journaled; store.catalog and store.tracker are read as before. Changes
+    made to those directly (a bulk load) are only kept by compact().
+
+    Compaction runs on its own thread: the journal so far is set aside
+    (<path>.journal.compacting) and a new one started for the snapshot being
+    written, so the app goes on changing books meanwhile. The next change
+    after the snapshot is written swaps it in. A compaction cut short by a
+    crash is replayed on the next start and run again.
+    """
+
+    def __init__(self, path="bookstore_memory", compact_every=COMPACT_EVERY):
+        super().__init__(path + ".snapshot")
+        self.journal_path = path + ".journal"
+        self.pending_path = path + ".journal.compacting"
+        self.compact_every = compact_every
+        self.compaction = None
+        # Books added, edited or deleted since the journal was set aside, while there is one
+        self.touched = None
+        self.changes = self.replay_journal()
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        if self.touched is not None:
+            self.start_compaction()
+
+    def replay_journal(self):
+        """Apply the changes journaled since the snapshot and return how many the current journal had.
+
+        A journal left over from an older snapshot is already part of the
+        snapshot and is discarded; a torn last line is cut off.
+        """
+        if os.path.exists(self.pending_path):
+            with open(self.pending_path, "rb") as f:
+                pending = journal_generation(f) == self.generation
+                if pending:
+                    self.replay(f)
+            if pending:
+                self.touched = set()
+            else:
+                # The compaction got as far as replacing the snapshot
+                os.remove(self.pending_path)
+        generation = self.generation + (self.touched is not None)
+        if not os.path.exists(self.journal_path):
+            self.start_journal(generation)
+            return 0
+        with open(self.journal_path, "rb+") as f:
+            if journal_generation(f) != generation:
+                f.close()
+                self.start_journal(generation)
+                return 0
+            changes, good = self.replay(f)
+            f.truncate(good)
+        return changes
+
+    def start_journal(self, generation):
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"generation": generation}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def apply(self, action, book_id, *args):
+        super().apply(action, book_id, *args)
+        self.touch(action, book_id)
+
+    def touch(self, action, book_id):
+        if self.touched is not None and action in ("add", "edit", "delete"):
+            self.touched.add(book_id)
+
+    def log(self, *change):
+        self.journal.write(json.dumps(change, ensure_ascii=False) + "\n")
+        self.journal.flush()
+        # flush only hands the line to the OS; the change is not made until it is on disk
+        os.fsync(self.journal.fileno())
+        self.touch(*change[:2])
+        self.changes += 1
+        if self.compaction and self.compaction.done():
+            self.finish_compaction()
+        elif self.compaction is None and self.changes >= self.compact_every:
+            self.start_compaction()
+
+    def add_book(self, book):
+        self.catalog.add(book)
+        self.log("add", book.book_id, book.title, book.author, book.price, book.stock)
+        return book
+
+    def edit_book(self, book, title, author, price, stock):
+        self.catalog.edit(book, title, author, price, stock)
+        self.log("edit", book.book_id, title, author, price, stock)
+
+    def delete_book(self, book):
+        self.catalog.remove(book)
+        self.log("delete", book.book_id)
+
+    def apply_discount(self, book, discount_percentage):
+        book.apply_discount(discount_percentage)
+        self.log("discount", book.book_id, discount_percentage)
+
+    def record_sale(self, book, quantity):
+        when = datetime.now().replace(microsecond=0)
+        self.tracker.record_sale(book, quantity, when)
+        self.log("sell", book.book_id, quantity, when.isoformat(" "))
+
+    def start_compaction(self):
+        """Set the journal aside and write it and the snapshot to a new snapshot on another thread.
+
+        A journal already set aside (a compaction that failed or was cut
+        short) is compacted again instead.
+        """
+        if self.touched is None:
+            self.journal.close()
+            os.replace(self.journal_path, self.pending_path)
+            self.touched = set()
+            self.start_journal(self.generation + 1)
+            self.journal = open(self.journal_path, "a", encoding="utf-8")
+            self.changes = 0
+        self.compaction = Future()
+        threading.Thread(target=self.run_compaction, args=(self.compaction, self.generation + 1),
+                         name="bookstore-compaction", daemon=True).start()
+
+    def run_compaction(self, future, generation):
+        try:
+            compact_files(self.snapshot_path, self.pending_path, self.snapshot_path + ".tmp", generation)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    def finish_compaction(self):
+        """Wait for the compaction thread and swap in the snapshot it wrote."""
+        compaction, self.compaction = self.compaction, None
+        # An error is raised here; the journal stays set aside and the next compaction retries it
+        compaction.result()
+        # The new snapshot's indexes have every book but those changed since the journal was set aside
+        self.swap_snapshot(self.generation + 1, self.touched)
+        os.remove(self.pending_path)
+        self.touched = None
+
+    def swap_snapshot(self, generation, changed):
+        # Windows cannot replace a file that is still mapped; books not loaded yet
+        # are pointed at the new snapshot right after.
+        if self.snapshot:
+            self.snapshot.close()
+        os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        self.snapshot = Snapshot(self.snapshot_path)
+        self.generation = generation
+        self.catalog.load_book = self.snapshot.book
+        self.catalog.use_indexes(self.snapshot.indexes, changed)
+
+    def compact(self):
+        """Write the catalog and sales as they are to a new snapshot now and start an empty journal."""
+        if self.compaction:
+            # Left to finish so it does not write over the snapshot below; that has everything it has
+            self.compaction.exception()
+            self.compaction = None
+        # Past the generations of both journals if one is set aside, so a crash
+        # before the new journal is started replays neither
+        generation = self.generation + 1 + (self.touched is not None)
+        self.journal.close()
+        # Only a catalog from a snapshot that saved no indexes has none yet
+        self.catalog.ensure_indexed()
+        write_snapshot(self.snapshot_path + ".tmp", self.catalog, self.tracker, generation, self.snapshot)
+        self.swap_snapshot(generation, ())
+        self.start_journal(generation)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        if self.touched is not None:
+            os.remove(self.pending_path)
+            self.touched = None
+        self.changes = 0
+
+    def close(self):
+        try:
+            if self.compaction:
+                # Finished now rather than redone on the next start
+                self.finish_compaction()
+        finally:
+            self.journal.close()
+            if self.snapshot:
+                self.snapshot.close()
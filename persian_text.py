@@ -0,0 +1,53 @@
+import re
+
+# Arabic code points that are typed interchangeably with their Persian forms,
+# plus ZWNJ (half-space) which is dropped so "می‌خواهم" and "میخواهم" match,
+# and the harakat, dropped so "کِتاب" and "کتاب" match.
+PERSIAN_FOLDS = [
+    ("ي", "ی"),  # Arabic yeh -> Persian yeh
+    ("ى", "ی"),  # Alef maksura -> Persian yeh
+    ("ك", "ک"),  # Arabic kaf -> Persian kaf
+    ("\u200c", ""),  # ZWNJ
+    # Fathatan, dammatan, kasratan, fatha, damma, kasra, shadda and sukun
+    *[(chr(code), "") for code in range(0x064B, 0x0653)],
+]
+
+_TRANSLATION = str.maketrans({src: dst for src, dst in PERSIAN_FOLDS})
+
+
+def normalize(text):
+    """Fold Arabic yeh/kaf to Persian, strip ZWNJ and harakat and lowercase the text."""
+    if text is None:
+        return ""
+    return str(text).translate(_TRANSLATION).lower()
+
+
+def normalize_sql(expression):
+    """Wrap an SQL expression so SQLite applies the same folds as normalize().
+
+    Triggers use this instead of a Python function so that any connection,
+    including ones opened by the other front ends, can keep the index in sync.
+    """
+    for src, dst in PERSIAN_FOLDS:
+        replacement = f"char({ord(dst)})" if dst else "''"
+        expression = f"replace({expression}, char({ord(src)}), {replacement})"
+    return expression
+
+
+def search_terms(text):
+    """Split a search string into normalized words."""
+    return re.findall(r"\w+", normalize(text))
+
+
+def match_query(text, column=None):
+    """Build an FTS5 MATCH expression where every word is a prefix term.
+
+    Returns None when the text has no searchable words.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return None
+    query = " ".join(f'"{term}"*' for term in terms)
+    if column:
+        query = f"{column} : ({query})"
+    return query
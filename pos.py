@@ -0,0 +1,191 @@
+"""Point-of-sale mode: sell books by scanning their ISBN/EAN barcode.
+
+Usage:
+    python pos.py [--db bookstore.db] [--batch-size 20] [--flush-seconds 5]
+
+Reads one code per line from stdin, which is what a keyboard-wedge scanner
+types (the code followed by Enter); "3*9780306406157" sells three copies.
+Scans are sold in batches, one checkout transaction per batch, so the till
+is not waiting on a commit after every beep. A batch is sold once it has
+--batch-size scans or its first scan is --flush-seconds old, even if no
+other scan follows. An empty line (the total key) sells whatever is
+pending, as does the end of the input.
+"""
+import argparse
+import queue
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import isbn
+from bookstore_db import BookstoreDatabase, InsufficientStockError
+
+# Best sellers whose barcodes are resolved without a query
+HOT_TITLES = 500
+BATCH_SIZE = 20
+FLUSH_SECONDS = 5.0
+
+
+class BarcodeResolver:
+    """Maps a scanned code to (book_id, title).
+
+    The best-selling books are loaded up front and every code scanned since
+    is kept too, least recently scanned first out, so a busy till rarely
+    has to query the database at all.
+    """
+
+    def __init__(self, db, size=HOT_TITLES):
+        self.db = db
+        self.size = size
+        self.books = OrderedDict()
+        for code, book_id, title in db.get_top_selling_isbns(size):
+            self.books[code] = (book_id, title)
+
+    def resolve(self, code):
+        code = isbn.normalize(code)
+        book = self.books.get(code)
+        if book is None:
+            rows = self.db.get_book_by_isbn(code)
+            if not rows:
+                raise ValueError(f"کتابی با شابک {code} پیدا نشد.")
+            book = rows[0][0], rows[0][1]
+            self.books[code] = book
+            if len(self.books) > self.size:
+                self.books.popitem(last=False)
+        self.books.move_to_end(code)
+        return book
+
+    def forget(self, book_id):
+        """Drop a book that turned out to be deleted, so its code is looked up again."""
+        for code in [code for code, book in self.books.items() if book[0] == book_id]:
+            del self.books[code]
+
+
+class Register:
+    """Collects scans and sells them in batches through BookstoreDatabase.checkout."""
+
+    def __init__(self, db, resolver=None, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS):
+        self.db = db
+        self.resolver = resolver or BarcodeResolver(db)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.basket = Counter()
+        self.scans = 0
+        self.opened = None
+
+    def scan(self, code, quantity=1):
+        """Add a scanned book to the pending batch.
+
+        Returns (book_id, title, failed); failed lists what flush() could not
+        sell when this scan completed a batch.
+        """
+        if quantity <= 0:
+            raise ValueError("تعداد باید بیشتر از صفر باشد.")
+        book_id, title = self.resolver.resolve(code)
+        self.basket[book_id] += quantity
+        self.scans += 1
+        if self.opened is None:
+            self.opened = time.monotonic()
+        failed = []
+        if self.scans >= self.batch_size or self.time_left() == 0:
+            failed = self.flush()
+        return book_id, title, failed
+
+    def time_left(self):
+        """Seconds until the pending batch is due to be sold, or None when nothing is pending."""
+        if self.opened is None:
+            return None
+        return max(0.0, self.opened + self.flush_seconds - time.monotonic())
+
+    def flush(self):
+        """Sell every pending scan and return the (book_id, requested, available) lines that failed.
+
+        checkout sells all of a batch or none of it, so lines without enough
+        stock are taken out and the rest of the batch is sold without them.
+        Any other error leaves the whole batch pending.
+        """
+        lines = list(self.basket.items())
+        failed = []
+        while lines:
+            try:
+                self.db.checkout(lines)
+                break
+            except InsufficientStockError as e:
+                failed += e.lines
+                refused = {book_id for book_id, requested, available in e.lines}
+                for book_id, requested, available in e.lines:
+                    if available is None:
+                        self.resolver.forget(book_id)
+                lines = [line for line in lines if line[0] not in refused]
+        self.basket.clear()
+        self.scans = 0
+        self.opened = None
+        return failed
+
+
+def parse_scan(line):
+    """Split "3*code" into (code, 3); a plain code is one copy."""
+    quantity, star, code = line.rpartition("*")
+    if not star:
+        return line, 1
+    try:
+        return code, int(quantity)
+    except ValueError:
+        raise ValueError("تعداد باید عدد باشد.")
+
+
+def read_lines(stream, lines):
+    """Put every line of stream on the lines queue, then None for the end of the input."""
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def report_failed(failed):
+    for book_id, requested, available in failed:
+        print(f"فروخته نشد: کتاب {book_id}، درخواست {requested}، "
+              f"موجودی {'نامشخص' if available is None else available}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sell books by scanning their barcodes")
+    parser.add_argument("--db", default="bookstore.db")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--flush-seconds", type=float, default=FLUSH_SECONDS)
+    args = parser.parse_args()
+
+    db = BookstoreDatabase(args.db)
+    register = Register(db, batch_size=args.batch_size, flush_seconds=args.flush_seconds)
+    # stdin is read on its own thread so a pending batch is sold on time when the scanning stops;
+    # the database is only used from this one
+    lines = queue.Queue()
+    threading.Thread(target=read_lines, args=(sys.stdin, lines), daemon=True).start()
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=register.time_left())
+            except queue.Empty:
+                report_failed(register.flush())
+                continue
+            if line is None:
+                break
+            line = line.strip()
+            if not line:
+                report_failed(register.flush())
+                continue
+            try:
+                book_id, title, failed = register.scan(*parse_scan(line))
+            except ValueError as e:
+                print(e)
+                continue
+            print(title)
+            report_failed(failed)
+    finally:
+        # Scans already beeped through are sold even if the till is stopped with Ctrl+C
+        report_failed(register.flush())
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Whole-catalog pricing with NumPy.
+
+PriceColumns holds the id, price, discount, stock and sold count of every
+book as NumPy arrays, so discounted prices and the value of the inventory are
+computed in one vectorized pass instead of a Python loop over the rows. It
+can be filled from bookstore.db, from book rows returned by
+BookstoreDatabase, from Book objects, or straight from a MemoryStore's
+snapshot columns.
+
+Usage:
+    python pricing.py [--db bookstore.db] [--cost-ratio 0.6]
+
+The books have no cost price of their own; --cost-ratio values the stock at
+that fraction of the list price to report a margin.
+"""
+import argparse
+
+import numpy as np
+
+from bookstore_db import BookstoreDatabase
+
+# One book as it is read into the columns; np.fromiter fills a table of these
+# straight from an iterator of tuples, without a list of rows in between
+ROW = np.dtype([("id", np.int64), ("price", np.float64), ("discount", np.float64), ("stock", np.int64),
+                ("sold", np.int64)])
+
+
+class PriceColumns:
+    def __init__(self, ids, prices, discounts, stocks, solds):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.prices = np.ascontiguousarray(prices, dtype=np.float64)
+        self.discounts = np.ascontiguousarray(discounts, dtype=np.float64)
+        self.stocks = np.ascontiguousarray(stocks, dtype=np.int64)
+        self.solds = np.ascontiguousarray(solds, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_table(cls, table):
+        return cls(table["id"], table["price"], table["discount"], table["stock"], table["sold"])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Columns of book rows as BookstoreDatabase returns them (BOOK_COLUMNS order)."""
+        return cls.from_table(np.fromiter(((row[0], row[3], row[6], row[4], row[5]) for row in rows), dtype=ROW))
+
+    @classmethod
+    def from_database(cls, db):
+        """Columns of every book in a BookstoreDatabase, in id order, with the discount the books sell at."""
+        # The same effective discount as BOOK_COLUMNS: a running campaign's when it is bigger
+        cursor = db.connection.execute('''
+            SELECT id, price, MAX(COALESCE(discount, 0), promo_discount), stock, COALESCE(sold, 0) FROM books
+            ORDER BY id
+        ''')
+        return cls.from_table(np.fromiter(cursor, dtype=ROW))
+
+    @classmethod
+    def from_books(cls, books):
+        """Columns of Book objects (a list or a memory_catalog.Catalog)."""
+        return cls.from_table(np.fromiter(
+            ((book.book_id or 0, book.price, book.discount, book.stock, book.sold) for book in books),
+            dtype=ROW, count=len(books)))
+
+    @classmethod
+    def from_store(cls, store):
+        """Columns of a MemoryStore's catalog.
+
+        Books the app never loaded are read from the snapshot's arrays without
+        building a Book for each; only loaded (possibly changed) books are
+        read one by one.
+        """
+        catalog, snapshot = store.catalog, store.snapshot
+        if snapshot is None:
+            return cls.from_books(catalog)
+        ids = np.frombuffer(catalog.ids, dtype=np.int64)
+        snapshot_ids = np.frombuffer(snapshot.books["ids"], dtype=np.int64)
+        # Books added since the snapshot are loaded, so their (clipped) row is overwritten below
+        rows = np.minimum(np.searchsorted(snapshot_ids, ids), max(len(snapshot_ids) - 1, 0))
+        columns = [np.frombuffer(snapshot.books[name], dtype=dtype)[rows] if len(snapshot_ids)
+                   else np.zeros(len(ids), dtype=dtype)
+                   for name, dtype in (("prices", np.float64), ("discounts", np.float64),
+                                       ("stocks", np.int64), ("solds", np.int64))]
+        prices, discounts, stocks, solds = columns
+        for i, book in enumerate(catalog.books):
+            if book is not None:
+                prices[i], discounts[i], stocks[i], solds[i] = book.price, book.discount, book.stock, book.sold
+        return cls(ids, prices, discounts, stocks, solds)
+
+    def discounted_prices(self):
+        """Price after discount of every book, as Book.get_discounted_price computes it."""
+        return self.prices * (1 - self.discounts / 100)
+
+    def valuation(self, costs=None):
+        """Value the stock of the whole catalog.
+
+        Returns a dict with the units in stock, their value at list price and
+        at the discounted (retail) price, the markdown between the two, and
+        the value of the books sold so far at today's prices. costs, the unit
+        cost per book (an array, or one number for every book), adds the value
+        at cost and the margin.
+        """
+        retail = self.discounted_prices()
+        report = {
+            "books": len(self),
+            "units": int(self.stocks.sum()),
+            "list_value": float(self.prices @ self.stocks),
+            "retail_value": float(retail @ self.stocks),
+            "sold_value": float(retail @ self.solds),
+        }
+        report["markdown"] = report["list_value"] - report["retail_value"]
+        if costs is not None:
+            report["cost_value"] = float(np.sum(np.broadcast_to(costs, self.stocks.shape) * self.stocks))
+            report["margin"] = report["retail_value"] - report["cost_value"]
+            report["margin_rate"] = report["margin"] / report["retail_value"] if report["retail_value"] else 0.0
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Value the whole inventory of bookstore.db")
+    parser.add_argument("--db", default="bookstore.db")
+    parser.add_argument("--cost-ratio", type=float, help="cost price as a fraction of the list price")
+    args = parser.parse_args()
+
+    db = BookstoreDatabase(args.db)
+    try:
+        columns = PriceColumns.from_database(db)
+    finally:
+        db.close()
+    report = columns.valuation(None if args.cost_ratio is None else columns.prices * args.cost_ratio)
+    print(f"کتاب‌ها: {report['books']}، نسخه‌های موجود: {report['units']}")
+    print(f"ارزش موجودی با قیمت پشت جلد: {report['list_value']:,.0f} تومان")
+    print(f"ارزش موجودی با قیمت فروش: {report['retail_value']:,.0f} تومان (تخفیف‌ها: {report['markdown']:,.0f})")
+    print(f"فروش تا امروز با قیمت‌های فعلی: {report['sold_value']:,.0f} تومان")
+    if "margin" in report:
+        print(f"ارزش موجودی با قیمت خرید: {report['cost_value']:,.0f} تومان، "
+              f"سود: {report['margin']:,.0f} تومان ({report['margin_rate']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Discount campaigns on bookstore.db.
+
+Usage:
+    python promotions.py add "حراج هدایت" 20 --author "هدایت" --ends "2026-11-01"
+    python promotions.py add "کتاب‌های انبار" 15 --min-stock 30 --starts "2026-10-20 09:00" --ends "2026-10-27"
+    python promotions.py add "ارزان‌ها" 10 --max-price 50000 --books 12,15,40
+    python promotions.py list
+    python promotions.py end 3
+    python promotions.py refresh
+
+A campaign discounts every book that matches all of its filters (every book
+if it has none) from its start until its end. A book on several campaigns
+gets the largest discount, and a campaign never lowers a discount given to
+the book itself. Starting or ending a campaign is one set-based UPDATE in a
+single transaction, run by whichever app or command notices the time first;
+the apps check every PROMOTION_CHECK_SECONDS.
+"""
+import argparse
+
+from bookstore_db import BookstoreDatabase, promotion_time
+
+
+def show_promotions(db):
+    now = promotion_time(None)
+    for promotion_id, name, discount, starts_at, ends_at, active in db.get_promotions():
+        if active:
+            status = "در حال اجرا"
+        elif starts_at > now:
+            status = "زمان‌بندی‌شده"
+        else:
+            status = "تمام‌شده"
+        print(f"{promotion_id}. {name}: {discount}٪ از {starts_at} تا {ends_at or 'بدون پایان'} ({status})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule and end discount campaigns")
+    parser.add_argument("--db", default="bookstore.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="schedule a campaign")
+    add.add_argument("name")
+    add.add_argument("discount", type=float, help="percent off")
+    add.add_argument("--starts", help="YYYY-MM-DD[ HH:MM], now by default")
+    add.add_argument("--ends", help="YYYY-MM-DD[ HH:MM], no end by default")
+    add.add_argument("--author")
+    add.add_argument("--min-price", type=float)
+    add.add_argument("--max-price", type=float)
+    add.add_argument("--min-stock", type=int)
+    add.add_argument("--max-stock", type=int)
+    add.add_argument("--books", type=lambda text: [int(book_id) for book_id in text.split(",")],
+                     help="comma-separated book ids")
+    commands.add_parser("list", help="show every campaign")
+    end = commands.add_parser("end", help="end a campaign now")
+    end.add_argument("promotion_id", type=int)
+    commands.add_parser("refresh", help="start and end the campaigns whose time has come")
+    args = parser.parse_args()
+
+    db = BookstoreDatabase(args.db)
+    try:
+        if args.command == "add":
+            promotion_id = db.add_promotion(args.name, args.discount, args.starts, args.ends, args.author,
+                                            args.min_price, args.max_price, args.min_stock, args.max_stock,
+                                            args.books)
+            print(f"کمپین {promotion_id} ثبت شد.")
+        elif args.command == "end":
+            db.end_promotion(args.promotion_id)
+            print(f"کمپین {args.promotion_id} تمام شد.")
+        elif args.command == "refresh":
+            started, ended = db.refresh_promotions()
+            print(f"شروع‌شده: {len(started)}، تمام‌شده: {len(ended)}")
+        else:
+            show_promotions(db)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Table models for the PyQt front ends.
+
+Both models hand rows to a QTableView on demand instead of building a
+QTableWidgetItem for every cell, so showing a large catalog costs only the
+rows that are actually on screen.
+"""
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, pyqtSignal
+
+HEADERS = ["ID", "عنوان", "نویسنده", "قیمت", "موجودی"]
+
+
+class UiDispatcher(QObject):
+    """Runs callbacks from the DatabaseWorker thread on the Qt event loop.
+
+    post() emits a signal from the worker thread; because the dispatcher lives
+    on the GUI thread, Qt queues the call to run there.
+    """
+
+    posted = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.posted.connect(self.run)
+
+    def post(self, callback):
+        self.posted.emit(callback)
+
+    def run(self, callback):
+        callback()
+
+
+class BookTableModel(QAbstractTableModel):
+    """Lazily pages books out of the database through a DatabaseWorker.
+
+    Rows are announced to the view in pages through canFetchMore/fetchMore as
+    the user scrolls. Only the most recently used pages are kept; an evicted
+    page is re-read with a keyset seek from the cursor where it starts, so
+    memory stays flat however far the user scrolls. Sorting and filtering
+    are done by SQLite. Pages are read on the worker thread: rows show up
+    empty until their page arrives, and a new sort or filter cancels the
+    reads that are still pending.
+    """
+
+    PAGE_SIZE = 200
+    MAX_CACHED_PAGES = 10
+    # Sort keys understood by get_books_page, by view column
+    SORT_KEYS = ["id", "title", "author", "price", "stock"]
+
+    def __init__(self, worker, parent=None):
+        super().__init__(parent)
+        self.worker = worker
+        self.sort_key = "id"
+        self.descending = False
+        self.search = None
+        self.requests = {}
+        self.refresh()
+
+    def refresh(self):
+        """Forget every loaded page, e.g. after the catalog changed."""
+        for future in self.requests.values():
+            self.worker.cancel(future)
+        self.beginResetModel()
+        # page_starts[i] is the cursor page i is fetched after (None for the first page)
+        self.page_starts = [None]
+        self.pages = OrderedDict()
+        # Pages being read on the worker, by page index
+        self.requests = {}
+        self.row_count = 0
+        self.exhausted = False
+        self.endResetModel()
+
+    def set_filter(self, text):
+        self.search = text or None
+        self.refresh()
+
+    def request_page(self, index, then):
+        if index in self.requests:
+            return
+        requests = self.requests
+
+        def done(result):
+            # Ignore pages asked for before the last refresh
+            if requests is self.requests:
+                del self.requests[index]
+                books, first, last = result
+                self.store_page(index, books)
+                then(index, books, last)
+
+        def failed(error):
+            # Let the view ask for the page again
+            if requests is self.requests:
+                del self.requests[index]
+        self.requests[index] = self.worker.submit(
+            "get_books_page", self.page_starts[index], self.PAGE_SIZE, sort=self.sort_key,
+            descending=self.descending, search=self.search, on_done=done, on_error=failed)
+
+    def store_page(self, index, books):
+        self.pages[index] = books
+        self.pages.move_to_end(index)
+        while len(self.pages) > self.MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and len(self.page_starts) - 1 not in self.requests
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.canFetchMore():
+            return
+        self.request_page(len(self.page_starts) - 1, self.page_appended)
+
+    def page_appended(self, index, books, last):
+        if len(books) < self.PAGE_SIZE:
+            self.exhausted = True
+        else:
+            self.page_starts.append(last)
+        if books:
+            self.beginInsertRows(QModelIndex(), self.row_count, self.row_count + len(books) - 1)
+            self.row_count += len(books)
+            self.endInsertRows()
+
+    def page_reloaded(self, index, books, last):
+        first_row = index * self.PAGE_SIZE
+        self.dataChanged.emit(self.index(first_row, 0), self.index(first_row + self.PAGE_SIZE - 1, len(HEADERS) - 1))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        page_index = index.row() // self.PAGE_SIZE
+        page = self.pages.get(page_index)
+        if page is None:
+            # Evicted earlier; read it again and fill the rows in when it arrives
+            self.request_page(page_index, self.page_reloaded)
+            return None
+        self.pages.move_to_end(page_index)
+        offset = index.row() % self.PAGE_SIZE
+        if offset >= len(page):
+            # The book was deleted since the page was first loaded
+            return None
+        return str(page[offset][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_key = self.SORT_KEYS[column]
+        self.descending = order == Qt.DescendingOrder
+        self.refresh()
+
+
+class SearchResultModel(QAbstractTableModel):
+    """Shows a short list of book rows already read from the database, such as search results."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.books = []
+
+    def set_books(self, books):
+        self.beginResetModel()
+        self.books = list(books)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.books)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return str(self.books[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.beginResetModel()
+        self.books.sort(key=lambda book: book[column], reverse=order == Qt.DescendingOrder)
+        self.endResetModel()
+
+
+class BookListModel(QAbstractTableModel):
+    """Shows a memory_catalog.Catalog of Book objects without copying it.
+
+    Rows are revealed to the view in batches; filtering (through the
+    catalog's title index) and sorting only build a list of positions into
+    the catalog.
+    """
+
+    BATCH_SIZE = 200
+    SORT_KEYS = [None, "title", "author", "price", "stock"]
+
+    def __init__(self, books, parent=None):
+        super().__init__(parent)
+        self.books = books
+        self.sort_key = None
+        self.descending = False
+        self.search = ""
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the visible rows, e.g. after the book list changed."""
+        self.beginResetModel()
+        if self.search or self.sort_key:
+            if self.search:
+                positions = [self.books.index(book) for book in self.books.find(title=self.search)]
+            else:
+                positions = list(range(len(self.books)))
+            if self.sort_key:
+                positions.sort(key=lambda i: getattr(self.books[i], self.sort_key), reverse=self.descending)
+            elif self.descending:
+                positions.reverse()
+            self.positions = positions
+        else:
+            self.positions = range(len(self.books) - 1, -1, -1) if self.descending else range(len(self.books))
+        self.loaded = 0
+        self.endResetModel()
+
+    def set_filter(self, text):
+        self.search = text or ""
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.positions)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.BATCH_SIZE, len(self.positions) - self.loaded)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        position = self.positions[index.row()]
+        book = self.books[position]
+        return str((position + 1, book.title, book.author, book.price, book.stock)[index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_key = self.SORT_KEYS[column]
+        self.descending = order == Qt.DescendingOrder
+        self.refresh()
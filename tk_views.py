@@ -0,0 +1,42 @@
+"""Book table for the tkinter front ends.
+
+BookTable keeps a ttk.Treeview in step with the rows the app wants to show
+by comparing them with what is already on screen: a row whose values changed
+is updated in place, and only rows that appeared or went away are inserted
+or deleted. After a sale only the sold book's cells change, and a page of
+thousands of rows costs a dictionary lookup per row rather than rebuilding
+every item.
+"""
+
+
+class BookTable:
+    def __init__(self, table):
+        self.table = table
+        # Treeview item of each book shown, and the values it currently displays
+        self.items = {}
+        self.values = {}
+        self.order = []
+
+    def show(self, rows):
+        """Show rows, a list of (book_id, values) in display order."""
+        wanted = [book_id for book_id, _ in rows]
+        keep = set(wanted)
+        gone = [book_id for book_id in self.order if book_id not in keep]
+        if gone:
+            self.table.delete(*[self.items.pop(book_id) for book_id in gone])
+            for book_id in gone:
+                del self.values[book_id]
+        # Items only need moving when the books kept on screen changed order (e.g. a new sort)
+        kept = [book_id for book_id in self.order if book_id in keep]
+        reorder = kept != [book_id for book_id in wanted if book_id in self.items]
+        for position, (book_id, values) in enumerate(rows):
+            item = self.items.get(book_id)
+            if item is None:
+                self.items[book_id] = self.table.insert("", position, values=values)
+            else:
+                if self.values[book_id] != values:
+                    self.table.item(item, values=values)
+                if reorder:
+                    self.table.move(item, "", position)
+            self.values[book_id] = values
+        self.order = wanted
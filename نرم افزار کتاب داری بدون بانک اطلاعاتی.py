@@ -1,50 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
-
-class Book:
-    def __init__(self, title, author, price, stock):
-        self.title = title
-        self.author = author
-        self.price = price
-        self.stock = stock
-        self.sold = 0
-        self.discount = 0
-
-    def add_stock(self, quantity):
-        self.stock += quantity
-
-    def sell_book(self, quantity):
-        if self.stock >= quantity:
-            self.stock -= quantity
-            self.sold += quantity
-        else:
-            raise ValueError("موجودی کافی نیست.")
-
-    def apply_discount(self, discount_percentage):
-        self.discount = discount_percentage
-
-    def get_discounted_price(self):
-        return self.price * (1 - self.discount / 100)
-
-    def __str__(self):
-        return f"عنوان: {self.title}, نویسنده: {self.author}, قیمت: {self.price}, تخفیف: {self.discount}%, قیمت نهایی: {self.get_discounted_price()}, موجودی: {self.stock}, فروخته شده: {self.sold}"
-
-
-class SalesTracker:
-    def __init__(self):
-        self.sales = []
-
-    def record_sale(self, book, quantity):
-        if book.stock >= quantity:
-            book.sell_book(quantity)
-            self.sales.append((book.title, quantity, book.get_discounted_price() * quantity))
-        else:
-            raise ValueError("موجودی کافی نیست.")
-
-    def total_sales(self):
-        total_books = sum(sale[1] for sale in self.sales)
-        total_income = sum(sale[2] for sale in self.sales)
-        return total_books, total_income
+from datetime import date, timedelta
+from memory_catalog import Book
+from memory_store import MemoryStore
+from tk_views import BookTable
 
 
 class BookstoreGUI:
@@ -53,8 +12,10 @@ class BookstoreGUI:
         self.root.title("مدیریت کتاب‌فروشی")
         self.root.geometry("800x600")
 
-        self.books = []
-        self.tracker = SalesTracker()
+        # Books and sales are kept on disk as a snapshot plus a journal of changes
+        self.store = MemoryStore()
+        self.books = self.store.catalog
+        self.tracker = self.store.tracker
         self.items_per_page = 5
         self.current_page = 0
 
@@ -66,6 +27,7 @@ class BookstoreGUI:
         self.table.heading("Stock", text="تعداد موجود")
         self.table.heading("Discounted Price", text="قیمت با تخفیف")
         self.table.grid(row=0, column=0, columnspan=4, padx=10, pady=10, sticky="nsew")
+        self.book_table = BookTable(self.table)
 
         # Form for adding a new book
         self.title_entry = ttk.Entry(root)
@@ -106,11 +68,10 @@ class BookstoreGUI:
 
     def load_books(self):
         """Load books for the current page."""
-        self.table.delete(*self.table.get_children())
         start = self.current_page * self.items_per_page
         end = start + self.items_per_page
-        for book in self.books[start:end]:
-            self.table.insert("", "end", values=(book.title, book.author, book.price, book.stock, book.get_discounted_price()))          
+        self.book_table.show([(book.book_id, (book.title, book.author, book.price, book.stock, book.get_discounted_price()))
+                              for book in self.books[start:end]])
 
     def add_book(self):
         title = self.title_entry.get()
@@ -120,7 +81,7 @@ class BookstoreGUI:
             stock = int(self.stock_entry.get())
             if title and author:
                 book = Book(title, author, price, stock)
-                self.books.append(book)
+                self.store.add_book(book)
                 self.title_entry.delete(0, tk.END)
                 self.author_entry.delete(0, tk.END)
                 self.price_entry.delete(0, tk.END)
@@ -139,7 +100,7 @@ class BookstoreGUI:
                 quantity = simpledialog.askinteger("فروش کتاب", f"تعداد را برای فروش {book[0].title} وارد کنید:")
                 if quantity:
                     try:
-                        self.tracker.record_sale(book[0], quantity)
+                        self.store.record_sale(book[0], quantity)
                         self.load_books()
                     except ValueError as e:
                         messagebox.showerror("خطا", str(e))
@@ -153,7 +114,7 @@ class BookstoreGUI:
             if book:
                 try:
                     discount = float(simpledialog.askstring("تخفیف", "درصد تخفیف را وارد کنید:"))
-                    book[0].apply_discount(discount)
+                    self.store.apply_discount(book[0], discount)
                     self.load_books()
                 except ValueError:
                     messagebox.showwarning("ورودی نامعتبر", "درصد تخفیف معتبر وارد کنید.")
@@ -161,15 +122,20 @@ class BookstoreGUI:
     def show_sales_report(self):
         total_books, total_income = self.tracker.total_sales()
         report = f"کل کتاب‌های فروخته شده: {total_books}\nکل درآمد حاصله: {total_income}"
+        today = date.today()
+        today_books, today_income = self.tracker.by_day.get(today.isoformat(), (0, 0))
+        report += f"\nفروش امروز: {today_books} کتاب، {today_income}"
+        period_books, period_income = self.tracker.period_totals(today - timedelta(days=29), today)
+        report += f"\nفروش ۳۰ روز گذشته: {period_books} کتاب، {period_income}"
+        for title, books, income in self.tracker.top_titles():
+            report += f"\n{title}: {books} کتاب، {income}"
+        for author, books, income in self.tracker.top_authors():
+            report += f"\n{author}: {books} کتاب، {income}"
         messagebox.showinfo("گزارش فروش", report)
 
     def search_books(self, title=None, author=None):
         """Search for books based on title or author."""
-        results = []
-        for book in self.books:
-            if (title and title.lower() in book.title.lower()) or (author and author.lower() in book.author.lower()):
-                results.append(book)
-        return results
+        return self.books.find(title=title, author=author)
 
     def search_books_button(self):
         """Prompt the user for a title to search and display the results."""
@@ -196,10 +162,7 @@ class BookstoreGUI:
                     new_stock = int(simpledialog.askstring("ویرایش کتاب", f"موجودی جدید را برای {book[0].title} وارد کنید:", initialvalue=str(book[0].stock)))
                     
                     # Update the book details
-                    book[0].title = new_title
-                    book[0].author = new_author
-                    book[0].price = new_price
-                    book[0].stock = new_stock
+                    self.store.edit_book(book[0], new_title, new_author, new_price, new_stock)
 
                     # Refresh the table
                     self.load_books()
@@ -212,7 +175,7 @@ class BookstoreGUI:
             title = self.table.item(selected_item, "values")[0]
             book = self.search_books(title=title)
             if book:
-                self.books.remove(book[0])
+                self.store.delete_book(book[0])
                 self.load_books()
 
     def next_page(self):
@@ -231,3 +194,4 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = BookstoreGUI(root)
     root.mainloop()
+    app.store.close()